@@ -1,6 +1,69 @@
-import extract, transform
-from parser import get_parser_args, parse_inputs, load_config
+import metrics
+from parser import get_parser_args, parse_inputs, parse_options, load_config
 import argparse
+import logging
+
+
+def main(symbols, requests, queries, save_to, timestamp, options: dict, job: str = None):
+    """
+    Extract, transform and load symbols, then write the run metrics to
+    data/metrics/<job>_<timestamp>.json and data/metrics/<job>.prom.
+    job defaults to save_to. With options['profile'], the run is profiled with cProfile.
+    """
+
+    job = job or save_to
+    metrics.reset()
+    try:
+        with metrics.profiling(options['profile'], job):
+            _run(symbols, requests, queries, save_to, timestamp, options)
+    finally:
+        metrics.write_report(job)
+
+
+def _run(symbols, requests, queries, save_to, timestamp, options: dict):
+    """
+    Extract, transform and load symbols.
+
+    With options['batch_size'], symbols are streamed through fetch, parse and load
+    batch_size at a time. Each batch is committed before the next is fetched, so
+    memory stays flat and a failure only loses the batch in progress. The first
+    batch uses the chosen load mode; 'replace' becomes 'append' afterwards so
+    later batches add to the fresh tables.
+
+    With options['pipeline'], fetching and transforming overlap instead (see pipeline.py).
+    """
+
+    # Imported here so --help and argument errors don't wait on requests and the data stack
+    import extract, transform, pipeline
+
+    if options['pipeline']:
+        pipeline.main(symbols, requests, queries, save_to, timestamp, options)
+        return
+
+    batch_size = options['batch_size'] or len(symbols)
+    batches = [symbols[start:start + batch_size] for start in range(0, len(symbols), batch_size)]
+    load_mode = options['load_mode'] or ('append' if timestamp else 'replace')
+
+    for number, batch in enumerate(batches, start=1):
+        if len(batches) > 1:
+            logging.info(f"Batch {number}/{len(batches)}: {len(batch)} symbols ({batch[0]} to {batch[-1]})")
+
+        data = extract.main(
+            symbols=batch, requests=requests, queries=queries, save_to=save_to, timestamp=timestamp,
+            concurrency=options['concurrency'], tier=options['tier'], rate_limit=options['rate_limit'], max_retries=options['max_retries'],
+            use_cache=not options['no_cache'], refresh=options['refresh'], incremental=options['incremental'], storage=options['storage'],
+            symbols_per_request=options['symbols_per_request']
+        )
+        transform.main(
+            symbols=batch, documents=requests, load_from=save_to, timestamp=timestamp, storage=options['storage'], output_format=options['output_format'],
+            load_mode=load_mode, indicator_engine=options['engine'], batch=number if len(batches) > 1 else None,
+            # Workers read their shards from the raw files instead of receiving payloads from this process
+            data=data if options['workers'] == 1 else None, workers=options['workers']
+        )
+
+        if load_mode == 'replace':
+            load_mode = 'append'
+
 
 if __name__ == "__main__":
 
@@ -10,10 +73,12 @@ if __name__ == "__main__":
     # If arguments were passed through a yaml file
     if args.config:
         config = load_config(args.config)
+        options = parse_options(args, config)
         symbols, requests, queries, save_to, timestamp = parse_inputs(**config)
 
     # If arguments were passed through CLI
     if args.manual:
+        options = parse_options(args)
         symbols, requests, queries, save_to, timestamp = parse_inputs(args.symbols, args.requests, args.queries, args.save_to, args.timestamp)
     
     
@@ -23,7 +88,12 @@ if __name__ == "__main__":
 
     Pass CLI arguments manually:
     python ETL.py --manual --symbols AAPL MSFT GOOGL --requests all --queries "from=2022-05-01" "to=2023-05-01" "period=quarter" "limit=4" --save_to timestamp
+
+    Stream a large symbol list 500 symbols at a time:
+    python ETL.py --config <yaml_abs_path> --batch_size 500
+
+    Profile a run (stats are saved to data/metrics/<save_to>_<timestamp>.prof):
+    python ETL.py --config <yaml_abs_path> --profile
     '''
     
-    data = extract.main(symbols=symbols, requests=requests, queries=queries, save_to=save_to, timestamp=timestamp)
-    transform.main(symbols=symbols, documents=requests, load_from=save_to, timestamp=timestamp)
\ No newline at end of file
+    main(symbols, requests, queries, save_to, timestamp, options)
\ No newline at end of file
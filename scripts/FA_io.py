@@ -1,7 +1,11 @@
 import os
+import gzip
 import json
 import logging
-from config import PROJECT_ROOT, DATA_DIR, DEFAULT_ENDPOINTS_PATH
+import tempfile
+from config import PROJECT_ROOT, DATA_DIR, DEFAULT_ENDPOINTS_PATH, STORAGE_OPTIONS, OUTPUT_FORMATS
+from metrics import staged, stage_counts
+from raw_manifest import LATEST, describe, record_snapshots, latest_snapshots, find_snapshots, latest_dates, referenced_paths
 
 
 # logging configuration
@@ -11,14 +15,146 @@ logging.basicConfig(
 )
 
 
-def save_raw_data(data: dict, symbols: list, requests: list, save_to: str, timestamp: bool = False) -> None:
+def _raw_parquet_path(output_dir: str, symbol: str, document: str, timestamp=False) -> str:
+    """
+    Parquet raw files are partitioned by document and symbol:
+    data/raw/<folder>/parquet/document=<document>/symbol=<symbol>/<document>[_<timestamp>].parquet
+    """
+
+    filename = f"{document}_{timestamp}.parquet" if timestamp else f"{document}.parquet"
+    return os.path.join(output_dir, "parquet", f"document={document}", f"symbol={symbol}", filename)
+
+
+def _raw_object_path(output_dir: str, digest: str) -> str:
+    """
+    gzip raw files are stored once per distinct content, named by its SHA-256 hash:
+    data/raw/<folder>/objects/<hash[:2]>/<hash>.json.gz
+    Snapshots reference them through the raw manifest.
+    """
+
+    return os.path.join(output_dir, "objects", digest[:2], f"{digest}.json.gz")
+
+
+def _raw_ref_path(output_dir: str, symbol: str, document: str, timestamp=False) -> str:
+    """
+    Each gzip snapshot also gets a small ref file naming its object, so the raw
+    manifest can be rebuilt from disk:
+    data/raw/<folder>/refs/<symbol>/<symbol>_<document>[_<timestamp>].ref.json
+    """
+
+    filename = f"{symbol}_{document}_{timestamp}.ref.json" if timestamp else f"{symbol}_{document}.ref.json"
+    return os.path.join(output_dir, "refs", symbol, filename)
+
+
+def _replace_file(filename: str, content: bytes, compress: bool = False) -> None:
+    """
+    Write content through a temporary file in the same folder, so readers and
+    concurrent writers never see a partial file. With compress, gzip with mtime=0
+    keeps the compressed bytes the same for the same content.
+    """
+
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(filename), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            if compress:
+                with gzip.GzipFile(filename='', mode='wb', fileobj=f, mtime=0) as gz:
+                    gz.write(content)
+            else:
+                f.write(content)
+        os.replace(tmp_path, filename)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _write_object(filename: str, content: bytes) -> int:
+    """
+    Write gzip-compressed content unless an object with the same hash exists.
+    Returns the bytes written, 0 if the object was already stored.
+    """
+
+    if os.path.exists(filename):
+        return 0
+    _replace_file(filename, content, compress=True)
+    return os.path.getsize(filename)
+
+
+def _read_ref(filename: str):
+    """
+    Snapshot recorded in a gzip ref file, or None if there is none.
+    """
+
+    if not os.path.exists(filename):
+        return None
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+
+def _prune_replaced(folder: str, output_dir: str, replaced: list) -> None:
+    """
+    Delete gzip objects whose snapshot was overwritten, e.g. by a run saved without
+    a timestamp, unless another ref file of the same symbol and document or a
+    manifest row still references them. replaced: [(symbol, document, path)].
+    """
+
+    if not replaced:
+        return
+    try:
+        referenced = referenced_paths(folder, [path for _, _, path in replaced])
+    except Exception as e:
+        logging.warning(f"Could not check the raw manifest, keeping replaced objects: {e}")
+        return
+
+    for symbol, document, path in replaced:
+        refs_dir = os.path.dirname(_raw_ref_path(output_dir, symbol, document))
+        for filename in os.listdir(refs_dir):
+            if filename.startswith(f"{symbol}_{document}") and filename.endswith('.ref.json'):
+                referenced.add(_read_ref(os.path.join(refs_dir, filename))['path'])
+        if path not in referenced and os.path.exists(os.path.join(output_dir, path)):
+            os.remove(os.path.join(output_dir, path))
+            logging.info(f"Deleted replaced object {path}")
+
+
+def _raw_frame(symbol: str, document: str, symbol_data) -> 'pd.DataFrame':
+    """
+    Convert one API payload to rows laid out like parse_to_dataframes output.
+    """
+
+    # pandas is imported where it is needed so JSON-only extract runs start quickly
+    import pandas as pd
+
+    if document == 'stock':
+        df = pd.DataFrame.from_records(symbol_data.get('historical', []))
+        if not df.empty:
+            df.insert(1, 'symbol', symbol)
+        return df
+    return pd.DataFrame.from_records(symbol_data)
+
+
+@staged('save_raw', labels=['storage'])
+def save_raw_data(data: dict, symbols: list, requests: list, save_to: str, timestamp: bool = False, storage: str = 'json') -> None:
     """
     Save fetched data to data/raw as JSON file.
+
+    storage: 'json' writes one JSON file per symbol and request. 'parquet' writes
+             one Parquet file per request and symbol under data/raw/<save_to>/parquet.
+             'gzip' writes compact, compressed JSON under data/raw/<save_to>/objects,
+             once per distinct payload. Unchanged payloads in later timestamped runs
+             only add a ref file and manifest row. Objects of snapshots overwritten
+             by this call, e.g. in runs without a timestamp, are deleted once
+             nothing references them.
+
+    Every file is recorded in the raw manifest (see raw_manifest.py) with its
+    period coverage, size and content hash.
     """
 
     # Create output directory
     output_dir = os.path.join(DATA_DIR, "raw", save_to)
     os.makedirs(output_dir, exist_ok=True)        
+    snapshots = []
+    replaced = []
+    counts = stage_counts()
 
 
     # For each symbol
@@ -26,46 +162,135 @@ def save_raw_data(data: dict, symbols: list, requests: list, save_to: str, times
 
         # Create symbol directory inside the chosen save folder.
         symbol_dir = os.path.join(output_dir, symbol)
-        os.makedirs(symbol_dir, exist_ok=True)
+        if storage == 'json':
+            os.makedirs(symbol_dir, exist_ok=True)
 
         # For each requested data field
         for request in requests:
 
             # Get requested data for symbol and check it isn't empty
             symbol_data = data.get(request, {}).get(symbol)
-            if symbol_data:
-                
+            if symbol_data and storage == 'parquet':
+                filename = _raw_parquet_path(output_dir, symbol, request, timestamp)
+                os.makedirs(os.path.dirname(filename), exist_ok=True)
+                _raw_frame(symbol, request, symbol_data).to_parquet(filename, index=False)
+                with open(filename, 'rb') as f:
+                    content = f.read()
+                logging.info(f"Saved {symbol} {request} to {filename}")
+
+            elif symbol_data and storage == 'gzip':
+                content = json.dumps(symbol_data, separators=(',', ':')).encode()
+                snapshot = describe(symbol, request, symbol_data, content)
+                filename = _raw_object_path(output_dir, snapshot['sha256'])
+                written = _write_object(filename, content)
+                counts['rows_out'] += 1
+                counts['bytes_out'] += written
+                snapshot.update(bytes=os.path.getsize(filename), path=os.path.relpath(filename, output_dir))
+                ref = _raw_ref_path(output_dir, symbol, request, timestamp)
+                previous = _read_ref(ref)
+                _replace_file(ref, json.dumps(snapshot).encode())
+                if previous and previous['path'] != snapshot['path']:
+                    replaced.append((symbol, request, previous['path']))
+                snapshots.append(snapshot)
+                logging.info(f"Saved {symbol} {request} to {filename}" if written else f"{symbol} {request} unchanged, stored in {filename}")
+                continue
+
+            elif symbol_data:
+
                 # Save data. Use timestamp if specified.
                 if timestamp:
                     filename = os.path.join(symbol_dir, f"{symbol}_{request}_{timestamp}.json")
                 else:
                     filename = os.path.join(symbol_dir, f"{symbol}_{request}.json")
-                with open(filename, 'w') as f:
-                    json.dump(symbol_data, f, indent=2)
+                content = json.dumps(symbol_data, indent=2).encode()
+                with open(filename, 'wb') as f:
+                    f.write(content)
                 logging.info(f"Saved {symbol} {request} to {filename}")
 
+            else:
+                continue
+            counts['rows_out'] += 1
+            counts['bytes_out'] += len(content)
+            snapshots.append({**describe(symbol, request, symbol_data, content), 'path': os.path.relpath(filename, output_dir)})
+
+    # The files, and the ref files of gzip objects, are already saved, so a manifest
+    # failure only costs the fast lookups until the manifest is rebuilt
+    try:
+        record_snapshots(save_to, snapshots, timestamp, storage)
+    except Exception as e:
+        logging.error(f"Could not record raw snapshots in the manifest: {e}. "
+                      f"Run raw_manifest.py --folder {save_to} --rebuild to restore them.")
+        return
+
+    # Objects of overwritten gzip snapshots would otherwise stay on disk unreferenced
+    _prune_replaced(save_to, output_dir, replaced)
+
+
+def _manifest_paths(folder: str, symbols: list, document: str, storage: str, timestamp=LATEST) -> dict:
+    """
+    Paths of the snapshot of document saved with timestamp, or the latest one, per symbol, from the raw manifest.
+    """
+
+    raw_data_path = os.path.join(DATA_DIR, 'raw', folder)
+    if timestamp == LATEST:
+        found = latest_snapshots(folder, symbols, [document], storage)
+    else:
+        found = find_snapshots(folder, symbols, [document], timestamp, storage)
+    paths = {symbol: os.path.join(raw_data_path, row['path']) for symbol, row in found.get(document, {}).items()}
+    # Rows whose file was deleted fall back to the default paths
+    return {symbol: path for symbol, path in paths.items() if os.path.exists(path)}
+
+
+@staged('load_raw', labels=['storage'])
+def load_raw_data(symbols: list, documents: list, folder: str, timestamp=False, storage: str = 'json'):
+    """
+    Load raw JSON data as {document: [payload per symbol]}.
+
+    timestamp: snapshot to load, False for files saved without one, or 'latest'
+               for each symbol's most recent snapshot in the raw manifest.
+    storage:   'json' or 'gzip'. gzip snapshots are found through the manifest,
+               or their ref files if it has no row for them, and decompressed
+               while they are parsed.
+    """
 
-def load_raw_data(symbols: list, documents: list, folder: str, timestamp=False):
     raw_data_path = os.path.join(DATA_DIR, 'raw', folder)
     financial_data = {}
+    counts = stage_counts()
 
     # Create empty list for each document type (eg. stock, cashflow, etc)
     for document in documents:
         financial_data[document]= []
+        if storage == 'gzip':
+            paths = _manifest_paths(folder, symbols, document, storage, timestamp)
+        else:
+            paths = _manifest_paths(folder, symbols, document, storage) if timestamp == LATEST else {}
 
         # Append document data for each symbol if said data exists
         for symbol in symbols:
-                if timestamp:
+                if storage == 'gzip':
+                    input_path = paths.get(symbol)
+                    if input_path is None:
+                        ref = _read_ref(_raw_ref_path(raw_data_path, symbol, document, False if timestamp == LATEST else timestamp))
+                        if ref is None:
+                            logging.warning(f"No {document} snapshot for {symbol} in the raw manifest or refs")
+                            continue
+                        input_path = os.path.join(raw_data_path, ref['path'])
+                elif timestamp == LATEST:
+                    input_path = paths.get(symbol, os.path.join(raw_data_path, symbol, f"{symbol}_{document}.json"))
+                elif timestamp:
                     input_path = os.path.join(raw_data_path, symbol, f"{symbol}_{document}_{timestamp}.json")
                 else:
                     input_path = os.path.join(raw_data_path, symbol, f"{symbol}_{document}.json")
                 if not os.path.exists(input_path):
                     logging.warning(f"File not found: {input_path}")
                     continue
-                with open(input_path, 'r') as f:
+                with (gzip.open if storage == 'gzip' else open)(input_path, 'rb') as f:
                     data = json.load(f)
+                counts['bytes_in'] += os.path.getsize(input_path)
+                counts['rows_in'] += 1
                 if data:
                     financial_data[document].append(data)
+                    counts['rows_out'] += 1
                 else:
                     logging.warning(f"Could not find {document} for {symbol}")
         
@@ -76,6 +301,148 @@ def load_raw_data(symbols: list, documents: list, folder: str, timestamp=False):
 
     return financial_data
 
+@staged('load_raw', storage='parquet')
+def load_raw_frames(symbols: list, documents: list, folder: str, timestamp=False) -> dict:
+    """
+    Load raw Parquet data straight into one DataFrame per document type,
+    laid out like parse_to_dataframes output. timestamp works as in load_raw_data.
+    """
+
+    import pandas as pd
+
+    raw_data_path = os.path.join(DATA_DIR, 'raw', folder)
+    frames = {}
+    counts = stage_counts()
+
+    for document in documents:
+        parts = []
+        latest = _manifest_paths(folder, symbols, document, 'parquet') if timestamp == LATEST else {}
+        for symbol in symbols:
+            if timestamp == LATEST:
+                input_path = latest.get(symbol, _raw_parquet_path(raw_data_path, symbol, document))
+            else:
+                input_path = _raw_parquet_path(raw_data_path, symbol, document, timestamp)
+            if not os.path.exists(input_path):
+                logging.warning(f"File not found: {input_path}")
+                continue
+            parts.append(pd.read_parquet(input_path))
+            counts['rows_in'] += 1
+            counts['bytes_in'] += os.path.getsize(input_path)
+
+        # If no data exists for this document type, skip it
+        parts = [part for part in parts if not part.empty]
+        if not parts:
+            logging.warning(f"No {document} info found for any symbols. Skipping {document}s")
+            continue
+
+        # Combine symbols once and convert dates once
+        df = pd.concat(parts, ignore_index=True)
+        if 'date' in df.columns:
+            df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d')
+        frames[document] = df
+        counts['rows_out'] += len(df)
+
+    return frames
+
+
+def latest_raw_stock_dates(symbols: list, folder: str) -> dict:
+    """
+    Find the latest stock date already saved in data/raw/<folder> for each symbol.
+    Returns {symbol: "yyyy-mm-dd"} for symbols with saved prices.
+
+    Dates come from the raw manifest in one query, for snapshots whose files still
+    exist. Files are only scanned for the other symbols, e.g. data saved before the
+    manifest existed. A deleted raw folder therefore resets the high-water marks.
+    """
+
+    raw_data_path = os.path.join(DATA_DIR, 'raw', folder)
+    latest = latest_dates(folder, 'stock', symbols)
+
+    for symbol in symbols:
+        if symbol in latest:
+            continue
+        # Check Parquet stock snapshots for this symbol
+        parquet_dir = os.path.dirname(_raw_parquet_path(raw_data_path, symbol, 'stock'))
+        if os.path.isdir(parquet_dir):
+            import pandas as pd
+            for filename in os.listdir(parquet_dir):
+                dates = pd.read_parquet(os.path.join(parquet_dir, filename), columns=['date'])['date']
+                if not dates.empty and dates.max() > latest.get(symbol, ""):
+                    latest[symbol] = dates.max()
+
+        # Check gzip stock snapshots through their ref files
+        refs_dir = os.path.dirname(_raw_ref_path(raw_data_path, symbol, 'stock'))
+        if os.path.isdir(refs_dir):
+            for filename in os.listdir(refs_dir):
+                if not filename.startswith(f"{symbol}_stock") or not filename.endswith(".ref.json"):
+                    continue
+                ref = _read_ref(os.path.join(refs_dir, filename))
+                if ref.get('last_date') and os.path.exists(os.path.join(raw_data_path, ref['path'])) and ref['last_date'] > latest.get(symbol, ""):
+                    latest[symbol] = ref['last_date']
+
+        symbol_dir = os.path.join(raw_data_path, symbol)
+        if not os.path.isdir(symbol_dir):
+            continue
+
+        # Check every saved stock snapshot for this symbol
+        for filename in os.listdir(symbol_dir):
+            if not filename.startswith(f"{symbol}_stock") or not filename.endswith(".json"):
+                continue
+            with open(os.path.join(symbol_dir, filename), 'r') as f:
+                data = json.load(f)
+            dates = [bar['date'] for bar in data.get('historical', []) if 'date' in bar]
+            if dates and max(dates) > latest.get(symbol, ""):
+                latest[symbol] = max(dates)
+
+    return latest
+
+
+@staged('save_processed', labels=['name', 'output_format'])
+def save_processed_data(df: 'pd.DataFrame', folder: str, name: str, timestamp=False, output_format: str = 'csv', batch: int = None) -> str:
+    """
+    Save a processed DataFrame to data/processed/<folder>/<name>[_<timestamp>][_batch<N>].<ext>.
+
+    output_format: 'csv', 'parquet', or 'arrow'. Arrow IPC files are written
+                   uncompressed so downstream tools can memory-map them.
+                   'none' skips the file and returns None.
+    batch:         batch number when symbols are processed in batches. Each batch
+                   writes its own part file.
+    """
+
+    if output_format == 'none':
+        return None
+
+    import pandas as pd
+
+    output_dir = os.path.join(DATA_DIR, "processed", folder)
+    os.makedirs(output_dir, exist_ok=True)
+    filename = f"{name}_{timestamp}" if timestamp else name
+    if batch is not None:
+        filename = f"{filename}_batch{batch:04d}"
+    output_path = os.path.join(output_dir, filename + OUTPUT_FORMATS[output_format])
+
+    # Columnar formats need one type per column. Columns mixing numbers and
+    # text (e.g. finalLink rows in tidy statements) are stored as text, as in SQL.
+    if output_format != 'csv':
+        mixed = [col for col in df.columns if df[col].dtype == object
+                 and pd.api.types.infer_dtype(df[col], skipna=True) in ('mixed', 'mixed-integer')]
+        if mixed:
+            df = df.assign(**{col: df[col].where(df[col].isna(), df[col].astype(str)) for col in mixed})
+
+    if output_format == 'parquet':
+        df.to_parquet(output_path, index=False)
+    elif output_format == 'arrow':
+        df.reset_index(drop=True).to_feather(output_path, compression='uncompressed')
+    else:
+        df.to_csv(output_path, index=False)
+    counts = stage_counts()
+    counts['rows_in'] = len(df)
+    counts['bytes_out'] = os.path.getsize(output_path)
+
+    logging.info(f"Saved {name} to {output_path}")
+    return output_path
+
+
 def save_to_excel(save_to, dfs) -> None:
     """
     Save processed data to data/processed as JSON file.
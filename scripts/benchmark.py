@@ -0,0 +1,591 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import shutil
+import subprocess
+import tracemalloc
+from datetime import datetime
+from synthetic import synthetic_financial_data, synthetic_payloads, synthetic_symbols, DOCUMENTS, STATEMENTS
+from utils import parse_to_dataframes, wide_format, long_format
+from FA_io import save_raw_data
+from config import DATA_DIR, PROJECT_ROOT, STORAGE_OPTIONS
+
+
+# logging configuration
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+# Where benchmark results are saved
+RESULTS_DIR = os.path.join(DATA_DIR, "benchmarks")
+
+# Stages and the fields that identify a measurement within a stage
+STAGES = ['startup', 'fetch', 'parse', 'reshape', 'long_format', 'stock_indicators', 'transform', 'raw_storage', 'sql', 'sql_layout']
+RESULT_KEYS = ['stage', 'symbols', 'workers', 'step']
+
+# Entry points checked by the startup stage, and modules they must not import
+# until a code path needs them
+ENTRY_POINTS = ['ETL', 'extract', 'transform']
+HEAVY_MODULES = ['pandas', 'numpy', 'pyarrow', 'sqlalchemy', 'psycopg2', 'dotenv', 'yaml']
+
+# Default import time budget per entry point, in seconds
+IMPORT_BUDGET = 0.25
+
+# Dashboard-style queries timed by the sql_layout stage against plain and partitioned tables
+LAYOUT_QUERIES = {
+    'stocks_symbol_year': "SELECT date, close FROM {prefix}_stocks WHERE symbol = 'S00042' AND date >= '2020-01-01' AND date < '2021-01-01'",
+    'stocks_month_all_symbols': "SELECT symbol, AVG(close) FROM {prefix}_stocks WHERE date >= '2021-03-01' AND date < '2021-04-01' GROUP BY symbol",
+    'tidy_symbol_metric': "SELECT date, value FROM {prefix}_tidy WHERE symbol = 'S00042' AND metric = 'metric07' AND date >= '2018-01-01'",
+    'tidy_symbol_quarter': "SELECT metric, value FROM {prefix}_tidy WHERE symbol = 'S00042' AND date >= '2021-01-01' AND date < '2021-04-01'",
+}
+
+
+def time_call(function, *args, repeat: int = 3, **kwargs) -> float:
+    """
+    Best wall time in seconds over repeat calls.
+    """
+
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def time_import(module: str, repeat: int = 3) -> tuple:
+    """
+    Best time of repeat imports of module in fresh interpreters, and the heavy
+    modules it imports: (seconds, heavy_modules).
+    """
+
+    scripts_dir = os.path.dirname(os.path.abspath(__file__))
+    probe = (f"import sys, time, json\nstart = time.perf_counter()\nimport {module}\n"
+             f"print(json.dumps([time.perf_counter() - start, [m for m in {HEAVY_MODULES!r} if m in sys.modules]]))")
+    seconds, heavy = float('inf'), []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', probe], cwd=scripts_dir, capture_output=True, text=True, check=True).stdout
+        import_seconds, heavy = json.loads(output.strip().splitlines()[-1])
+        seconds = min(seconds, import_seconds)
+    return seconds, heavy
+
+
+def bench_startup(repeat: int = 3) -> list:
+    """
+    Time importing each entry point and running it with --help, in fresh
+    interpreters, and list the heavy modules each one imports.
+    """
+
+    scripts_dir = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for module in ENTRY_POINTS:
+        seconds, heavy = time_import(module, repeat)
+        help_seconds = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, f"{module}.py", '--help'], cwd=scripts_dir, capture_output=True, check=True)
+            help_seconds = min(help_seconds, time.perf_counter() - start)
+
+        results.append({'step': module, 'seconds': seconds, 'help_seconds': help_seconds, 'heavy_modules': heavy})
+        logging.info(f"import {module}: {seconds * 1000:.0f} ms, {module}.py --help: {help_seconds * 1000:.0f} ms"
+                     + (f", imports {heavy}" if heavy else ""))
+    return results
+
+
+def check_startup(results: list, budget: float = IMPORT_BUDGET) -> list:
+    """
+    Describe entry points that take longer than budget seconds to import or import heavy modules.
+    """
+
+    failures = []
+    for result in results:
+        if result['seconds'] > budget:
+            failures.append(f"import {result['step']} took {result['seconds']:.3f}s, over the {budget:.3f}s budget")
+        if result['heavy_modules']:
+            failures.append(f"import {result['step']} loads {result['heavy_modules']} before they are needed")
+    return failures
+
+
+def bench_fetch(symbol_counts: list, days: int = 252, periods: int = 4, latency: float = 0.02, error_rate: float = 0.0,
+                retry_after: float = 0.2, concurrency: int = 8, symbols_per_request: int = 1) -> list:
+    """
+    Time fetch_data for every document against the local mock API.
+    The rate limit is set high enough that latency, 429s and concurrency dominate.
+    Stock prices are requested symbols_per_request symbols at a time.
+    """
+
+    from fmp_client import fetch_data, batch_urls
+    from rate_limiter import reset_rate_limiters
+    from mock_api import start_mock_api, mock_urls
+
+    server = start_mock_api(latency=latency, error_rate=error_rate, retry_after=retry_after, days=days, periods=periods)
+    results = []
+    try:
+        for n_symbols in symbol_counts:
+            urls = mock_urls(server.base_url, synthetic_symbols(n_symbols), DOCUMENTS, query=f"limit={periods}&")
+            urls = batch_urls(urls, symbols_per_request)
+            requests, throttled = server.requests, server.throttled
+            reset_rate_limiters()
+
+            start = time.perf_counter()
+            data = fetch_data(urls, concurrency=concurrency, rate_limit=10 ** 7, use_cache=False)
+            seconds = time.perf_counter() - start
+
+            n_requests = sum(len(data[document]) for document in data)
+            failed = sum(payload is None for document in data for payload in data[document].values())
+            results.append({
+                'symbols': n_symbols,
+                'seconds': seconds,
+                'requests': n_requests,
+                'requests_per_second': n_requests / seconds,
+                'http_calls': server.requests - requests,
+                'throttled': server.throttled - throttled,
+                'failed': failed,
+            })
+            logging.info(f"fetch_data: {n_requests} requests in {seconds:.3f}s ({n_requests / seconds:.0f} req/s) with {server.requests - requests} HTTP calls, "
+                         f"{server.throttled - throttled} throttled, {failed} failed")
+    finally:
+        server.shutdown()
+        server.server_close()
+    return results
+
+
+def bench_parse(symbol_counts: list, days: int = 252, periods: int = 4, repeat: int = 3) -> list:
+    """
+    Time parse_to_dataframes on synthetic data at several symbol counts.
+    Time per symbol should stay flat if parsing scales linearly.
+    """
+
+    results = []
+    for n_symbols in symbol_counts:
+        data = synthetic_financial_data(n_symbols, days=days, periods=periods)
+        seconds = time_call(parse_to_dataframes, data, repeat=repeat)
+        results.append({
+            'symbols': n_symbols,
+            'seconds': seconds,
+            'ms_per_symbol': 1000 * seconds / n_symbols,
+        })
+        logging.info(f"parse_to_dataframes: {n_symbols} symbols in {seconds:.3f}s ({1000 * seconds / n_symbols:.3f} ms/symbol)")
+
+    # Ratio of per-symbol cost at the largest and smallest scale. Close to 1 means linear.
+    ratio = results[-1]['ms_per_symbol'] / results[0]['ms_per_symbol']
+    logging.info(f"Per-symbol cost at {results[-1]['symbols']} vs {results[0]['symbols']} symbols: {ratio:.2f}x")
+    return results
+
+
+def bench_reshape(symbol_counts: list, periods: int = 4, repeat: int = 3) -> list:
+    """
+    Time wide_format and long_format on parsed synthetic statements.
+    """
+
+    results = []
+    for n_symbols in symbol_counts:
+        dfs = parse_to_dataframes(synthetic_financial_data(n_symbols, documents=STATEMENTS, periods=periods))
+        for step, function in [('wide_format', wide_format), ('long_format', long_format)]:
+            seconds = time_call(function, dfs, repeat=repeat)
+            results.append({'symbols': n_symbols, 'step': step, 'seconds': seconds})
+            logging.info(f"{step}: {n_symbols} symbols in {seconds:.3f}s")
+    return results
+
+
+def bench_long_format(symbol_counts: list, periods: int = 4) -> list:
+    """
+    Measure peak traced memory while melting synthetic statements to long format,
+    and the size of the resulting tidy frame. Wide inputs are built beforehand and
+    not counted in the peak.
+    """
+
+    results = []
+    for n_symbols in symbol_counts:
+        dfs = parse_to_dataframes(synthetic_financial_data(n_symbols, documents=STATEMENTS, periods=periods))
+        wide_mb = sum(df.memory_usage(deep=True).sum() for df in dfs.values()) / 1024 ** 2
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        tidy = long_format(dfs)
+        seconds = time.perf_counter() - start
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        tracemalloc.stop()
+
+        tidy_mb = tidy.memory_usage(deep=True).sum() / 1024 ** 2
+        results.append({
+            'symbols': n_symbols,
+            'rows': len(tidy),
+            'seconds': seconds,
+            'wide_mb': wide_mb,
+            'tidy_mb': tidy_mb,
+            'peak_mb': peak_mb,
+        })
+        logging.info(f"long_format: {n_symbols} symbols, {len(tidy)} rows in {seconds:.3f}s. "
+                     f"Statements {wide_mb:.1f} MB, tidy {tidy_mb:.1f} MB, peak {peak_mb:.1f} MB")
+    return results
+
+
+def bench_stock_indicators(symbol_counts: list, days: int = 252, new_bars: int = 1, repeat: int = 3) -> list:
+    """
+    Time rolling stock indicators over the full history against an incremental
+    run that extends the saved window tails with new_bars new bars per symbol,
+    and check both give the same values for the new bars.
+    """
+
+    import numpy as np
+    from stock_indicators import compute_stock_indicators
+
+    results = []
+    for n_symbols in symbol_counts:
+        stocks = parse_to_dataframes(synthetic_financial_data(n_symbols, documents=['stock'], days=days))['stock']
+        cutoff = stocks['date'].sort_values().unique()[-new_bars]
+        _, state = compute_stock_indicators(stocks[stocks['date'] < cutoff])
+        new = stocks[stocks['date'] >= cutoff]
+
+        full = time_call(compute_stock_indicators, stocks, repeat=repeat)
+        incremental = time_call(compute_stock_indicators, new, state, repeat=repeat)
+        results.append({'symbols': n_symbols, 'step': 'full', 'rows': len(stocks), 'seconds': full})
+        results.append({'symbols': n_symbols, 'step': 'incremental', 'rows': len(new), 'seconds': incremental})
+
+        key = ['symbol', 'date', 'metric']
+        expected = compute_stock_indicators(stocks)[0]
+        expected = expected[expected['date'] >= cutoff].sort_values(key).reset_index(drop=True)
+        extended = compute_stock_indicators(new, state)[0].sort_values(key).reset_index(drop=True)
+        if not (expected[key].equals(extended[key]) and np.allclose(expected['value'], extended['value'], rtol=1e-9)):
+            logging.error(f"stock_indicators: incremental values differ from a full recompute for {n_symbols} symbols")
+        logging.info(f"stock_indicators: {n_symbols} symbols, {days} days in {full:.3f}s, {new_bars} new bar(s) in {incremental:.3f}s")
+    return results
+
+
+def bench_transform(symbol_counts: list, workers: list, days: int = 252, periods: int = 4, repeat: int = 3) -> list:
+    """
+    Time loading, parsing and reshaping raw JSON files with different worker counts.
+    Synthetic raw files are written to data/raw/benchmark and removed afterwards.
+    """
+
+    from parallel_transform import load_frames, build_frames, parallel_frames
+
+    def transform(symbols, n_workers):
+        if n_workers > 1:
+            return parallel_frames(symbols, DOCUMENTS, 'benchmark', workers=n_workers)
+        return build_frames(load_frames(symbols, DOCUMENTS, 'benchmark'), DOCUMENTS)
+
+    results = []
+    folder = os.path.join(DATA_DIR, 'raw', 'benchmark')
+    try:
+        for n_symbols in symbol_counts:
+            symbols = synthetic_symbols(n_symbols)
+            shutil.rmtree(folder, ignore_errors=True)
+            save_raw_data(synthetic_payloads(symbols, days=days, periods=periods), symbols, DOCUMENTS, 'benchmark')
+            for n_workers in workers:
+                seconds = time_call(transform, symbols, n_workers, repeat=repeat)
+                results.append({'symbols': n_symbols, 'workers': n_workers, 'seconds': seconds})
+                logging.info(f"transform: {n_symbols} symbols with {n_workers} workers in {seconds:.3f}s")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return results
+
+
+def _disk_usage(folder: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, filename)) for root, _, filenames in os.walk(folder) for filename in filenames)
+
+
+def bench_raw_storage(symbol_counts: list, days: int = 252, periods: int = 4, runs: int = 3, repeat: int = 3) -> list:
+    """
+    Disk usage and load time of each raw storage backend. Each backend saves runs
+    timestamped snapshots, as a scheduled job would: stock prices change every run,
+    statements don't. The last snapshot is then loaded back.
+    Synthetic raw files are written to data/raw/benchmark and removed afterwards.
+    """
+
+    from parallel_transform import load_frames
+
+    results = []
+    folder = os.path.join(DATA_DIR, 'raw', 'benchmark')
+    try:
+        for n_symbols in symbol_counts:
+            symbols = synthetic_symbols(n_symbols)
+            statements = synthetic_payloads(symbols, STATEMENTS, days=days, periods=periods)
+            for storage in STORAGE_OPTIONS:
+                shutil.rmtree(folder, ignore_errors=True)
+                for run in range(runs):
+                    timestamp = f"20250101_{run:06d}"
+                    payloads = {**synthetic_payloads(symbols, ['stock'], days=days, seed=run), **statements}
+                    save_raw_data(payloads, symbols, DOCUMENTS, 'benchmark', timestamp, storage)
+                disk = _disk_usage(folder)
+                seconds = time_call(load_frames, symbols, DOCUMENTS, 'benchmark', timestamp, storage, repeat=repeat)
+                results.append({'symbols': n_symbols, 'step': storage, 'seconds': seconds, 'bytes': disk})
+                logging.info(f"raw_storage: {n_symbols} symbols, {runs} runs as {storage}: {disk / 2**20:.1f} MB on disk, "
+                             f"last snapshot loaded in {seconds:.3f}s")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return results
+
+
+def bench_sql(engine, symbol_counts: list, days: int = 252, periods: int = 4) -> list:
+    """
+    Time loading stocks and tidy statements with COPY, loading wide statements and
+    computing indicators in PostgreSQL. Uses benchmark_* tables, which are dropped afterwards.
+    """
+
+    from sqlalchemy import text
+    from sql_utils import load_dataframe, copy_dataframe, create_tidy_indicators, TABLE_KEYS, TABLE_INDEXES
+
+    results = []
+    try:
+        for n_symbols in symbol_counts:
+            dfs = parse_to_dataframes(synthetic_financial_data(n_symbols, days=days, periods=periods))
+            stocks = dfs.pop('stock')
+            wide, tidy = wide_format(dfs), long_format(dfs)
+
+            steps = [
+                ('load_stocks', lambda: load_dataframe(engine, stocks, "benchmark_stocks", 'replace', TABLE_KEYS['stocks'], TABLE_INDEXES['stocks'])),
+                ('load_tidy', lambda: load_dataframe(engine, tidy, "benchmark_tidy", 'replace', TABLE_KEYS['tidy'], TABLE_INDEXES['tidy'])),
+                ('load_statements', lambda: copy_dataframe(engine, wide, "benchmark_statements", if_exists='replace')),
+                ('indicators', lambda: create_tidy_indicators(engine, "benchmark", 'replace', export=False)),
+            ]
+            for step, function in steps:
+                seconds = time_call(function, repeat=1)
+                results.append({'symbols': n_symbols, 'step': step, 'seconds': seconds})
+                logging.info(f"{step}: {n_symbols} symbols in {seconds:.3f}s")
+    finally:
+        with engine.begin() as conn:
+            for table in ['stocks', 'tidy', 'statements', 'indicators']:
+                conn.execute(text(f"DROP TABLE IF EXISTS benchmark_{table};"))
+    return results
+
+
+def layout_frames(n_symbols: int, years: int = 12, metrics: int = 60, seed: int = 0) -> tuple:
+    """
+    Stocks (one row per symbol and business day) and tidy statements (one row per
+    symbol, quarter and metric) over years, ending in 2024. 1000 symbols and 12
+    years give about 3 million rows each.
+    """
+
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    symbols = np.array(synthetic_symbols(n_symbols), dtype=object)
+
+    days = pd.bdate_range(f"{2025 - years}-01-01", "2024-12-31")
+    stocks = pd.DataFrame({
+        'date': np.tile(days.values, n_symbols),
+        'symbol': np.repeat(symbols, len(days)),
+        'close': rng.uniform(10, 500, n_symbols * len(days)),
+        'volume': rng.integers(1e4, 1e7, n_symbols * len(days)),
+    })
+
+    quarters = pd.date_range(f"{2025 - years}-01-01", "2024-12-31", freq='QE')
+    names = np.array([f"metric{i:02d}" for i in range(metrics)], dtype=object)
+    per_symbol = len(quarters) * metrics
+    tidy = pd.DataFrame({
+        'date': np.tile(np.repeat(quarters.values, metrics), n_symbols),
+        'symbol': np.repeat(symbols, per_symbol),
+        'statement_type': 'income_statement',
+        'metric': np.tile(names, n_symbols * len(quarters)),
+        'value': rng.normal(1e6, 1e5, n_symbols * per_symbol),
+    })
+    return stocks, tidy
+
+
+def bench_sql_layout(engine, n_symbols: int = 1000, years: int = 12, repeat: int = 5) -> list:
+    """
+    Load multi-million-row stocks and tidy tables as plain tables and with the
+    partitioned, indexed layout (sql_utils.TABLE_INDEXES), then time LAYOUT_QUERIES
+    on each. Uses benchmark_plain_* and benchmark_partitioned_* tables, which are
+    dropped afterwards.
+    """
+
+    from sqlalchemy import text
+    from sql_utils import load_dataframe, TABLE_INDEXES
+
+    stocks, tidy = layout_frames(n_symbols, years)
+    logging.info(f"sql_layout: {len(stocks)} stock rows and {len(tidy)} tidy rows for {n_symbols} symbols over {years} years")
+    results = []
+    layouts = {'plain': None, 'partitioned': TABLE_INDEXES}
+    try:
+        for layout, indexes in layouts.items():
+            prefix = f"benchmark_{layout}"
+            for name, df in [('stocks', stocks), ('tidy', tidy)]:
+                start = time.perf_counter()
+                load_dataframe(engine, df, f"{prefix}_{name}", 'replace', indexes=indexes[name] if indexes else None)
+                seconds = time.perf_counter() - start
+                results.append({'symbols': n_symbols, 'step': f"{layout}:load_{name}", 'seconds': seconds})
+                logging.info(f"sql_layout: loaded {len(df)} {name} rows into {layout} table in {seconds:.1f}s")
+
+            with engine.begin() as conn:
+                conn.execute(text(f"ANALYZE {prefix}_stocks; ANALYZE {prefix}_tidy;"))
+            with engine.connect() as conn:
+                for query, sql in LAYOUT_QUERIES.items():
+                    statement = text(sql.format(prefix=prefix))
+                    seconds = time_call(lambda: conn.execute(statement).fetchall(), repeat=repeat)
+                    results.append({'symbols': n_symbols, 'step': f"{layout}:{query}", 'seconds': seconds})
+
+        for query in LAYOUT_QUERIES:
+            plain, partitioned = (next(r['seconds'] for r in results if r['step'] == f"{layout}:{query}") for layout in layouts)
+            logging.info(f"sql_layout: {query}: plain {plain * 1000:.1f} ms, partitioned {partitioned * 1000:.1f} ms ({plain / partitioned:.1f}x)")
+    finally:
+        with engine.begin() as conn:
+            for layout in layouts:
+                conn.execute(text(f"DROP TABLE IF EXISTS benchmark_{layout}_stocks, benchmark_{layout}_tidy;"))
+    return results
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(results: list, settings: dict, path: str = None) -> str:
+    """
+    Save benchmark results with the settings and environment they were measured in.
+    Defaults to data/benchmarks/benchmark_<timestamp>.json.
+    """
+
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'settings': settings,
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    logging.info(f"Saved benchmark results to {path}")
+    return path
+
+
+def compare_results(baseline: list, current: list, tolerance: float = 0.2) -> list:
+    """
+    Compare seconds for measurements present in both result lists.
+    Returns descriptions of measurements more than tolerance slower than the baseline.
+    """
+
+    def key(result):
+        return tuple(result.get(field) for field in RESULT_KEYS)
+
+    previous = {key(result): result for result in baseline}
+    regressions = []
+    for result in current:
+        if key(result) not in previous:
+            continue
+        before, after = previous[key(result)]['seconds'], result['seconds']
+        ratio = after / before if before else float('inf')
+        label = " ".join(f"{field}={value}" for field, value in zip(RESULT_KEYS, key(result)) if value is not None)
+        logging.info(f"{label}: {before:.3f}s -> {after:.3f}s ({ratio:.2f}x)")
+        if ratio > 1 + tolerance:
+            regressions.append(f"{label} is {ratio:.2f}x slower ({before:.3f}s -> {after:.3f}s)")
+    return regressions
+
+
+def _connect(db_url: str = None):
+    """
+    Engine for the SQL stage: db_url if given, otherwise the database in config/.env.
+    Returns None if no database is reachable.
+    """
+
+    try:
+        if db_url:
+            from sqlalchemy import create_engine
+            engine = create_engine(db_url)
+        else:
+            from sql_utils import connect_to_postgresql
+            engine = connect_to_postgresql()
+        with engine.connect():
+            pass
+        return engine
+    except Exception as e:
+        logging.warning(f"No PostgreSQL database available, skipping the sql stage: {e}")
+        return None
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark ETL stages on synthetic FMP data.")
+    parser.add_argument('--symbols', nargs='+', type=int, default=[100, 200, 400, 800, 1600], help='Symbol counts to benchmark')
+    parser.add_argument('--days', type=int, default=252, help='Trading days of stock history per symbol')
+    parser.add_argument('--periods', type=int, default=4, help='Statement periods per symbol')
+    parser.add_argument('--repeat', type=int, default=3, help='Repetitions per measurement. The best time is reported.')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=['startup', 'fetch', 'parse', 'reshape', 'sql'], help='Stages to benchmark')
+    parser.add_argument('--workers', nargs='+', type=int, default=[1, 4], help='Worker counts for the transform stage')
+    parser.add_argument('--runs', type=int, default=3, help='Timestamped snapshots saved per backend in the raw_storage stage')
+    parser.add_argument('--latency', type=float, default=0.02, help='Mock API latency in seconds for the fetch stage')
+    parser.add_argument('--error_rate', type=float, default=0.0, help='Fraction of mock API requests answered with 429')
+    parser.add_argument('--concurrency', type=int, default=8, help='Requests in flight for the fetch stage')
+    parser.add_argument('--symbols_per_request', type=int, default=1, help='Symbols per stock price request in the fetch stage')
+    parser.add_argument('--layout_symbols', type=int, default=1000, help='Symbols in the sql_layout stage tables. 1000 symbols over 12 years is about 3 million rows per table')
+    parser.add_argument('--layout_years', type=int, default=12, help='Years of data in the sql_layout stage tables')
+    parser.add_argument('--db_url', help='SQLAlchemy URL for the sql stage. Default: the database in config/.env')
+    parser.add_argument('--output', help='Results JSON path. Default: data/benchmarks/benchmark_<timestamp>.json')
+    parser.add_argument('--compare', help='Earlier results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Slowdown ratio above 1 reported as a regression with --compare')
+    parser.add_argument('--import_budget', type=float, default=IMPORT_BUDGET, help=f'Seconds each entry point may take to import in the startup stage. Default: {IMPORT_BUDGET}')
+    args = parser.parse_args()
+
+    ''' Example usage:
+    python benchmark.py --symbols 100 200 400 800 1600
+    python benchmark.py --symbols 100 1000 --stages fetch --latency 0.05 --error_rate 0.02
+    python benchmark.py --symbols 5000 --stages long_format
+    python benchmark.py --symbols 2000 --stages transform --workers 1 8 32
+    python benchmark.py --symbols 100 1000 --stages stock_indicators --days 2520
+    python benchmark.py --symbols 500 --stages raw_storage --runs 5
+    python benchmark.py --compare ../data/benchmarks/benchmark_20250601_120000.json
+    python benchmark.py --stages startup --import_budget 0.1
+    python benchmark.py --stages sql_layout --layout_symbols 1000 --layout_years 12
+    '''
+
+    results = []
+    failures = []
+
+    def record(stage, stage_results):
+        results.extend({'stage': stage, **result} for result in stage_results)
+
+    if 'startup' in args.stages:
+        startup = bench_startup(repeat=args.repeat)
+        record('startup', startup)
+        failures += check_startup(startup, args.import_budget)
+    if 'fetch' in args.stages:
+        record('fetch', bench_fetch(args.symbols, days=args.days, periods=args.periods, latency=args.latency, error_rate=args.error_rate,
+                                    concurrency=args.concurrency, symbols_per_request=args.symbols_per_request))
+    if 'parse' in args.stages:
+        record('parse', bench_parse(args.symbols, days=args.days, periods=args.periods, repeat=args.repeat))
+    if 'reshape' in args.stages:
+        record('reshape', bench_reshape(args.symbols, periods=args.periods, repeat=args.repeat))
+    if 'long_format' in args.stages:
+        record('long_format', bench_long_format(args.symbols, periods=args.periods))
+    if 'stock_indicators' in args.stages:
+        record('stock_indicators', bench_stock_indicators(args.symbols, days=args.days, repeat=args.repeat))
+    if 'transform' in args.stages:
+        record('transform', bench_transform(args.symbols, args.workers, days=args.days, periods=args.periods, repeat=args.repeat))
+    if 'raw_storage' in args.stages:
+        record('raw_storage', bench_raw_storage(args.symbols, days=args.days, periods=args.periods, runs=args.runs, repeat=args.repeat))
+    if 'sql' in args.stages or 'sql_layout' in args.stages:
+        engine = _connect(args.db_url)
+        if engine is not None:
+            if 'sql' in args.stages:
+                record('sql', bench_sql(engine, args.symbols, days=args.days, periods=args.periods))
+            if 'sql_layout' in args.stages:
+                record('sql_layout', bench_sql_layout(engine, args.layout_symbols, args.layout_years, repeat=args.repeat))
+            engine.dispose()
+
+    settings = {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'db_url')}
+    save_results(results, settings, args.output)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            failures += compare_results(json.load(f)['results'], results, args.tolerance)
+    for failure in failures:
+        logging.warning(failure)
+    if failures:
+        sys.exit(1)
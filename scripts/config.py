@@ -1,8 +1,5 @@
 import os
 import logging
-import psycopg2
-from psycopg2 import sql
-from dotenv import load_dotenv
 
 
 # logging configuration
@@ -19,11 +16,36 @@ DEFAULT_ENDPOINTS_PATH = os.path.join(PROJECT_ROOT, "config", "default_endpoints
 DATA_DIR = os.path.join(PROJECT_ROOT, "data")
 
 
-# Load environment variables
-loaded = load_dotenv(ENV_PATH)
-if not loaded:
-    logging.error(f"Failed to load .env file from {ENV_PATH}.")
-    raise FileNotFoundError(f"Failed to load .env file from {ENV_PATH}.")
+# Option choices and defaults. They live here rather than in the modules that use
+# them so the CLI parser can be built without importing pandas, requests or SQLAlchemy.
+DEFAULT_CONCURRENCY = 8
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_SYMBOLS_PER_REQUEST = 5
+STORAGE_OPTIONS = ['json', 'parquet', 'gzip']
+OUTPUT_FORMATS = {'csv': '.csv', 'parquet': '.parquet', 'arrow': '.arrow', 'none': None}
+LOAD_MODES = ['replace', 'append', 'upsert']
+INDICATOR_ENGINES = ['postgres', 'local']
+
+
+# Whether config/.env has been loaded into the environment
+_env_loaded = False
+
+
+def load_env() -> None:
+    """
+    Load environment variables from config/.env on first use, so runs and
+    commands that never need credentials (e.g. --help) don't require the file.
+    """
+
+    global _env_loaded
+    if _env_loaded:
+        return
+
+    from dotenv import load_dotenv
+    if not load_dotenv(ENV_PATH):
+        logging.error(f"Failed to load .env file from {ENV_PATH}.")
+        raise FileNotFoundError(f"Failed to load .env file from {ENV_PATH}.")
+    _env_loaded = True
 
 
 def fetch_api_key(key: str = "FMP_API_KEY") -> str:
@@ -31,6 +53,7 @@ def fetch_api_key(key: str = "FMP_API_KEY") -> str:
     Fetch API key from .env file.
     """
         
+    load_env()
     api_key = os.getenv(key)
     if not api_key:
         raise ValueError(f"{key} not found in environment. Check your .env file at {ENV_PATH}")
@@ -42,6 +65,7 @@ def fetch_postgresql_credentials() -> dict:
     Fetch SQL credentials from .env file.
     """
     
+    load_env()
     sql_credentials = POSTGRESQL_CONFIG = {
     "drivername": "postgresql+psycopg2",
     "host": os.getenv("DB_HOST"),
@@ -1,12 +1,82 @@
+import logging
+from datetime import date, datetime, timedelta
 from typing import Dict, List
-from config import fetch_api_key
-from utils import build_urls
-from FA_io import save_raw_data
-from fmp_client import fetch_endpoint_data, fetch_data
-from parser import get_parser_args, load_config, parse_inputs
+from config import fetch_api_key, DEFAULT_CONCURRENCY, DEFAULT_MAX_RETRIES, DEFAULT_SYMBOLS_PER_REQUEST
+from FA_io import save_raw_data, latest_raw_stock_dates
+from metrics import write_report, profiling
+from parser import get_parser_args, load_config, parse_inputs, parse_options
 
 
-def main(symbols: List[str], requests: List[str], queries: dict = {}, save_to: str = None, timestamp = False):
+def stock_high_water_marks(symbols: List[str], folder: str) -> Dict[str, str]:
+    """
+    Latest stock date already stored for each symbol, from data/raw/<folder> and
+    the <folder>_stocks table. The database is optional: if it can't be reached,
+    only the raw files are used.
+    """
+
+    marks = latest_raw_stock_dates(symbols, folder)
+    try:
+        from sql_utils import shared_engine, latest_stock_dates
+        for symbol, latest in latest_stock_dates(shared_engine(), folder).items():
+            if symbol in symbols and latest > marks.get(symbol, ""):
+                marks[symbol] = latest
+    except Exception as e:
+        logging.warning(f"Could not read high-water marks from {folder}_stocks, using raw files only: {e}")
+
+    return marks
+
+
+def incremental_stock_queries(symbols: List[str], folder: str, queries: dict):
+    """
+    Build per-symbol stock queries that only request bars after the latest stored date.
+    Returns (stock_queries, up_to_date) where up_to_date lists symbols with nothing new to fetch.
+    """
+
+    end = queries.get('to') or date.today().strftime('%Y-%m-%d')
+    stock_queries = {}
+    up_to_date = []
+
+    for symbol, latest in stock_high_water_marks(symbols, folder).items():
+        start = (datetime.strptime(latest, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+        if start > end:
+            up_to_date.append(symbol)
+        else:
+            stock_queries[symbol] = {'from': start, 'to': end}
+
+    logging.info(f"Incremental stock fetch: {len(stock_queries)} symbols resume after their latest stored date, {len(up_to_date)} are up to date.")
+    return stock_queries, up_to_date
+
+
+def request_urls(symbols: List[str], requests: List[str], queries: dict, save_to: str, timestamp=False, incremental: bool = False,
+                 symbols_per_request: int = DEFAULT_SYMBOLS_PER_REQUEST) -> Dict[str, Dict[str, str]]:
+    """
+    Build {request: {symbol: url}} for a run. In incremental mode, stock urls only
+    ask for bars after each symbol's latest stored date, and symbols that are
+    already up to date are left out. Stock urls with the same query are grouped
+    symbols_per_request at a time (see fmp_client.batch_urls).
+    """
+
+    # Fetch API key from .env file
+    FMP_API_KEY = fetch_api_key("FMP_API_KEY")
+
+    # Resume stock prices from each symbol's latest stored date
+    stock_queries, up_to_date = None, []
+    if incremental and 'stock' in requests:
+        if not timestamp:
+            raise ValueError("Incremental extraction requires timestamp. Otherwise new bars would overwrite the stored history.")
+        stock_queries, up_to_date = incremental_stock_queries(symbols, save_to, queries)
+
+    from fmp_client import build_urls, batch_urls
+    urls = build_urls(api_key=FMP_API_KEY, requests=requests, symbols=symbols, stock_queries=stock_queries, **queries)
+    for symbol in up_to_date:
+        urls['stock'].pop(symbol, None)
+    return batch_urls(urls, symbols_per_request)
+
+
+def main(symbols: List[str], requests: List[str], queries: dict = {}, save_to: str = None, timestamp = False,
+         concurrency: int = DEFAULT_CONCURRENCY, tier: str = None, rate_limit: float = None, max_retries: int = DEFAULT_MAX_RETRIES,
+         use_cache: bool = True, refresh: bool = False, incremental: bool = False, storage: str = 'json',
+         symbols_per_request: int = DEFAULT_SYMBOLS_PER_REQUEST):
     """
     Main function for fetching financial data from FMI API and saving it to JSON files.
     
@@ -16,17 +86,24 @@ def main(symbols: List[str], requests: List[str], queries: dict = {}, save_to: s
               For the rest, use period=("quarter" or "annual") limit=N\
               For all, include all query parameters.
     save_to:  Save JSON data to data/raw/<folder_name>.
+    concurrency: maximum number of API requests in flight.
+    tier:     FMP plan used to set the request rate. rate_limit (requests/min) overrides it.
+              Neither set: no client-side rate limit.
+    max_retries: retries for throttled or failed requests.
+    use_cache: serve fresh responses from the HTTP cache in data/cache. refresh refetches everything.
+    incremental: only fetch stock prices newer than the latest date already stored for each symbol.
+                 Requires timestamp, since each run only saves the new bars.
+    storage:  raw data backend, 'json', 'parquet' or 'gzip'.
+    symbols_per_request: symbols fetched per stock price request. 1 requests each symbol separately.
     """
 
-    # Fetch API key from .env file
-    FMP_API_KEY = fetch_api_key("FMP_API_KEY")
-
     # Fetch data from the Financial Modeling Prep API
-    urls = build_urls(api_key=FMP_API_KEY, requests=requests, symbols=symbols, **queries)
-    data = fetch_data(urls)
+    urls = request_urls(symbols, requests, queries, save_to, timestamp, incremental, symbols_per_request)
+    from fmp_client import fetch_data
+    data = fetch_data(urls, concurrency=concurrency, tier=tier, rate_limit=rate_limit, max_retries=max_retries, use_cache=use_cache, refresh=refresh)
 
     if save_to.lower() != "none":
-        save_raw_data(data, symbols=symbols, requests=requests, save_to=save_to, timestamp=timestamp)
+        save_raw_data(data, symbols=symbols, requests=requests, save_to=save_to, timestamp=timestamp, storage=storage)
     
     return data
 
@@ -39,10 +116,12 @@ if __name__ == "__main__":
     # If arguments were passed through a yaml file
     if args.config:
         config = load_config(args.config)
+        options = parse_options(args, config)
         symbols, requests, queries, save_to, timestamp = parse_inputs(**config)
 
     # If arguments were passed through CLI
     if args.manual:
+        options = parse_options(args)
         symbols, requests, queries, save_to, timestamp = parse_inputs(args.symbols, args.requests, args.queries, args.save_to, args.timestamp)
     
     
@@ -54,5 +133,12 @@ if __name__ == "__main__":
     python extract.py --manual --symbols AAPL MSFT GOOGL --requests all --queries "from=2022-05-01" "to=2023-05-01" "period=quarter" "limit=4" --save_to timestamp
     '''
     
-    data = main(symbols=symbols, requests=requests, queries=queries, save_to=save_to, timestamp=timestamp)
+    with profiling(options['profile'], f"{save_to}_extract"):
+        data = main(
+            symbols=symbols, requests=requests, queries=queries, save_to=save_to, timestamp=timestamp,
+            concurrency=options['concurrency'], tier=options['tier'], rate_limit=options['rate_limit'], max_retries=options['max_retries'],
+            use_cache=not options['no_cache'], refresh=options['refresh'], incremental=options['incremental'], storage=options['storage'],
+            symbols_per_request=options['symbols_per_request']
+        )
+    write_report(f"{save_to}_extract")
     print("Data fetched successfully.")
\ No newline at end of file
@@ -1,41 +1,385 @@
+import time
+import json
+import heapq
 import requests
 import logging
+import threading
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit, urlunsplit
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from requests.adapters import HTTPAdapter
 from typing import Dict, List, Optional
+from config import DEFAULT_ENDPOINTS_PATH, DEFAULT_CONCURRENCY, DEFAULT_MAX_RETRIES, DEFAULT_SYMBOLS_PER_REQUEST
+from rate_limiter import TokenBucket, get_rate_limiter, backoff_delay
+from http_cache import ResponseCache
+from metrics import stage, observe_http
 
 
-def fetch_endpoint_data(url: str) -> Optional[dict]:
+# Endpoints that accept comma-separated symbol lists, and the payload key that
+# holds one {'symbol': ..., 'historical': [...]} entry per symbol
+BATCH_ENDPOINTS = {'stock': 'historicalStockList'}
+BATCH_SEPARATOR = ","
+
+# Shared keep-alive session, created on first use
+_session = None
+_session_lock = threading.Lock()
+
+
+class RetryableError(Exception):
     """
-    Fetch data from a given url.
+    Raised for responses worth retrying: 429, 5xx, timeouts and dropped connections.
+    """
+
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def get_session(pool_size: int = DEFAULT_CONCURRENCY) -> requests.Session:
+    """
+    Return the shared HTTP session. Connections to the API host are kept alive
+    and reused, so only the first requests pay for the TLS handshake.
+    """
+
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+    return _session
+
+
+def build_urls(api_key: str, requests: List[str], symbols: List[str] = None, stock_queries: Dict[str, dict] = None, **kwargs) -> Dict[str, Dict[str, str]]:
+    """
+    Build the complete URL for the API request.
+
+    inputs:
+    - api_key: API key for authentication
+    - requests: list of endpoint names to fetch from the API (e.g., 'stock', 'income-statement')
+    - symbols: list of stock symbols to fetch data for
+    - stock_queries: optional per-symbol from/to overrides for the stock endpoint,
+      e.g. {'AAPL': {'from': '2025-05-02', 'to': '2025-05-05'}}
+    - kwargs: query parameters for the API request. For stocks, from=yyyy-mm-dd and
+      to=yyyy-mm-dd. For statements, period=(quarter or annual) and limit=number
+      of records to fetch.
+    """
+    
+    # Load default endpoints from JSON file
+    with open(DEFAULT_ENDPOINTS_PATH, 'r') as f:
+        default_endpoints = json.load(f)
+    if not default_endpoints:
+        raise FileNotFoundError(f"Failed to load default endpoints from {DEFAULT_ENDPOINTS_PATH}.")
+
+    # Prepare queries:
+    if not kwargs.get('from') or not kwargs.get('to'):
+        stock_query = ""
+    else:
+        stock_query = f"from={kwargs.get('from', '')}&to={kwargs.get('to', '')}&"
+    statement_query = f"period={kwargs.get('period', 'annual')}&limit={kwargs.get('limit', 1)}&"
+
+    # Format URLs for each endpoint 
+    urls = {}
+    for endpoint in requests:
+
+        # Choose template and query based on endpoint type
+        template = default_endpoints[endpoint]
+        query = stock_query if endpoint == "stock" else statement_query
+
+        urls[endpoint] = {}
+        for symbol in symbols:
+            try:
+                if endpoint == "stock" and stock_queries and symbol in stock_queries:
+                    symbol_query = stock_queries[symbol]
+                    query = f"from={symbol_query['from']}&to={symbol_query['to']}&"
+                elif endpoint == "stock":
+                    query = stock_query
+                formatted_url = template.format(symbol=symbol, query=query) + f"{api_key}"
+                urls[endpoint][symbol] = formatted_url
+            except Exception as e:
+                logging.error(f"Failed to format URL for {endpoint} and symbol {symbol}: {e}")
+                continue
+
+    return urls
+
+
+def _with_symbols(url: str, symbols: list) -> str:
+    """
+    Replace the symbol path segment of an endpoint url, e.g. .../historical-price-full/AAPL?...
+    """
+
+    parts = urlsplit(url)
+    path = parts.path.rsplit('/', 1)[0] + '/' + BATCH_SEPARATOR.join(symbols)
+    return urlunsplit(parts._replace(path=path))
+
+
+def batch_urls(urls: dict, symbols_per_request: int = DEFAULT_SYMBOLS_PER_REQUEST) -> dict:
+    """
+    Group per-symbol urls of batch endpoints into multi-symbol requests.
+
+    Symbols whose urls only differ by symbol (same query, e.g. the same from/to
+    dates) are joined up to symbols_per_request at a time. The returned
+    {request: {key: url}} uses "AAPL,MSFT,..." as the key of a batched url;
+    url_symbols lists the symbols behind the keys. Other endpoints are unchanged.
+    """
+
+    if symbols_per_request <= 1:
+        return urls
+
+    batched = dict(urls)
+    for request in BATCH_ENDPOINTS:
+        if request not in urls:
+            continue
+        groups = {}
+        for symbol, url in urls[request].items():
+            groups.setdefault(_with_symbols(url, []), []).append(symbol)
+        batched[request] = {}
+        for template, symbols in groups.items():
+            for start in range(0, len(symbols), symbols_per_request):
+                chunk = symbols[start:start + symbols_per_request]
+                key = BATCH_SEPARATOR.join(chunk)
+                batched[request][key] = urls[request][chunk[0]] if len(chunk) == 1 else _with_symbols(template, chunk)
+    return batched
+
+
+def url_symbols(request_urls: dict) -> list:
+    """
+    Symbols behind the keys of {key: url}, in order.
+    """
+
+    return [symbol for key in request_urls for symbol in key.split(BATCH_SEPARATOR)]
+
+
+def split_batch(request: str, symbols: list, data) -> dict:
+    """
+    Split a multi-symbol response into {symbol: payload} laid out like a
+    single-symbol response. Symbols missing from the response are left out.
+    """
+
+    if not data:
+        return {}
+    if isinstance(data, dict) and BATCH_ENDPOINTS[request] in data:
+        entries = data[BATCH_ENDPOINTS[request]]
+    else:
+        # A single matching symbol comes back in the single-symbol layout
+        entries = [data]
+    return {entry['symbol']: entry for entry in entries if isinstance(entry, dict) and entry.get('symbol') in symbols}
+
+
+def parse_retry_after(value: str) -> Optional[float]:
+    """
+    Parse a Retry-After header given in seconds or as an HTTP date.
+    """
+
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _get(url: str, session: requests.Session, limiter: TokenBucket = None, request: str = 'other') -> Optional[dict]:
+    """
+    Make a single rate-limited request.
+    Raises RetryableError for throttled or transient failures, returns None for
+    permanent ones. The round trip is recorded in the run metrics under request,
+    without the time spent waiting on the rate limiter.
     """
 
+    if limiter:
+        limiter.acquire()
+
+    start = time.perf_counter()
+    try:
+        response = session.get(url, timeout=10)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+        observe_http(request, time.perf_counter() - start)
+        raise RetryableError(f"Request error for URL {url}: {e}")
+    except requests.exceptions.RequestException as e:
+        observe_http(request, time.perf_counter() - start)
+        logging.warning(f"Request error for URL {url}: {e}")
+        return None
+    observe_http(request, time.perf_counter() - start, response.status_code, len(response.content))
+
+    if response.status_code == 429:
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        if limiter:
+            limiter.throttled(retry_after)
+        raise RetryableError(f"Rate limited for URL {url}", retry_after=retry_after)
+    if response.status_code >= 500:
+        raise RetryableError(f"Server error {response.status_code} for URL {url}")
+
     try:
-        response = requests.get(url, timeout=10)
         response.raise_for_status()
-        return response.json()
+        data = response.json()
     except requests.exceptions.RequestException as e:
         logging.warning(f"Request error for URL {url}: {e}")
+        return None
     except ValueError:
         logging.warning(f"Invalid JSON response from URL {url}.")
+        return None
+
+    if limiter:
+        limiter.succeeded()
+    return data
+
+
+def fetch_endpoint_data(url: str, session: requests.Session = None, limiter: TokenBucket = None) -> Optional[dict]:
+    """
+    Fetch data from a given url.
+    """
+
+    try:
+        return _get(url, session or get_session(), limiter)
+    except RetryableError as e:
+        logging.warning(str(e))
     return None
 
 
-def fetch_data(urls: dict):
-    data = {}
-    # For loop for request types
-    for request in urls.keys():
-        data[request] = {}
-        # For loop for symbols
-        for symbol in urls[request].keys():
-            symbol_data = fetch_endpoint_data(urls[request][symbol])
+def iter_fetch(urls: dict, concurrency: int = DEFAULT_CONCURRENCY, limiter: TokenBucket = None, max_retries: int = DEFAULT_MAX_RETRIES,
+               cache: ResponseCache = None):
+    """
+    Fetch every url in {request: {symbol: url}} concurrently and yield
+    (request, symbol, data) as each one completes.
+
+    Multi-symbol urls from batch_urls are split back into one result per symbol.
+    Symbols missing from a batched response, or whose batch failed permanently
+    or ran out of retries, are requested on their own.
+
+    Fresh responses in cache are yielded without a request, and successful
+    responses are written back to it.
+
+    Throttled and transient failures are rescheduled with jittered backoff. A
+    waiting retry does not hold a worker, so other requests keep flowing.
+    data is None for symbols that failed permanently or ran out of retries.
+    Raises rate_limiter.QuotaExceededError before fetching if the requests not
+    served from cache can't fit in the limiter's rate within MAX_RUN_WAIT.
+    """
+
+    session = get_session(pool_size=concurrency)
+    retries = []
+    pending = {}
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+
+        def submit(request, symbol, url, attempt):
+            future = executor.submit(_get, url, session, limiter, request)
+            pending[future] = (request, symbol, url, attempt)
+
+        def complete(request, key, url, data):
+            if BATCH_SEPARATOR not in key:
+                yield request, key, data
+                return
+            symbols = key.split(BATCH_SEPARATOR)
+            found = split_batch(request, symbols, data)
+            for symbol in symbols:
+                if symbol in found:
+                    yield request, symbol, found[symbol]
+                else:
+                    submit(request, symbol, _with_symbols(url, [symbol]), 0)
+            if len(found) < len(symbols):
+                logging.info(f"Batched {request} response had {len(found)} of {len(symbols)} symbols. Requesting the rest one by one.")
+
+        to_fetch = []
+        for request in urls:
+            for symbol, url in urls[request].items():
+                cached = cache.get(request, url) if cache else None
+                if cached is not None:
+                    yield from complete(request, symbol, url, cached)
+                else:
+                    to_fetch.append((request, symbol, url))
+
+        # Fail now rather than sleep for hours on a quota the run can't fit in
+        if limiter:
+            limiter.check_run(len(to_fetch))
+        for request, symbol, url in to_fetch:
+            submit(request, symbol, url, 0)
+
+        while pending or retries:
+
+            # Resubmit retries that are due
+            now = time.monotonic()
+            while retries and retries[0][0] <= now:
+                _, _, request, symbol, url, attempt = heapq.heappop(retries)
+                submit(request, symbol, url, attempt)
+
+            timeout = max(0.0, retries[0][0] - now) if retries else None
+            if not pending:
+                time.sleep(timeout)
+                continue
+
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                request, symbol, url, attempt = pending.pop(future)
+                try:
+                    symbol_data = future.result()
+                except RetryableError as e:
+                    if attempt >= max_retries and BATCH_SEPARATOR in symbol:
+                        # One bad batch shouldn't lose every symbol in it
+                        symbols = symbol.split(BATCH_SEPARATOR)
+                        logging.warning(f"{e}. Batch gave up after {max_retries} retries. Requesting its {len(symbols)} symbols one by one.")
+                        for single in symbols:
+                            submit(request, single, _with_symbols(url, [single]), 0)
+                        continue
+                    if attempt >= max_retries:
+                        logging.warning(f"{e}. Giving up after {max_retries} retries.")
+                        yield request, symbol, None
+                        continue
+                    delay = backoff_delay(attempt + 1, e.retry_after)
+                    logging.info(f"Retrying {request} for {symbol} in {delay:.1f}s ({e})")
+                    heapq.heappush(retries, (time.monotonic() + delay, id(future), request, symbol, url, attempt + 1))
+                    continue
+
+                if cache and symbol_data:
+                    cache.set(request, url, symbol_data)
+                yield from complete(request, symbol, url, symbol_data)
+
+
+def fetch_data(urls: dict, concurrency: int = DEFAULT_CONCURRENCY, tier: str = None, rate_limit: float = None, max_retries: int = DEFAULT_MAX_RETRIES,
+               use_cache: bool = True, refresh: bool = False):
+    """
+    Fetch every url in {request: {symbol: url}} concurrently. urls may hold
+    multi-symbol requests from batch_urls.
+
+    concurrency: maximum number of requests in flight. All workers share one
+                 connection pool of the same size.
+    tier:        FMP plan used to set the request rate (see rate_limiter.API_TIERS).
+                 Neither tier nor rate_limit set: no client-side rate limit.
+    rate_limit:  optional requests per minute, overrides the tier rate.
+    max_retries: retries for throttled or transient failures.
+    use_cache:   read and write the on-disk response cache under data/cache.
+    refresh:     ignore cached responses but still write new ones.
+    Returns {request: {symbol: data}}, with None for symbols that failed.
+    """
+
+    limiter = get_rate_limiter(tier, rate_limit)
+    cache = ResponseCache(refresh=refresh) if use_cache else None
+
+    # Keep the request/symbol order of the input regardless of completion order
+    data = {request: {symbol: None for symbol in url_symbols(urls[request])} for request in urls}
+
+    with stage('fetch') as counts:
+        counts['rows_in'] = sum(len(data[request]) for request in data)
+        for request, symbol, symbol_data in iter_fetch(urls, concurrency=concurrency, limiter=limiter, max_retries=max_retries, cache=cache):
             if symbol_data:
                 data[request][symbol] = symbol_data
+                counts['rows_out'] += 1
                 logging.info(f"Fetched {request} for {symbol}")
             else:
                 logging.warning(f"No {request} found for {symbol}.")
-                data[request][symbol] = None
-    
+
+    if cache:
+        logging.info(f"HTTP cache: {cache.hits} hits, {cache.misses} misses.")
+        cache.prune()
+
     if not data:
         logging.warning("No data fetched. Returning None.")
         return None
-    
-    return data
\ No newline at end of file
+
+    return data
@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from config import DATA_DIR
+
+
+# Cache location and size bound
+CACHE_DIR = os.path.join(DATA_DIR, "cache", "http")
+DEFAULT_MAX_BYTES = 512 * 1024 ** 2
+
+# Seconds before a cached response is considered stale, per endpoint.
+# Prices change daily, filed statements rarely change.
+ENDPOINT_TTLS = {
+    'stock': 60 * 60,
+    'income_statement': 7 * 24 * 60 * 60,
+    'balance_sheet': 7 * 24 * 60 * 60,
+    'cashflow': 7 * 24 * 60 * 60,
+}
+DEFAULT_TTL = 60 * 60
+
+
+def strip_api_key(url: str) -> str:
+    """
+    Remove the apikey query parameter so cache keys and logs don't depend on it.
+    """
+
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k.lower() != 'apikey']
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+class ResponseCache:
+    """
+    On-disk cache of API responses keyed by url (without the api key).
+
+    Each entry is a JSON file holding the url, fetch time and payload. Entries
+    older than their endpoint's TTL are ignored. File modification times track
+    last use, and prune() evicts the least recently used entries once the cache
+    grows past max_bytes.
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR, ttls: dict = None, max_bytes: int = DEFAULT_MAX_BYTES, refresh: bool = False):
+        self.cache_dir = cache_dir
+        self.ttls = ttls or ENDPOINT_TTLS
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, url: str) -> str:
+        key = hashlib.sha256(strip_api_key(url).encode()).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, request: str, url: str) -> Optional[dict]:
+        """
+        Return the cached payload for url, or None if missing, stale or refreshing.
+        """
+
+        path = self._path(url)
+        if self.refresh or not os.path.exists(path):
+            self.misses += 1
+            return None
+
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            logging.warning(f"Discarding unreadable cache entry {path}")
+            self.misses += 1
+            return None
+
+        if time.time() - entry['fetched_at'] > self.ttls.get(request, DEFAULT_TTL):
+            self.misses += 1
+            return None
+
+        # Mark entry as recently used
+        os.utime(path)
+        self.hits += 1
+        return entry['data']
+
+    def set(self, request: str, url: str, data) -> None:
+        """
+        Store a payload. Written to a temporary file first so readers never see partial entries.
+        """
+
+        path = self._path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {'url': strip_api_key(url), 'request': request, 'fetched_at': time.time(), 'data': data}
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    def prune(self) -> None:
+        """
+        Evict least recently used entries until the cache fits in max_bytes.
+        """
+
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        if total <= self.max_bytes:
+            return
+
+        entries.sort()
+        evicted = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            evicted += 1
+        logging.info(f"Evicted {evicted} entries from HTTP cache at {self.cache_dir}")
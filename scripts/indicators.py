@@ -0,0 +1,169 @@
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from config import INDICATOR_ENGINES
+
+
+# logging configuration
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+# Indicator engines (INDICATOR_ENGINES): 'postgres' runs INDICATOR_FORMULAS in sql_utils, 'local' runs LOCAL_FORMULAS below.
+
+
+def _divide(numerator: pd.Series, denominator: pd.Series) -> pd.Series:
+    """
+    Plain SQL division: NULL if either side is NULL, error if dividing by zero.
+    """
+
+    if (denominator == 0).any():
+        raise ZeroDivisionError("division by zero")
+    return numerator.astype(float) / denominator
+
+
+def _nullif_divide(numerator: pd.Series, denominator: pd.Series) -> pd.Series:
+    """
+    Division by NULLIF(denominator, 0): NULL instead of an error when dividing by zero.
+    """
+
+    return numerator.astype(float) / denominator.where(denominator != 0).astype(float)
+
+
+# Vectorized versions of sql_utils.INDICATOR_FORMULAS, with the same names, order and NULL semantics.
+LOCAL_FORMULAS = {
+    'profitability': [
+        ('naive_roe', lambda s: _divide(s['netIncome'], s['totalEquity'])),
+        ('naive_roa', lambda s: _divide(s['netIncome'], s['totalAssets'])),
+        ('simplified_roic', lambda s: _divide(s['netIncome'] - s['dividendsPaid'], s['totalDebt'] + s['totalEquity'])),
+        ('gross_profit_margin', lambda s: _divide(s['grossProfit'], s['revenue'])),
+        ('operating_margin', lambda s: _divide(s['operatingIncome'], s['revenue'])),
+        ('operating_income_ratio', lambda s: s['operatingIncomeRatio'].astype(float)),
+        ('net_profit_margin', lambda s: _divide(s['netIncome'], s['revenue'])),
+        ('ebitda_margin', lambda s: _divide(s['ebitda'], s['revenue'])),
+        ('earnings_per_share', lambda s: s['eps'].astype(float)),
+        ('diluted_earnings_per_share', lambda s: s['epsdiluted'].astype(float)),
+    ],
+    'leverage': [
+        ('naive_debt_to_equity', lambda s: _divide(s['totalDebt'], s['totalEquity'])),
+        ('naive_equity_ratio', lambda s: _divide(s['totalEquity'], s['totalAssets'])),
+        ('naive_debt_ratio', lambda s: _divide(s['totalDebt'], s['totalAssets'])),
+        ('naive_debt_to_capital', lambda s: _nullif_divide(s['totalDebt'], s['totalDebt'] + s['totalEquity'])),
+        ('interest_coverage', lambda s: _nullif_divide(s['ebitda'], s['interestExpense'])),
+        ('net_debt_to_ebitda', lambda s: _nullif_divide(s['totalDebt'] - s['cashAndCashEquivalents'], s['ebitda'])),
+    ],
+    'liquidity': [
+        ('current_ratio', lambda s: _divide(s['totalCurrentAssets'], s['totalCurrentLiabilities'])),
+        ('quick_ratio', lambda s: _divide(s['cashAndCashEquivalents'] + s['shortTermInvestments'] + s['accountsReceivables'], s['totalCurrentLiabilities'])),
+        ('cash_ratio', lambda s: _divide(s['cashAndCashEquivalents'], s['totalCurrentLiabilities'])),
+        ('operating_cashflow_to_capex', lambda s: _nullif_divide(s['operatingCashFlow'], s['capitalExpenditure'].abs())),
+        ('operating_cash_flow_ratio', lambda s: _nullif_divide(s['operatingCashFlow'], s['totalCurrentLiabilities'])),
+    ],
+}
+
+
+def compute_indicators(wide: pd.DataFrame) -> dict:
+    """
+    Compute indicator categories in-process from the wide statements DataFrame.
+
+    Returns {category: DataFrame} with date, symbol and one column per indicator,
+    the same layout as the <folder>_<category> tables built in PostgreSQL.
+    As in SQL, a category with a plain division by zero fails and is skipped.
+    """
+
+    indicators = {}
+    for name, formulas in LOCAL_FORMULAS.items():
+        try:
+            columns = {'date': wide['date'], 'symbol': wide['symbol']}
+            for metric, formula in formulas:
+                columns[metric] = formula(wide)
+            indicators[name] = pd.DataFrame(columns).reset_index(drop=True)
+        except (ZeroDivisionError, KeyError) as e:
+            logging.error(f"Failed to compute {name} indicators: {e}")
+    return indicators
+
+
+def compare_indicators(local: dict, remote: dict, rtol: float = 1e-9) -> list:
+    """
+    Compare local and PostgreSQL indicator tables. Rows are matched on (symbol, date).
+    Returns a list of mismatch descriptions, empty if they agree.
+    """
+
+    mismatches = []
+    for name in LOCAL_FORMULAS:
+        if (name in local) != (name in remote):
+            mismatches.append(f"{name}: computed by only one engine")
+            continue
+        if name not in local:
+            continue
+
+        left = local[name].sort_values(['symbol', 'date']).reset_index(drop=True)
+        right = remote[name].sort_values(['symbol', 'date']).reset_index(drop=True)
+        if len(left) != len(right):
+            mismatches.append(f"{name}: {len(left)} local rows vs {len(right)} SQL rows")
+            continue
+
+        for metric, _ in LOCAL_FORMULAS[name]:
+            a = left[metric].to_numpy(dtype=float)
+            b = right[metric].to_numpy(dtype=float)
+            same = np.isclose(a, b, rtol=rtol, atol=0, equal_nan=True)
+            if not same.all():
+                mismatches.append(f"{name}.{metric}: {int((~same).sum())} rows differ")
+
+    return mismatches
+
+
+def verify_against_sql(engine, wide: pd.DataFrame, folder_name: str) -> list:
+    """
+    Compute indicators with both engines on the same statements and compare them.
+    Uses <folder_name>_statements and the wide indicator tables, which are dropped afterwards.
+    """
+
+    from sqlalchemy import text
+    from sql_utils import copy_dataframe, create_indicators
+
+    copy_dataframe(engine, wide, f"{folder_name}_statements", if_exists='replace')
+    create_indicators(engine, wide, folder_name)
+
+    remote = {}
+    with engine.connect() as conn:
+        for name in LOCAL_FORMULAS:
+            try:
+                remote[name] = pd.read_sql(f"SELECT * FROM {folder_name}_{name};", conn)
+            except Exception:
+                conn.rollback()
+    with engine.begin() as conn:
+        for name in list(LOCAL_FORMULAS) + ['statements']:
+            conn.execute(text(f"DROP TABLE IF EXISTS {folder_name}_{name};"))
+
+    return compare_indicators(compute_indicators(wide), remote)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Verify the local indicator engine against PostgreSQL.")
+    parser.add_argument('--symbols', nargs='+', required=True, help='Symbols with raw statements saved')
+    parser.add_argument('--folder', required=True, help='Raw data folder in data/raw')
+    parser.add_argument('--timestamp', default=False, help='Timestamp of the raw files, if any')
+    args = parser.parse_args()
+
+    ''' Example usage:
+    python indicators.py --symbols AAPL MSFT --folder test --timestamp 20250525_134538
+    '''
+
+    from FA_io import load_raw_data
+    from utils import parse_to_dataframes, wide_format
+    from sql_utils import connect_to_postgresql
+
+    data = load_raw_data(args.symbols, ['income_statement', 'balance_sheet', 'cashflow'], args.folder, args.timestamp)
+    wide = wide_format(parse_to_dataframes(data))
+    engine = connect_to_postgresql()
+    mismatches = verify_against_sql(engine, wide, f"{args.folder}_verify")
+    engine.dispose()
+
+    for mismatch in mismatches:
+        logging.error(mismatch)
+    print("Local indicators match PostgreSQL." if not mismatches else f"{len(mismatches)} mismatches found.")
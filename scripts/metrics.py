@@ -0,0 +1,404 @@
+import os
+import json
+import time
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from config import DATA_DIR
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows. Peak RSS is reported as None there.
+    resource = None
+
+
+# logging configuration
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+# Where run reports are written
+METRICS_DIR = os.path.join(DATA_DIR, "metrics")
+
+# Prefix of every Prometheus metric name
+PROMETHEUS_PREFIX = "fmp_etl"
+
+# Counters each stage can fill in
+COUNTERS = ['rows_in', 'rows_out', 'bytes_in', 'bytes_out']
+
+# Latency percentiles reported per request type
+PERCENTILES = [50, 90, 99]
+
+# Run state. Stages are aggregated by name and labels, so stages that run once
+# per symbol or per file don't grow the report.
+_lock = threading.Lock()
+_stages = {}
+_http = {}
+_profile = []
+_started = time.time()
+
+# Counters of the innermost stage running in this thread
+_current = ContextVar('stage_counts', default=None)
+
+# Per-stage peak RSS on Linux. VmHWM in /proc/self/status is the process's peak
+# RSS, and writing 5 to /proc/self/clear_refs resets it to the current RSS. Each
+# stage resets it when it starts, after folding it into the peaks of the stages
+# already running and of the run, so none of them lose their peak.
+_STATUS_PATH = "/proc/self/status"
+_CLEAR_REFS_PATH = "/proc/self/clear_refs"
+_peaks = {}
+_run_peak = 0
+_resettable = None
+
+
+def _hwm():
+    """
+    VmHWM in bytes, or None without /proc.
+    """
+
+    try:
+        with open(_STATUS_PATH, 'rb') as f:
+            for line in f:
+                if line.startswith(b'VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _observe_hwm():
+    # Fold VmHWM into the run peak and the peak of every running stage, and return
+    # it. Call with _lock held.
+    global _run_peak
+    hwm = _hwm()
+    if hwm is None:
+        return None
+    _run_peak = max(_run_peak, hwm)
+    for token in _peaks:
+        _peaks[token] = max(_peaks[token], hwm)
+    return hwm
+
+
+def _reset_hwm() -> bool:
+    # Reset VmHWM to the current RSS. False if the kernel doesn't allow it. Call with _lock held.
+    global _resettable
+    if _resettable is False:
+        return False
+    try:
+        with open(_CLEAR_REFS_PATH, 'w') as f:
+            f.write('5')
+        _resettable = True
+    except OSError:
+        _resettable = False
+    return _resettable
+
+
+def _start_peak():
+    """
+    Start tracking the peak RSS of a stage. Returns a token for _stop_peak, or
+    None if peaks can't be measured per stage here.
+    """
+
+    with _lock:
+        if _resettable is False or _observe_hwm() is None or not _reset_hwm():
+            return None
+        # VmHWM when the stage stops is at least the RSS it started with
+        token = object()
+        _peaks[token] = 0
+        return token
+
+
+def _stop_peak(token):
+    """
+    Peak RSS in bytes since _start_peak returned token, or None.
+    """
+
+    if token is None:
+        return None
+    with _lock:
+        _observe_hwm()
+        return _peaks.pop(token)
+
+
+def peak_rss_bytes():
+    """
+    Peak resident set size of this run so far, or None if unknown. On Linux this
+    is tracked here, since stages reset the kernel's peak. Elsewhere it is the
+    peak of the whole process.
+    """
+
+    if _hwm() is not None:
+        with _lock:
+            _observe_hwm()
+            return _run_peak
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+def reset() -> None:
+    """
+    Start a new run, e.g. between scheduled runs in one process.
+    """
+
+    global _started, _run_peak
+    with _lock:
+        _stages.clear()
+        _http.clear()
+        _profile.clear()
+        _started = time.time()
+        # The next run's peak starts from the current RSS
+        _observe_hwm()
+        _run_peak = 0
+        _reset_hwm()
+        _observe_hwm()
+
+
+@contextmanager
+def stage(name: str, /, **labels):
+    """
+    Time a block of work and yield a dict of counters (rows_in, rows_out,
+    bytes_in, bytes_out) for the block to fill in.
+
+        with stage('parse', document='stock') as counts:
+            counts['rows_out'] = len(df)
+
+    Records wall time, process CPU time and the peak RSS while the stage ran.
+    Both are for the whole process, so they overlap between stages running
+    concurrently. Peak RSS per stage needs Linux and is None elsewhere.
+    """
+
+    counts = dict.fromkeys(COUNTERS, 0)
+    token = _current.set(counts)
+    peak_token = _start_peak()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield counts
+    finally:
+        _current.reset(token)
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        peak = _stop_peak(peak_token)
+        key = (name, tuple(sorted(labels.items())))
+        with _lock:
+            entry = _stages.setdefault(key, {
+                'stage': name, 'labels': dict(labels), 'calls': 0,
+                'wall_seconds': 0.0, 'max_wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                **dict.fromkeys(COUNTERS, 0), 'peak_rss_bytes': None,
+            })
+            entry['calls'] += 1
+            entry['wall_seconds'] += wall
+            entry['max_wall_seconds'] = max(entry['max_wall_seconds'], wall)
+            entry['cpu_seconds'] += cpu
+            for counter in COUNTERS:
+                entry[counter] += counts[counter]
+            if peak is not None:
+                entry['peak_rss_bytes'] = max(entry['peak_rss_bytes'] or 0, peak)
+
+
+def staged(name: str, /, labels: list = (), **fixed):
+    """
+    Record every call of the decorated function as a stage. labels names the
+    arguments whose values label the stage, fixed adds constant labels. The
+    function fills in its counters through stage_counts().
+
+        @staged('load_raw', labels=['storage'])
+        def load_raw_data(symbols, documents, folder, timestamp=False, storage='json'):
+            counts = stage_counts()
+    """
+
+    def decorate(function):
+        signature = None
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            nonlocal signature
+            values = dict(fixed)
+            if labels:
+                # Imported on first call, so decorating doesn't slow down startup
+                import inspect
+                signature = signature or inspect.signature(function)
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                values.update({label: bound.arguments[label] for label in labels})
+            with stage(name, **values):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def stage_counts() -> dict:
+    """
+    Counters of the stage running in this thread, or a throwaway dict outside any stage.
+    """
+
+    counts = _current.get()
+    return counts if counts is not None else dict.fromkeys(COUNTERS, 0)
+
+
+def observe_http(request: str, seconds: float, status: int = None, nbytes: int = 0) -> None:
+    """
+    Record one HTTP round trip for a request type. status is None for connection errors.
+    """
+
+    with _lock:
+        entry = _http.setdefault(request, {'latencies': [], 'statuses': {}, 'bytes': 0})
+        entry['latencies'].append(seconds)
+        entry['statuses'][str(status)] = entry['statuses'].get(str(status), 0) + 1
+        entry['bytes'] += nbytes
+
+
+def _percentile(ordered: list, percent: float) -> float:
+    # Nearest-rank percentile of a sorted list
+    index = max(0, min(len(ordered) - 1, -(-len(ordered) * percent // 100) - 1))
+    return ordered[int(index)]
+
+
+def report() -> dict:
+    """
+    Current run as a JSON-serializable dict.
+    """
+
+    peak = peak_rss_bytes()
+    with _lock:
+        http = {}
+        for request, entry in _http.items():
+            ordered = sorted(entry['latencies'])
+            http[request] = {
+                'count': len(ordered),
+                'mean_seconds': sum(ordered) / len(ordered),
+                'max_seconds': ordered[-1],
+                **{f"p{percent}_seconds": _percentile(ordered, percent) for percent in PERCENTILES},
+                'statuses': dict(entry['statuses']),
+                'bytes': entry['bytes'],
+            }
+        return {
+            'started': datetime.fromtimestamp(_started).isoformat(timespec='seconds'),
+            'wall_seconds': time.time() - _started,
+            'peak_rss_bytes': peak,
+            'stages': [dict(entry) for entry in _stages.values()],
+            'http': http,
+            'profile': list(_profile),
+        }
+
+
+def _prometheus_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    escaped = {key: str(value).replace('\\', '\\\\').replace('"', '\\"') for key, value in labels.items()}
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped.items()) + "}"
+
+
+def prometheus_text(run: dict, job: str) -> str:
+    """
+    Render a report in the Prometheus text exposition format, for the node_exporter textfile collector.
+    """
+
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{PROMETHEUS_PREFIX}_{name}{_prometheus_labels({'job': job, **labels})} {value}")
+
+    def stage_labels(entry):
+        return {'stage': entry['stage'], **entry['labels']}
+
+    metric('run_seconds', 'gauge', 'Wall time of the last run.', [({}, run['wall_seconds'])])
+    if run['peak_rss_bytes'] is not None:
+        metric('peak_rss_bytes', 'gauge', 'Peak resident set size of the last run.', [({}, run['peak_rss_bytes'])])
+    metric('stage_seconds', 'gauge', 'Wall time spent in each stage.', [(stage_labels(e), e['wall_seconds']) for e in run['stages']])
+    metric('stage_cpu_seconds', 'gauge', 'Process CPU time spent in each stage.', [(stage_labels(e), e['cpu_seconds']) for e in run['stages']])
+    metric('stage_calls', 'gauge', 'Times each stage ran.', [(stage_labels(e), e['calls']) for e in run['stages']])
+    metric('stage_peak_rss_bytes', 'gauge', 'Peak resident set size of the process while each stage ran.',
+           [(stage_labels(e), e['peak_rss_bytes']) for e in run['stages'] if e['peak_rss_bytes'] is not None])
+    for counter in COUNTERS:
+        metric(f'stage_{counter}', 'gauge', f"{counter.replace('_', ' ').capitalize()} per stage.",
+               [(stage_labels(e), e[counter]) for e in run['stages']])
+
+    lines.append(f"# HELP {PROMETHEUS_PREFIX}_http_request_seconds HTTP request latency per request type.")
+    lines.append(f"# TYPE {PROMETHEUS_PREFIX}_http_request_seconds summary")
+    for request, entry in run['http'].items():
+        for percent in PERCENTILES:
+            labels = _prometheus_labels({'job': job, 'request': request, 'quantile': percent / 100})
+            lines.append(f"{PROMETHEUS_PREFIX}_http_request_seconds{labels} {entry[f'p{percent}_seconds']}")
+        labels = _prometheus_labels({'job': job, 'request': request})
+        lines.append(f"{PROMETHEUS_PREFIX}_http_request_seconds_sum{labels} {entry['mean_seconds'] * entry['count']}")
+        lines.append(f"{PROMETHEUS_PREFIX}_http_request_seconds_count{labels} {entry['count']}")
+    metric('http_responses', 'gauge', 'HTTP responses per request type and status.',
+           [({'request': request, 'status': status}, count) for request, entry in run['http'].items() for status, count in entry['statuses'].items()])
+
+    return "\n".join(lines) + "\n"
+
+
+def write_report(job: str, metrics_dir: str = METRICS_DIR) -> str:
+    """
+    Write the run report to <metrics_dir>/<job>_<timestamp>.json and
+    <metrics_dir>/<job>.prom, which always holds the latest run.
+    Returns the JSON path.
+    """
+
+    os.makedirs(metrics_dir, exist_ok=True)
+    run = report()
+    json_path = os.path.join(metrics_dir, f"{job}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(json_path, 'w') as f:
+        json.dump(run, f, indent=2)
+
+    # Written to a temporary file first so the textfile collector never reads a partial file
+    prom_path = os.path.join(metrics_dir, f"{job}.prom")
+    with open(f"{prom_path}.tmp", 'w') as f:
+        f.write(prometheus_text(run, job))
+    os.replace(f"{prom_path}.tmp", prom_path)
+
+    slowest = sorted(run['stages'], key=lambda entry: entry['wall_seconds'], reverse=True)[:5]
+    logging.info("Slowest stages: " + ", ".join(
+        f"{entry['stage']}{_prometheus_labels(entry['labels'])} {entry['wall_seconds']:.2f}s" for entry in slowest
+    ))
+    logging.info(f"Saved run metrics to {json_path} and {prom_path}")
+    return json_path
+
+
+@contextmanager
+def profiling(enabled: bool, job: str, metrics_dir: str = METRICS_DIR, top: int = 30):
+    """
+    Run the block under cProfile if enabled. Stats are saved to
+    <metrics_dir>/<job>_<timestamp>.prof (open with pstats or snakeviz) and the
+    top functions by cumulative time are added to the run report.
+    Only the calling thread is profiled; fetch worker threads mostly wait on the network.
+    """
+
+    if not enabled:
+        yield
+        return
+
+    import io
+    import pstats
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(metrics_dir, exist_ok=True)
+        path = os.path.join(metrics_dir, f"{job}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.prof")
+        profiler.dump_stats(path)
+
+        stats = pstats.Stats(profiler, stream=io.StringIO())
+        entries = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+        with _lock:
+            _profile[:] = [
+                {'function': f"{filename}:{line}({function})", 'calls': calls, 'total_seconds': total, 'cumulative_seconds': cumulative}
+                for (filename, line, function), (_, calls, total, cumulative, _) in entries
+            ]
+        logging.info(f"Saved profile to {path}")
@@ -0,0 +1,176 @@
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from config import DEFAULT_ENDPOINTS_PATH
+from synthetic import synthetic_stock, synthetic_statement
+
+
+# logging configuration
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+# Host used by the endpoint templates in config/default_endpoints.json
+FMP_HOST = "https://financialmodelingprep.com"
+
+# FMP path segment for each document type
+ENDPOINT_PATHS = {
+    'historical-price-full': 'stock',
+    'income-statement': 'income_statement',
+    'balance-sheet-statement': 'balance_sheet',
+    'cash-flow-statement': 'cashflow',
+}
+
+
+class MockFMPServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the FMP API serving synthetic payloads.
+
+    latency:     seconds added to every response.
+    error_rate:  fraction of requests answered with 429 Too Many Requests.
+    retry_after: Retry-After value sent with 429 responses, in seconds.
+    days:        trading days in each stock history.
+    periods:     statement periods per symbol, capped by the limit query parameter.
+
+    Payloads are generated once per symbol and document with a per-symbol seed,
+    so every run serves the same data. Stock requests for comma-separated symbols
+    are answered with a historicalStockList, like the FMP API.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency: float = 0.0, error_rate: float = 0.0, retry_after: float = 1.0,
+                 days: int = 252, periods: int = 4, seed: int = 0):
+        super().__init__(address, MockFMPHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.days = days
+        self.periods = periods
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.payloads = {}
+        self.requests = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def payload(self, document: str, symbol: str, periods: int) -> bytes:
+        key = (document, symbol, periods)
+        if key not in self.payloads:
+            rng = random.Random(f"{self.seed}:{document}:{symbol}")
+            if document == 'stock':
+                data = synthetic_stock(symbol, self.days, rng)
+            else:
+                data = synthetic_statement(symbol, document, periods, rng)
+            self.payloads[key] = json.dumps(data).encode()
+        return self.payloads[key]
+
+    def throttle(self) -> bool:
+        with self.lock:
+            self.requests += 1
+            throttled = self.rng.random() < self.error_rate
+            self.throttled += throttled
+            return throttled
+
+
+class MockFMPHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, headers: dict = None) -> None:
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+
+        parts = urlsplit(self.path)
+        segments = parts.path.strip('/').split('/')
+        if len(segments) < 2 or segments[-2] not in ENDPOINT_PATHS:
+            self._send(404, b'{"Error Message": "Unknown endpoint"}')
+            return
+
+        if server.throttle():
+            self._send(429, b'{"Error Message": "Limit Reach"}', {"Retry-After": f"{server.retry_after:g}"})
+            return
+
+        document, symbols = ENDPOINT_PATHS[segments[-2]], segments[-1].split(',')
+        query = parse_qs(parts.query)
+        periods = min(server.periods, int(query.get('limit', [server.periods])[0]))
+        if document == 'stock' and len(symbols) > 1:
+            body = b'{"historicalStockList": [' + b', '.join(server.payload(document, symbol, periods) for symbol in symbols) + b']}'
+        else:
+            body = server.payload(document, symbols[0], periods)
+        self._send(200, body)
+
+
+def start_mock_api(**kwargs) -> MockFMPServer:
+    """
+    Start a MockFMPServer on a free local port in a background thread.
+    Call shutdown() on the returned server to stop it.
+    """
+
+    server = MockFMPServer(**kwargs)
+    threading.Thread(target=server.serve_forever, name="mock-fmp-api", daemon=True).start()
+    logging.info(f"Mock FMP API listening on {server.base_url}")
+    return server
+
+
+def mock_urls(base_url: str, symbols: list, documents: list, query: str = "") -> dict:
+    """
+    {document: {symbol: url}} for the mock API, built from the default endpoint templates.
+    """
+
+    with open(DEFAULT_ENDPOINTS_PATH, 'r') as f:
+        templates = json.load(f)
+
+    return {
+        document: {symbol: templates[document].replace(FMP_HOST, base_url).format(symbol=symbol, query=query) + "mock" for symbol in symbols}
+        for document in documents
+    }
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Serve synthetic FMP payloads locally.")
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--error_rate', type=float, default=0.0, help='Fraction of requests answered with 429')
+    parser.add_argument('--retry_after', type=float, default=1.0, help='Retry-After seconds sent with 429 responses')
+    parser.add_argument('--days', type=int, default=252, help='Trading days of stock history per symbol')
+    parser.add_argument('--periods', type=int, default=4, help='Statement periods per symbol')
+    args = parser.parse_args()
+
+    ''' Example usage:
+    python mock_api.py --port 8765 --latency 0.05 --error_rate 0.02
+
+    Then point config/default_endpoints.json at http://127.0.0.1:8765 instead of https://financialmodelingprep.com
+    '''
+
+    server = MockFMPServer(('127.0.0.1', args.port), latency=args.latency, error_rate=args.error_rate, retry_after=args.retry_after,
+                           days=args.days, periods=args.periods)
+    logging.info(f"Mock FMP API listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
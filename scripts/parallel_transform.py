@@ -0,0 +1,261 @@
+import os
+import sys
+import pickle
+import logging
+from itertools import repeat
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from pandas.api.types import union_categoricals
+from utils import parse_to_dataframes, wide_format, long_format
+from FA_io import load_raw_data, load_raw_frames
+
+
+# logging configuration
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def load_frames(symbols: list, documents: list, folder: str, timestamp=False, storage: str = 'json', data: dict = None) -> dict:
+    """
+    Load raw data for symbols into one DataFrame per document type.
+
+    data: optional payloads already in memory, {document: {symbol: payload}}.
+          Otherwise raw files are read from data/raw/<folder>. Parquet raw data
+          is read straight into DataFrames.
+    """
+
+    if data is not None:
+        # Same layout as load_raw_data: payloads in symbol order, missing ones skipped
+        raw = {document: [data[document][symbol] for symbol in symbols if data[document].get(symbol)]
+               for document in documents if document in data}
+        return parse_to_dataframes({document: payloads for document, payloads in raw.items() if payloads})
+    if storage == 'parquet':
+        return load_raw_frames(symbols=symbols, documents=documents, folder=folder, timestamp=timestamp)
+    return parse_to_dataframes(load_raw_data(symbols=symbols, documents=documents, folder=folder, timestamp=timestamp, storage=storage))
+
+
+def build_frames(dfs: dict, documents: list) -> tuple:
+    """
+    Split parsed frames into (stocks, wide statements, tidy statements).
+    Stock data may be missing if every symbol was already up to date.
+    """
+
+    stocks = dfs.pop('stock', pd.DataFrame())
+    if 'balance_sheet' in documents:
+        return stocks, wide_format(dfs), long_format(dfs)
+    return stocks, pd.DataFrame(), pd.DataFrame()
+
+
+def _untracked_block(size: int) -> SharedMemory:
+    """
+    New shared memory block that this process's resource tracker won't unlink
+    when the process exits. The parent unlinks it once it has copied the frames out.
+    """
+
+    if sys.version_info >= (3, 13):
+        return SharedMemory(create=True, size=size, track=False)
+    shm = SharedMemory(create=True, size=size)
+    # Before 3.13 POSIX blocks are always registered, under the name with its
+    # leading slash. Windows blocks are freed with their last handle and never are.
+    if os.name == 'posix':
+        resource_tracker.unregister(f"/{shm.name}", 'shared_memory')
+    return shm
+
+
+def _share(obj) -> tuple:
+    """
+    Pickle obj with its array buffers out-of-band in one shared memory block,
+    so the parent can map them instead of receiving them through a pipe.
+    """
+
+    buffers = []
+    payload = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+    views = [buffer.raw() for buffer in buffers]
+
+    shm = _untracked_block(max(1, sum(view.nbytes for view in views)))
+    spans = []
+    offset = 0
+    for view in views:
+        shm.buf[offset:offset + view.nbytes] = view
+        spans.append((offset, view.nbytes))
+        offset += view.nbytes
+    name = shm.name
+    shm.close()
+    return payload, name, spans
+
+
+def _unshare(handle: tuple):
+    """
+    Rebuild an object shared with _share. Its arrays are views of the shared
+    memory block, which stays mapped until the returned block is closed.
+    """
+
+    payload, name, spans = handle
+    shm = SharedMemory(name=name)
+    obj = pickle.loads(payload, buffers=[shm.buf[offset:offset + size] for offset, size in spans])
+    return obj, shm
+
+
+def _release(shm: SharedMemory) -> None:
+    try:
+        shm.close()
+    except BufferError:
+        # Still referenced by a view. The mapping is dropped with the last reference.
+        pass
+    shm.unlink()
+
+
+def _tidy_layout(tidy: pd.DataFrame) -> list:
+    """
+    Describe how long_format laid out a tidy frame: for each statement in order,
+    (statement, metrics, rows per metric).
+    """
+
+    if tidy.empty:
+        return []
+    layout = []
+    statement_codes = tidy['statement_type'].cat.codes.to_numpy()
+    metric_codes = tidy['metric'].cat.codes.to_numpy()
+    boundaries = np.flatnonzero(np.diff(statement_codes)) + 1
+    for start, stop in zip(np.r_[0, boundaries], np.r_[boundaries, len(tidy)]):
+        statement = tidy['statement_type'].cat.categories[statement_codes[start]]
+        metrics = list(tidy['metric'].cat.categories[pd.unique(metric_codes[start:stop])])
+        layout.append((statement, metrics, (stop - start) // len(metrics)))
+    return layout
+
+
+def _transform_shard(symbols: list, documents: list, folder: str, timestamp, storage: str) -> tuple:
+    """
+    Worker: load, parse, merge and melt one shard of symbols.
+    """
+
+    stocks, wide, tidy = build_frames(load_frames(symbols, documents, folder, timestamp, storage), documents)
+    return _share((stocks, wide, tidy, _tidy_layout(tidy)))
+
+
+def _concat(frames: list) -> pd.DataFrame:
+    """
+    Concatenate shard frames with identical columns. Columns whose dtype differs
+    between shards (e.g. all missing in one shard) are re-inferred, as parsing the
+    whole universe at once would have done.
+    """
+
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    combined = pd.concat(frames, ignore_index=True)
+    for col in combined.columns:
+        if len({str(frame[col].dtype) for frame in frames}) > 1:
+            combined[col] = combined[col].infer_objects()
+    return combined
+
+
+def _interleave_tidy(tidies: list, layouts: list) -> pd.DataFrame:
+    """
+    Combine shard tidy frames in the row order long_format gives for all symbols
+    at once: by statement, then metric, then symbol.
+    """
+
+    tidies = [tidy for tidy in tidies if not tidy.empty]
+    layouts = [layout for layout in layouts if layout]
+    if not tidies:
+        return pd.DataFrame()
+
+    # Row offset of each shard's (statement, metric) block in the stacked shards
+    statements = list(dict.fromkeys(statement for layout in layouts for statement, _, _ in layout))
+    metrics = {}
+    blocks = []
+    shard_start = 0
+    for tidy, layout in zip(tidies, layouts):
+        offset = shard_start
+        shard_blocks = {}
+        for statement, statement_metrics, rows in layout:
+            metrics.setdefault(statement, statement_metrics)
+            for metric in statement_metrics:
+                shard_blocks[(statement, metric)] = (offset, rows)
+                offset += rows
+        blocks.append(shard_blocks)
+        shard_start += len(tidy)
+
+    order = np.concatenate([
+        np.arange(start, start + rows)
+        for statement in statements
+        for metric in metrics[statement]
+        for start, rows in (shard_blocks[(statement, metric)] for shard_blocks in blocks if (statement, metric) in shard_blocks)
+    ])
+
+    columns = list(dict.fromkeys(col for tidy in tidies for col in tidy.columns))
+    combined = {}
+    for col in columns:
+        parts = []
+        for tidy in tidies:
+            if col in tidy.columns:
+                parts.append(tidy[col].array if isinstance(tidy[col].dtype, pd.CategoricalDtype) else tidy[col].to_numpy())
+            else:
+                missing = np.full(len(tidy), -1, dtype=np.int8)
+                parts.append(pd.Categorical.from_codes(missing, categories=pd.Index([], dtype=object)))
+        if col in ('date', 'value'):
+            combined[col] = np.concatenate(parts)[order]
+        else:
+            merged = union_categoricals(parts, sort_categories=col not in ('metric', 'statement_type'))
+            combined[col] = pd.Categorical.from_codes(merged.codes[order], categories=merged.categories)
+    return pd.DataFrame(combined, columns=columns, copy=False)
+
+
+def _consistent(frames: list, layouts: list) -> bool:
+    """
+    True if every shard produced the same columns for each frame and the same
+    metrics per statement.
+    """
+
+    for shard_frames in zip(*frames):
+        if len({tuple(frame.columns) for frame in shard_frames if not frame.empty}) > 1:
+            return False
+    metrics = {}
+    for layout in layouts:
+        for statement, statement_metrics, _ in layout:
+            if metrics.setdefault(statement, statement_metrics) != statement_metrics:
+                return False
+    return True
+
+
+def parallel_frames(symbols: list, documents: list, folder: str, timestamp=False, storage: str = 'json', workers: int = 2) -> tuple:
+    """
+    Build (stocks, wide statements, tidy statements) with a process pool.
+
+    Symbols are split into contiguous shards, one per worker. Each worker reads
+    its own raw files, parses, merges and melts them, and hands the frames back
+    through shared memory. The shards are then combined into exactly the frames
+    a single process would build. If shards disagree on columns (e.g. a field
+    only some symbols report), the universe is transformed in-process instead.
+    """
+
+    shard_size = -(-len(symbols) // workers)
+    shards = [symbols[start:start + shard_size] for start in range(0, len(symbols), shard_size)]
+    logging.info(f"Transforming {len(symbols)} symbols in {len(shards)} shards of up to {shard_size}...")
+
+    with ProcessPoolExecutor(max_workers=len(shards)) as executor:
+        handles = list(executor.map(_transform_shard, shards, repeat(documents), repeat(folder), repeat(timestamp), repeat(storage)))
+
+    results, blocks = [], []
+    try:
+        for handle in handles:
+            result, shm = _unshare(handle)
+            results.append(result)
+            blocks.append(shm)
+
+        stocks, wides, tidies, layouts = zip(*results)
+        if not _consistent([result[:3] for result in results], layouts):
+            logging.warning("Shards have different statement columns. Transforming in a single process.")
+            return build_frames(load_frames(symbols, documents, folder, timestamp, storage), documents)
+        return _concat(list(stocks)), _concat(list(wides)), _interleave_tidy(list(tidies), list(layouts))
+    finally:
+        # The combined frames are copies, so the shared blocks can be released
+        results = result = stocks = wides = tidies = None
+        for shm in blocks:
+            _release(shm)
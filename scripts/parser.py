@@ -1,8 +1,9 @@
 import argparse
-import yaml
 import logging
 from datetime import datetime
 from datetime import datetime
+from config import DEFAULT_CONCURRENCY, DEFAULT_MAX_RETRIES, DEFAULT_SYMBOLS_PER_REQUEST, STORAGE_OPTIONS, OUTPUT_FORMATS, LOAD_MODES, INDICATOR_ENGINES
+from rate_limiter import API_TIERS
 
 # logging configuration
 logging.basicConfig(
@@ -11,6 +12,28 @@ logging.basicConfig(
 )
 
 
+# Defaults for optional tuning arguments
+OPTION_DEFAULTS = {
+    'concurrency': DEFAULT_CONCURRENCY,
+    'tier': None,
+    'rate_limit': None,
+    'max_retries': DEFAULT_MAX_RETRIES,
+    'symbols_per_request': DEFAULT_SYMBOLS_PER_REQUEST,
+    'no_cache': False,
+    'refresh': False,
+    'incremental': False,
+    'storage': 'json',
+    'output_format': 'csv',
+    'load_mode': None,
+    'engine': 'postgres',
+    'batch_size': None,
+    'workers': 1,
+    'pipeline': False,
+    'profile': False,
+    'snapshot': None,
+}
+
+
 def get_parser_args():
     parser = argparse.ArgumentParser(description="Fetch data from FMP API.")
 
@@ -26,6 +49,25 @@ def get_parser_args():
     parser.add_argument('--save_to', help='Folder name to save data. Lowercase letters, numbers, and underscores only. This will be used as SQL table name prefix.')
     parser.add_argument('--timestamp', action='store_true', help='Adds timestamp to saved file names. Use for scheduled jobs.')
 
+    # Add optional tuning arguments. These can also be set in the yaml config file.
+    parser.add_argument('--concurrency', type=int, help=f'Maximum number of API requests in flight. Default: {OPTION_DEFAULTS["concurrency"]}')
+    parser.add_argument('--tier', choices=list(API_TIERS), help='FMP plan used to set the request rate limit. Default: no client-side limit, only 429 backoff')
+    parser.add_argument('--rate_limit', type=float, help='Requests per minute. Overrides the rate set by --tier.')
+    parser.add_argument('--max_retries', type=int, help=f'Retries for throttled or failed requests. Default: {OPTION_DEFAULTS["max_retries"]}')
+    parser.add_argument('--symbols_per_request', type=int, help=f'Symbols per stock price request. Stock prices are fetched for several symbols per call and split per symbol. 1 disables batching. Default: {OPTION_DEFAULTS["symbols_per_request"]}')
+    parser.add_argument('--no-cache', dest='no_cache', action='store_true', default=None, help='Do not read or write the HTTP response cache in data/cache.')
+    parser.add_argument('--refresh', action='store_true', default=None, help='Ignore cached responses and refetch everything. Fresh responses are still cached.')
+    parser.add_argument('--storage', choices=STORAGE_OPTIONS, help='Raw data format. "parquet" writes columnar files partitioned by document and symbol. "gzip" writes compressed JSON, storing identical payloads once. Default: json')
+    parser.add_argument('--output_format', choices=list(OUTPUT_FORMATS), help='Processed data format. "arrow" writes memory-mappable Arrow IPC files, "none" skips processed files. Default: csv')
+    parser.add_argument('--load_mode', choices=LOAD_MODES, help='How SQL tables are loaded. "upsert" merges on (symbol, date[, metric]) keys and only writes changed rows. Default: append with --timestamp, replace otherwise')
+    parser.add_argument('--engine', choices=INDICATOR_ENGINES, help='Where statement indicators are computed. "local" uses vectorized pandas instead of a PostgreSQL round-trip. Default: postgres')
+    parser.add_argument('--batch_size', type=int, help='Run fetch, transform and load for this many symbols at a time, committing each batch. Default: all symbols at once')
+    parser.add_argument('--workers', type=int, help='Processes used to parse and reshape raw data, each handling a shard of symbols. Default: 1')
+    parser.add_argument('--pipeline', action='store_true', default=None, help='Transform and load symbols as their responses arrive instead of after all fetching is done. Chunk size: --batch_size, default 100')
+    parser.add_argument('--incremental', action='store_true', default=None, help='Only fetch stock prices newer than the latest stored date for each symbol. Requires --timestamp.')
+    parser.add_argument('--snapshot', help='Raw snapshot transform.py loads: a timestamp (yyyymmdd_hhmmss) or "latest" for each symbol\'s most recent snapshot in the raw manifest. Default: the run\'s own timestamp')
+    parser.add_argument('--profile', action='store_true', default=None, help='Profile the run with cProfile. Stats are saved next to the run metrics in data/metrics.')
+
     args = parser.parse_args()
 
     # If using manual input, enforce following arguments
@@ -37,11 +79,59 @@ def get_parser_args():
     return args
 
 
+def parse_options(args, config: dict = None) -> dict:
+    '''
+    Collect optional tuning arguments. CLI arguments take precedence over the yaml
+    config, which takes precedence over the defaults. Options are removed from
+    config so the remaining keys can be passed to parse_inputs.
+    '''
+
+    config = config if config is not None else {}
+    options = {}
+    for option, default in OPTION_DEFAULTS.items():
+        value = config.pop(option, None)
+        if getattr(args, option, None) is not None:
+            value = getattr(args, option)
+        options[option] = default if value is None else value
+
+    if options['concurrency'] < 1:
+        raise ValueError("concurrency must be a positive integer")
+    if options['tier'] is not None and options['tier'] not in API_TIERS:
+        raise KeyError(f"Did not recognize {options['tier']} tier argument. Options: {list(API_TIERS)}")
+    if options['rate_limit'] is not None and options['rate_limit'] <= 0:
+        raise ValueError("rate_limit must be a positive number of requests per minute")
+    if options['max_retries'] < 0:
+        raise ValueError("max_retries must be zero or a positive integer")
+    if options['symbols_per_request'] < 1:
+        raise ValueError("symbols_per_request must be a positive integer")
+    if options['batch_size'] is not None and options['batch_size'] < 1:
+        raise ValueError("batch_size must be a positive integer")
+    if options['workers'] < 1:
+        raise ValueError("workers must be a positive integer")
+    if options['storage'] not in STORAGE_OPTIONS:
+        raise KeyError(f"Did not recognize {options['storage']} storage argument. Options: {STORAGE_OPTIONS}")
+    if options['load_mode'] is not None and options['load_mode'] not in LOAD_MODES:
+        raise KeyError(f"Did not recognize {options['load_mode']} load_mode argument. Options: {LOAD_MODES}")
+    if options['engine'] not in INDICATOR_ENGINES:
+        raise KeyError(f"Did not recognize {options['engine']} engine argument. Options: {INDICATOR_ENGINES}")
+    if options['output_format'] not in OUTPUT_FORMATS:
+        raise KeyError(f"Did not recognize {options['output_format']} output_format argument. Options: {list(OUTPUT_FORMATS)}")
+    if options['snapshot'] is not None and options['snapshot'] != 'latest':
+        try:
+            datetime.strptime(options['snapshot'], "%Y%m%d_%H%M%S")
+        except ValueError:
+            raise ValueError("snapshot must be 'latest' or a timestamp like 20250525_134538")
+
+    return options
+
+
 def load_config(path: str):
     '''
     Load parser arguments from yaml config file
     '''
 
+    import yaml
+
     if not path.endswith(('.yaml', '.yml')):
         logging.warning("Config file does not end with .yaml or .yml. Is this correct?")
 
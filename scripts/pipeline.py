@@ -0,0 +1,180 @@
+import queue
+import logging
+import threading
+from typing import List
+import transform
+from extract import request_urls
+from fmp_client import iter_fetch, url_symbols
+from rate_limiter import get_rate_limiter
+from http_cache import ResponseCache
+from FA_io import save_raw_data
+from metrics import stage
+
+
+# logging configuration
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+# Symbols transformed and loaded together when no batch size is given
+DEFAULT_CHUNK_SIZE = 100
+
+# Marks the end of a queue
+_DONE = object()
+
+
+class RawWriter:
+    """
+    Background thread that saves raw responses to data/raw, so file writes stay
+    off the fetch → transform path.
+    """
+
+    def __init__(self, save_to: str, timestamp=False, storage: str = 'json'):
+        self.save_to = save_to
+        self.timestamp = timestamp
+        self.storage = storage
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="raw-writer", daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is _DONE:
+                return
+            request, symbol, data = item
+            try:
+                save_raw_data({request: {symbol: data}}, symbols=[symbol], requests=[request], save_to=self.save_to, timestamp=self.timestamp, storage=self.storage)
+            except Exception as e:
+                logging.error(f"Failed to save raw {request} for {symbol}: {e}")
+
+    def write(self, request: str, symbol: str, data) -> None:
+        self.queue.put((request, symbol, data))
+
+    def close(self) -> None:
+        """
+        Wait for queued files to be written.
+        """
+
+        self.queue.put(_DONE)
+        self.thread.join()
+
+
+def _produce(urls: dict, fetched: queue.Queue, stop: threading.Event, **kwargs) -> None:
+    """
+    Producer thread: push (request, symbol, data) onto fetched as responses complete.
+    Ends with _DONE, or with the exception that stopped it.
+    """
+
+    responses = iter_fetch(urls, **kwargs)
+    try:
+        with stage('fetch', pipeline=True) as counts:
+            counts['rows_in'] = sum(len(url_symbols(urls[request])) for request in urls)
+            for item in responses:
+                counts['rows_out'] += bool(item[2])
+                fetched.put(item)
+                if stop.is_set():
+                    break
+    except Exception as e:
+        fetched.put(e)
+    finally:
+        responses.close()
+        fetched.put(_DONE)
+
+
+def main(symbols: List[str], requests: List[str], queries: dict, save_to: str, timestamp, options: dict) -> None:
+    """
+    Run extract and transform as a pipeline.
+
+    A producer thread fetches every url and pushes completed responses onto an
+    in-memory queue. As soon as all requests for a symbol have completed, the
+    symbol is ready, and every chunk of ready symbols is parsed and loaded while
+    the remaining requests are still in flight. Raw files are written by a
+    background thread.
+
+    The chunk size is options['batch_size'], or DEFAULT_CHUNK_SIZE. Like batches
+    in ETL.py, the first chunk uses the chosen load mode and 'replace' becomes
+    'append' for later chunks. Processed files get a _batch<N> suffix per chunk.
+    """
+
+    chunk_size = options['batch_size'] or DEFAULT_CHUNK_SIZE
+    load_mode = options['load_mode'] or ('append' if timestamp else 'replace')
+
+    urls = request_urls(symbols, requests, queries, save_to, timestamp, options['incremental'], options['symbols_per_request'])
+    limiter = get_rate_limiter(options['tier'], options['rate_limit'])
+    cache = ResponseCache(refresh=options['refresh']) if not options['no_cache'] else None
+
+    # Requests each symbol is waiting on. Symbols with nothing to fetch are ready at once.
+    requested = {request: set(url_symbols(urls[request])) for request in urls}
+    expected = {symbol: sum(symbol in requested[request] for request in requested) for symbol in symbols}
+    position = {symbol: i for i, symbol in enumerate(symbols)}
+    responses = {symbol: {} for symbol in symbols}
+    ready = [symbol for symbol in symbols if expected[symbol] == 0]
+
+    # Bounded so fetching pauses if transforms fall behind, which keeps memory flat
+    fetched = queue.Queue(maxsize=4 * chunk_size)
+    stop = threading.Event()
+    writer = RawWriter(save_to, timestamp, options['storage']) if save_to.lower() != "none" else None
+    producer = threading.Thread(
+        target=_produce, args=(urls, fetched, stop), name="fetch-producer", daemon=True,
+        kwargs={'concurrency': options['concurrency'], 'limiter': limiter, 'max_retries': options['max_retries'], 'cache': cache}
+    )
+
+    chunks = 0
+
+    def flush(chunk: list) -> None:
+        nonlocal chunks, load_mode
+        chunks += 1
+        chunk = sorted(chunk, key=position.get)
+        data = {request: {symbol: responses[symbol].get(request) for symbol in chunk} for request in requests}
+        logging.info(f"Pipeline chunk {chunks}: transforming {len(chunk)} symbols while fetching continues.")
+        transform.main(symbols=chunk, documents=requests, load_from=save_to, timestamp=timestamp, storage=options['storage'],
+                       output_format=options['output_format'], load_mode=load_mode, indicator_engine=options['engine'], data=data, batch=chunks)
+        for symbol in chunk:
+            del responses[symbol]
+        if load_mode == 'replace':
+            load_mode = 'append'
+
+    producer.start()
+    try:
+        while True:
+            item = fetched.get()
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+
+            request, symbol, symbol_data = item
+            if symbol_data:
+                responses[symbol][request] = symbol_data
+                if writer:
+                    writer.write(request, symbol, symbol_data)
+                logging.info(f"Fetched {request} for {symbol}")
+            else:
+                logging.warning(f"No {request} found for {symbol}.")
+
+            expected[symbol] -= 1
+            if expected[symbol] == 0:
+                ready.append(symbol)
+            if len(ready) >= chunk_size:
+                flush(ready)
+                ready = []
+
+        if ready:
+            flush(ready)
+    finally:
+        stop.set()
+        # Unblock the producer if it is waiting on a full queue
+        while producer.is_alive():
+            try:
+                fetched.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        if writer:
+            writer.close()
+
+    if cache:
+        logging.info(f"HTTP cache: {cache.hits} hits, {cache.misses} misses.")
+        cache.prune()
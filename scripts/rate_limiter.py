@@ -0,0 +1,176 @@
+import time
+import random
+import logging
+import threading
+
+
+# FMP plan quotas: (requests per second, bucket capacity).
+# The free plan is a daily quota, the paid plans are per minute.
+API_TIERS = {
+    'free': (250 / 86400, 250),
+    'starter': (300 / 60, 10),
+    'premium': (750 / 60, 25),
+    'ultimate': (3000 / 60, 100),
+}
+
+# Backoff settings for retried requests
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+
+# 429 responses never lower the request rate below this many per second,
+# unless the plan's own rate is lower. Retry-After pauses still apply.
+MIN_BACKOFF_RATE = 1.0
+
+# Waits for a token longer than LONG_WAIT seconds are logged. A run whose requests
+# would wait longer than MAX_RUN_WAIT seconds in total fails before fetching.
+LONG_WAIT = 5.0
+MAX_RUN_WAIT = 3600.0
+
+# Buckets shared by every fetch in this process, keyed by (tier, rate_limit)
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+class QuotaExceededError(RuntimeError):
+    """
+    A run's requests would take longer than MAX_RUN_WAIT at the configured rate.
+    """
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by all fetch workers.
+
+    The fill rate starts at the tier ceiling. A 429 response halves it and pauses
+    the bucket for the Retry-After period; every successful request nudges it
+    back up towards the ceiling.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.max_rate = rate
+        self.min_rate = min(rate, max(rate / 32, MIN_BACKOFF_RATE))
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.last_backoff = 0.0
+        self.last_warning = float('-inf')
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self) -> None:
+        """
+        Block until a token is available and take it.
+        """
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+                # One warning a minute, however many workers are waiting
+                warn = wait > LONG_WAIT and now - self.last_warning >= 60
+                if warn:
+                    self.last_warning = now
+            if warn:
+                logging.warning(f"Rate limiter waiting {wait:.0f}s for the next request ({self.rate * 60:.2f}/min). "
+                                f"If your FMP plan allows more, set --tier or --rate_limit.")
+            time.sleep(wait)
+
+    def check_run(self, requests: int) -> None:
+        """
+        Before a run: raise QuotaExceededError if requests would wait longer than
+        MAX_RUN_WAIT for tokens at the current rate, warn if longer than LONG_WAIT.
+        """
+
+        with self.lock:
+            self._refill(time.monotonic())
+            wait = max(0.0, (requests - self.tokens) / self.rate)
+        if wait > MAX_RUN_WAIT:
+            raise QuotaExceededError(
+                f"{requests} requests would take about {wait / 3600:.1f}h at {self.rate * 60:.2f} requests/min. "
+                f"Fetch fewer symbols, or set --tier or --rate_limit to match your FMP plan."
+            )
+        if wait > LONG_WAIT:
+            logging.warning(f"{requests} requests will take about {wait:.0f}s at {self.rate * 60:.2f} requests/min.")
+
+    def throttled(self, retry_after: float = None) -> None:
+        """
+        Record a 429 response: back off multiplicatively and honour Retry-After.
+        Requests in flight when the limit was hit all come back throttled, so the
+        rate is only lowered once per second.
+        """
+
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens = 0
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+            if now - self.last_backoff >= 1.0:
+                self.last_backoff = now
+                self.rate = max(self.min_rate, self.rate / 2)
+                logging.warning(f"Rate limited by API. Lowering request rate to {self.rate * 60:.1f}/min.")
+
+    def succeeded(self) -> None:
+        """
+        Record a successful response: recover the rate additively.
+        """
+
+        with self.lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 64)
+
+
+def get_rate_limiter(tier: str = None, rate_limit: float = None) -> TokenBucket:
+    """
+    Return the token bucket for an FMP plan, or None if neither tier nor rate_limit
+    is set: requests are then only limited by concurrency and 429 retries.
+    Repeated calls with the same settings share one bucket, so fetching in batches
+    cannot exceed the quota.
+
+    tier:       one of API_TIERS.
+    rate_limit: optional requests per minute, overrides the tier rate.
+    """
+
+    if tier is None and rate_limit is None:
+        return None
+    if tier is not None and tier not in API_TIERS:
+        raise KeyError(f"Did not recognize {tier} API tier. Options: {list(API_TIERS)}")
+
+    with _limiters_lock:
+        if (tier, rate_limit) not in _limiters:
+            rate, capacity = API_TIERS[tier] if tier is not None else (rate_limit / 60, rate_limit / 30)
+            if rate_limit:
+                rate = rate_limit / 60
+                capacity = max(1, min(capacity, rate_limit / 30))
+            _limiters[(tier, rate_limit)] = TokenBucket(rate, capacity)
+        return _limiters[(tier, rate_limit)]
+
+
+def reset_rate_limiters() -> None:
+    """
+    Forget shared buckets, e.g. between benchmark runs so throttling in one run
+    doesn't slow the next.
+    """
+
+    with _limiters_lock:
+        _limiters.clear()
+
+
+def backoff_delay(attempt: int, retry_after: float = None) -> float:
+    """
+    Seconds to wait before retry number attempt (1-based). Uses the server's
+    Retry-After when given, otherwise exponential backoff with full jitter.
+    """
+
+    if retry_after:
+        return retry_after + random.uniform(0, BACKOFF_BASE)
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
@@ -0,0 +1,356 @@
+import os
+import re
+import json
+import sqlite3
+import hashlib
+import logging
+import argparse
+from datetime import datetime
+from config import DATA_DIR
+
+
+# logging configuration
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+# Index of every raw snapshot saved under data/raw
+MANIFEST_PATH = os.path.join(DATA_DIR, "raw", "manifest.sqlite")
+
+# Pass as timestamp to load each symbol's most recent snapshot
+LATEST = 'latest'
+
+COLUMNS = ['folder', 'symbol', 'document', 'timestamp', 'storage', 'path', 'first_date', 'last_date', 'records', 'bytes', 'sha256', 'saved_at']
+
+
+def connect(path: str = MANIFEST_PATH) -> sqlite3.Connection:
+    """
+    Open the manifest, creating it if needed. Rows come back as sqlite3.Row.
+
+    One row per snapshot file, keyed by (folder, symbol, document, timestamp, storage).
+    timestamp is '' for files saved without one, and path is relative to data/raw/<folder>.
+    first_date and last_date are the period the snapshot covers.
+    """
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS snapshots (
+            folder TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            document TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            storage TEXT NOT NULL,
+            path TEXT NOT NULL,
+            first_date TEXT,
+            last_date TEXT,
+            records INTEGER,
+            bytes INTEGER,
+            sha256 TEXT,
+            saved_at TEXT NOT NULL,
+            PRIMARY KEY (folder, symbol, document, timestamp, storage)
+        );
+        CREATE INDEX IF NOT EXISTS snapshots_latest ON snapshots (folder, document, symbol, saved_at);
+        CREATE INDEX IF NOT EXISTS snapshots_coverage ON snapshots (folder, document, last_date, first_date);
+    """)
+    return conn
+
+
+def describe(symbol: str, document: str, symbol_data, content: bytes) -> dict:
+    """
+    Manifest fields describing one payload: period coverage, record count, size and content hash.
+    """
+
+    records = symbol_data.get('historical', []) if document == 'stock' and isinstance(symbol_data, dict) else symbol_data
+    dates = [record['date'] for record in records if isinstance(record, dict) and record.get('date')] if isinstance(records, list) else []
+    return {
+        'symbol': symbol,
+        'document': document,
+        'first_date': min(dates) if dates else None,
+        'last_date': max(dates) if dates else None,
+        'records': len(records) if isinstance(records, list) else 0,
+        'bytes': len(content),
+        'sha256': hashlib.sha256(content).hexdigest(),
+    }
+
+
+def record_snapshots(folder: str, snapshots: list, timestamp=False, storage: str = 'json', path: str = MANIFEST_PATH) -> None:
+    """
+    Add or update snapshots, each a describe() dict with a 'path', in one transaction.
+    """
+
+    if not snapshots:
+        return
+    saved_at = datetime.now().isoformat(timespec='microseconds')
+    rows = [{**snapshot, 'folder': folder, 'timestamp': timestamp or '', 'storage': storage, 'saved_at': saved_at} for snapshot in snapshots]
+    conn = connect(path)
+    try:
+        with conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO snapshots ({', '.join(COLUMNS)}) VALUES ({', '.join(':' + col for col in COLUMNS)});",
+                rows
+            )
+    finally:
+        conn.close()
+
+
+def latest_snapshots(folder: str, symbols: list = None, documents: list = None, storage: str = None, path: str = MANIFEST_PATH) -> dict:
+    """
+    Most recently saved snapshot for each symbol and document, in one query.
+    Returns {document: {symbol: row}}.
+    """
+
+    filters, params = _filters(folder, symbols, documents, storage)
+    conn = connect(path)
+    try:
+        rows = conn.execute(f"""
+            SELECT * FROM (
+                SELECT *, ROW_NUMBER() OVER (PARTITION BY document, symbol ORDER BY saved_at DESC, timestamp DESC) AS rank
+                FROM snapshots WHERE {filters}
+            ) WHERE rank = 1;
+        """, params).fetchall()
+    finally:
+        conn.close()
+
+    latest = {}
+    for row in rows:
+        latest.setdefault(row['document'], {})[row['symbol']] = row
+    return latest
+
+
+def find_snapshots(folder: str, symbols: list, documents: list, timestamp=False, storage: str = None, path: str = MANIFEST_PATH) -> dict:
+    """
+    Snapshots saved with timestamp (False for none) for each symbol and document.
+    Returns {document: {symbol: row}}.
+    """
+
+    filters, params = _filters(folder, symbols, documents, storage)
+    conn = connect(path)
+    try:
+        rows = conn.execute(f"SELECT * FROM snapshots WHERE {filters} AND timestamp = ?;", params + [timestamp or '']).fetchall()
+    finally:
+        conn.close()
+
+    found = {}
+    for row in rows:
+        found.setdefault(row['document'], {})[row['symbol']] = row
+    return found
+
+
+def snapshots_between(folder: str, start: str, end: str, symbols: list = None, documents: list = None, storage: str = None,
+                      path: str = MANIFEST_PATH) -> list:
+    """
+    Snapshots whose data covers any day between start and end (yyyy-mm-dd), oldest first.
+    """
+
+    filters, params = _filters(folder, symbols, documents, storage)
+    conn = connect(path)
+    try:
+        return conn.execute(f"""
+            SELECT * FROM snapshots
+            WHERE {filters} AND first_date <= ? AND last_date >= ?
+            ORDER BY symbol, document, saved_at;
+        """, params + [end, start]).fetchall()
+    finally:
+        conn.close()
+
+
+def latest_dates(folder: str, document: str = 'stock', symbols: list = None, path: str = MANIFEST_PATH) -> dict:
+    """
+    Latest date covered by any snapshot of document whose file still exists, per
+    symbol. Returns {symbol: "yyyy-mm-dd"}. Symbols whose files were all deleted
+    are left out, so callers fall back to what is actually on disk.
+    """
+
+    filters, params = _filters(folder, symbols, [document], None)
+    conn = connect(path)
+    try:
+        rows = conn.execute(f"""
+            SELECT symbol, path, last_date FROM snapshots
+            WHERE {filters} AND last_date IS NOT NULL
+            ORDER BY symbol, last_date DESC;
+        """, params).fetchall()
+    finally:
+        conn.close()
+
+    # Usually one existence check per symbol: its newest snapshot
+    raw_dir = os.path.join(DATA_DIR, "raw", folder)
+    latest = {}
+    for row in rows:
+        if row['symbol'] not in latest and os.path.exists(os.path.join(raw_dir, row['path'])):
+            latest[row['symbol']] = row['last_date']
+    return latest
+
+
+def _filters(folder: str, symbols: list, documents: list, storage: str) -> tuple:
+    filters, params = ["folder = ?"], [folder]
+    for column, values in [('symbol', symbols), ('document', documents)]:
+        if values is not None:
+            filters.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params += list(values)
+    if storage is not None:
+        filters.append("storage = ?")
+        params.append(storage)
+    return " AND ".join(filters), params
+
+
+def referenced_paths(folder: str, paths: list = None, path: str = MANIFEST_PATH) -> set:
+    """
+    Paths of folder referenced by any snapshot, optionally only those among paths.
+    """
+
+    conn = connect(path)
+    try:
+        if paths is None:
+            rows = conn.execute("SELECT DISTINCT path FROM snapshots WHERE folder = ?;", [folder]).fetchall()
+        else:
+            rows = conn.execute(f"SELECT DISTINCT path FROM snapshots WHERE folder = ? AND path IN ({', '.join('?' * len(paths))});",
+                                [folder] + list(paths)).fetchall()
+    finally:
+        conn.close()
+    return {row['path'] for row in rows}
+
+
+def prune(folder: str, path: str = MANIFEST_PATH) -> tuple:
+    """
+    Delete gzip objects in data/raw/<folder>/objects that no ref file or manifest
+    row references, e.g. left behind by runs saved without a timestamp before
+    save_raw_data cleaned them up. Returns (objects deleted, bytes freed).
+    Don't run it while an ETL run is saving to the folder.
+    """
+
+    raw_dir = os.path.join(DATA_DIR, "raw", folder)
+    referenced = referenced_paths(folder, path=path)
+    for root, _, filenames in os.walk(os.path.join(raw_dir, "refs")):
+        for filename in filenames:
+            if filename.endswith('.ref.json'):
+                with open(os.path.join(root, filename), 'r') as f:
+                    referenced.add(json.load(f)['path'])
+
+    deleted, freed = 0, 0
+    for root, _, filenames in os.walk(os.path.join(raw_dir, "objects")):
+        for filename in filenames:
+            full_path = os.path.join(root, filename)
+            if filename.endswith('.json.gz') and os.path.relpath(full_path, raw_dir) not in referenced:
+                freed += os.path.getsize(full_path)
+                os.remove(full_path)
+                deleted += 1
+    logging.info(f"Deleted {deleted} unreferenced objects ({freed} bytes) from {raw_dir}")
+    return deleted, freed
+
+
+def forget(folder: str, path: str = MANIFEST_PATH) -> int:
+    """
+    Remove every snapshot of folder, e.g. after deleting data/raw/<folder>.
+    Returns the number of snapshots removed.
+    """
+
+    conn = connect(path)
+    try:
+        with conn:
+            removed = conn.execute("DELETE FROM snapshots WHERE folder = ?;", [folder]).rowcount
+    finally:
+        conn.close()
+    logging.info(f"Removed {removed} snapshots of {folder} from the manifest")
+    return removed
+
+
+def rebuild(folder: str, path: str = MANIFEST_PATH) -> int:
+    """
+    Index the snapshots already in data/raw/<folder>, e.g. files saved before the
+    manifest existed or after a failed manifest write. Returns the number of
+    snapshots indexed.
+
+    gzip snapshots are restored from their ref files (refs/<symbol>/*.ref.json).
+    Objects saved before ref files existed can't be rebuilt: which timestamps
+    reference them was only recorded in the manifest.
+    """
+
+    raw_dir = os.path.join(DATA_DIR, "raw", folder)
+    pattern = re.compile(r"^(?P<symbol>.+?)_(?P<document>stock|income_statement|balance_sheet|cashflow)(?:_(?P<timestamp>\d{8}_\d{6}))?\.(?P<ext>ref\.json|json|parquet)$")
+    found = {}
+
+    for root, _, filenames in os.walk(raw_dir):
+        for filename in filenames:
+            full_path = os.path.join(root, filename)
+            relative = os.path.relpath(full_path, raw_dir)
+            if filename.endswith('.ref.json'):
+                match = pattern.match(filename)
+                if not match:
+                    continue
+                with open(full_path, 'r') as f:
+                    snapshot = json.load(f)
+                found.setdefault((match['timestamp'] or '', 'gzip'), []).append(snapshot)
+                continue
+            elif filename.endswith('.json'):
+                match = pattern.match(filename)
+                if not match:
+                    continue
+                with open(full_path, 'rb') as f:
+                    content = f.read()
+                snapshot = describe(match['symbol'], match['document'], json.loads(content), content)
+                storage = 'json'
+            elif filename.endswith('.parquet') and os.sep + "symbol=" in os.sep + os.path.dirname(relative):
+                # parquet/document=<document>/symbol=<symbol>/<document>[_<timestamp>].parquet
+                symbol = os.path.basename(root).split('=', 1)[1]
+                match = pattern.match(f"{symbol}_{filename}")
+                if not match:
+                    continue
+                import pandas as pd
+                with open(full_path, 'rb') as f:
+                    content = f.read()
+                dates = pd.read_parquet(full_path, columns=None)
+                snapshot = describe(symbol, match['document'], [], content)
+                if 'date' in dates.columns and not dates.empty:
+                    snapshot.update(first_date=str(dates['date'].min())[:10], last_date=str(dates['date'].max())[:10])
+                snapshot['records'] = len(dates)
+                storage = 'parquet'
+            else:
+                continue
+            snapshot['path'] = relative
+            found.setdefault((match['timestamp'] or '', storage), []).append(snapshot)
+
+    for (timestamp, storage), snapshots in found.items():
+        record_snapshots(folder, snapshots, timestamp, storage, path)
+    total = sum(len(snapshots) for snapshots in found.values())
+    logging.info(f"Indexed {total} raw snapshots in {raw_dir}")
+    return total
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Inspect or rebuild the raw snapshot manifest.")
+    parser.add_argument('--folder', required=True, help='Raw data folder name under data/raw')
+    parser.add_argument('--forget', action='store_true', help='Remove the folder from the manifest, before --rebuild if both are given')
+    parser.add_argument('--rebuild', action='store_true', help='Index snapshots already saved in the folder')
+    parser.add_argument('--symbols', nargs='+', help='Only show these symbols')
+    parser.add_argument('--prune', action='store_true', help='Delete gzip objects no snapshot references')
+    parser.add_argument('--between', nargs=2, metavar=('START', 'END'), help='List snapshots covering dates between START and END (yyyy-mm-dd)')
+    args = parser.parse_args()
+
+    ''' Example usage:
+    python raw_manifest.py --folder test --rebuild
+    python raw_manifest.py --folder test --forget --rebuild
+    python raw_manifest.py --folder test --symbols AAPL
+    python raw_manifest.py --folder test --between 2025-01-01 2025-03-31
+    python raw_manifest.py --folder test --prune
+    '''
+
+    if args.forget:
+        forget(args.folder)
+    if args.rebuild:
+        rebuild(args.folder)
+    if args.prune:
+        prune(args.folder)
+
+    if args.between:
+        rows = snapshots_between(args.folder, *args.between, symbols=args.symbols)
+    else:
+        rows = [row for symbols in latest_snapshots(args.folder, args.symbols).values() for row in symbols.values()]
+    for row in rows:
+        print(f"{row['symbol']:<8} {row['document']:<17} {row['timestamp'] or '-':<16} {row['first_date'] or '':<10} to {row['last_date'] or '':<10} "
+              f"{row['records']:>6} records {row['bytes']:>9} bytes  {row['path']}")
@@ -0,0 +1,188 @@
+import re
+import time
+import signal
+import logging
+import argparse
+import threading
+from datetime import datetime
+from parser import load_config, parse_inputs, parse_options
+
+
+# logging configuration
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+# Seconds per interval unit, e.g. "15m" or "1d"
+INTERVAL_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_interval(value) -> float:
+    """
+    Interval in seconds from a number of seconds or a string like "90s", "15m", "6h" or "1d".
+    """
+
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        seconds = float(value)
+    else:
+        match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smhd])\s*", str(value))
+        if not match:
+            raise ValueError(f"Did not recognize interval {value!r}. Use seconds or a number followed by s, m, h or d")
+        seconds = float(match[1]) * INTERVAL_UNITS[match[2]]
+    if seconds <= 0:
+        raise ValueError(f"Interval {value!r} must be positive")
+    return seconds
+
+
+def load_schedule(path: str) -> list:
+    """
+    Load jobs from a yaml schedule:
+
+        defaults:          # ETL config keys shared by every job
+          symbols: [AAPL, MSFT]
+          save_to: prod
+        jobs:
+          prices:
+            every: 15m     # required
+            requests: [stocks]
+          statements:
+            every: 1d
+            requests: [statements]
+
+    Each job's keys override the defaults. Any key accepted by ETL.py --config
+    can be used. Returns [{'name', 'every', 'config'}], validated up front so a
+    bad schedule fails at startup rather than at the first run of a job.
+    """
+
+    schedule = load_config(path) or {}
+    defaults = schedule.get('defaults') or {}
+    jobs = []
+
+    if not schedule.get('jobs'):
+        raise KeyError(f"No jobs found in {path}")
+
+    for name, job in schedule['jobs'].items():
+        job = dict(job or {})
+        if 'every' not in job:
+            raise KeyError(f"Job {name} has no 'every' interval")
+        every = parse_interval(job.pop('every'))
+        config = {**defaults, **job}
+
+        # Same checks as an ETL.py --config run
+        check = dict(config)
+        parse_options(None, check)
+        parse_inputs(**check)
+
+        jobs.append({'name': name, 'every': every, 'config': config})
+
+    return jobs
+
+
+def warm_up() -> None:
+    """
+    Import the data stack and open the database engine once, so the first run
+    doesn't pay for them. The HTTP session and engine are then reused by every run.
+    """
+
+    start = time.perf_counter()
+    import extract, transform, pipeline, parallel_transform, sql_transforms
+    try:
+        from sql_utils import shared_engine
+        shared_engine()
+    except Exception as e:
+        logging.warning(f"Could not connect to PostgreSQL yet, runs will retry: {e}")
+    logging.info(f"Warmed up in {time.perf_counter() - start:.2f}s")
+
+
+def run_job(job: dict) -> bool:
+    """
+    Run one job through ETL.main. Returns False if it failed; the error is logged
+    and the scheduler carries on.
+    """
+
+    import ETL
+
+    config = dict(job['config'])
+    options = parse_options(None, config)
+    symbols, requests, queries, save_to, timestamp = parse_inputs(**config)
+
+    logging.info(f"Running job {job['name']}: {len(symbols)} symbols, {requests}")
+    start = time.perf_counter()
+    try:
+        ETL.main(symbols, requests, queries, save_to, timestamp, options, job=f"{save_to}_{job['name']}")
+    except Exception:
+        logging.exception(f"Job {job['name']} failed after {time.perf_counter() - start:.1f}s")
+        return False
+    logging.info(f"Job {job['name']} finished in {time.perf_counter() - start:.1f}s")
+    return True
+
+
+def run_forever(jobs: list, stop: threading.Event = None, clock=time.time) -> None:
+    """
+    Run jobs on their cadences until stop is set.
+
+    Jobs run one at a time in this process, so they share the warm HTTP session
+    and database engine and never compete for the API rate limit. Each job keeps
+    a fixed cadence from startup. A job whose slot passes while an earlier run is
+    still going, its own or another job's, runs once when it can and the missed
+    slots are skipped, so runs never overlap or pile up.
+    """
+
+    stop = stop or threading.Event()
+    started = clock()
+    due = {job['name']: started for job in jobs}
+
+    while not stop.is_set():
+        now = clock()
+        for job in sorted(jobs, key=lambda job: due[job['name']]):
+            if stop.is_set() or due[job['name']] > now:
+                continue
+            run_job(job)
+
+            # Next slot on the job's cadence after the run, skipping any it overran
+            now = clock()
+            slots = int((now - started) // job['every']) + 1
+            next_due = started + slots * job['every']
+            missed = int((next_due - due[job['name']]) // job['every']) - 1
+            if missed > 0:
+                logging.warning(f"Job {job['name']} skipped {missed} overlapping run(s)")
+            due[job['name']] = next_due
+
+        wait = min(due.values()) - clock()
+        if wait > 0:
+            logging.info(f"Next run: {min(due, key=due.get)} at {datetime.fromtimestamp(min(due.values())).strftime('%H:%M:%S')}")
+            stop.wait(wait)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Run ETL jobs on a schedule in one long-running process.")
+    parser.add_argument('--schedule', required=True, help='Path to the yaml schedule')
+    parser.add_argument('--once', action='store_true', help='Run every job once and exit')
+    args = parser.parse_args()
+
+    ''' Example usage:
+    python scheduler.py --schedule ../config/example_schedule.yaml
+    python scheduler.py --schedule ../config/example_schedule.yaml --once
+    '''
+
+    jobs = load_schedule(args.schedule)
+    logging.info("Scheduled jobs: " + ", ".join(f"{job['name']} every {job['every']:g}s" for job in jobs))
+    warm_up()
+
+    if args.once:
+        failed = [job['name'] for job in jobs if not run_job(job)]
+        raise SystemExit(1 if failed else 0)
+
+    # Finish the job in progress, then exit
+    stop = threading.Event()
+
+    def shutdown(signum, frame):
+        logging.info("Stopping after the current job...")
+        stop.set()
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, shutdown)
+    run_forever(jobs, stop)
@@ -1,10 +1,12 @@
-from sql_utils import connect_to_postgresql, create_indicators
+from sql_utils import shared_engine, create_tidy_indicators, copy_dataframe, upsert_dataframe, load_dataframe, TABLE_KEYS, TABLE_INDEXES
 from sqlalchemy import text
 from utils import long_format
 import logging
-import os
 import pandas as pd
-from config import DATA_DIR
+from concurrent.futures import ThreadPoolExecutor
+from FA_io import save_processed_data
+from metrics import stage
+from stock_indicators import load_stock_indicators
 
 # logging configuration
 logging.basicConfig(
@@ -12,102 +14,116 @@ logging.basicConfig(
     format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
-def main(stocks, wide_statements, tidy_statements, folder_name, documents, timestamp = False):
-    # Connect to PostgreSQL and return connection instance
-    engine = connect_to_postgresql()
-    with engine.connect() as conn:
-        db_info = conn.execute(text("SELECT current_database(), current_user;")).fetchone()
-        logging.info(f"Connected to database: {db_info[0]} as user: {db_info[1]}")
-    
-    # Determine if the tables should be replaced or appended
-    if timestamp:
-        if_exists = 'append'
-    else:
-        if_exists = 'replace'
-    # Make directory for processed data
-    os.makedirs(f"{DATA_DIR}\\processed\\{folder_name}", exist_ok=True)
-    if timestamp:
-        append_time = f"_{timestamp}.csv"
-    else:
-        append_time = ".csv"
-
-    # Upload dataframes to PostgreSQL
-    logging.info("Uploading dataframes to PostgreSQL...")
-    if not stocks.empty:
-        stocks.to_sql(
-            f"{folder_name}_stocks", 
-            engine, 
-            if_exists=if_exists, 
-            index=False, 
-            method='multi', 
-            chunksize=10000
-        )
-        logging.info(f"Table {folder_name}_stocks successfully created/updated.")
-        # Save to csv
-        stocks.to_csv(f"{DATA_DIR}\\processed\\{folder_name}\\stocks" + append_time, index=False)
-    if not wide_statements.empty:
-        wide_statements.to_sql(
-            f"{folder_name}_statements", 
-            engine, 
-            if_exists=if_exists, 
-            index=False, 
-            method='multi',
-            chunksize=10000
-        )
-        logging.info(f"Table {folder_name}_statements successfully created/updated.")
-        logging.info("Computing statement indicators in SQL.")
-        # Compute statement indicators in SQL
-        create_indicators(engine, wide_statements, folder_name, timestamp)
-
-        # Read indicators from PostgreSQL
-        indicators = {}
-        for type in ['profitability', 'leverage', 'liquidity']:
-            query = f"SELECT * FROM {folder_name}_{type};"
-            with engine.connect() as conn:
-                indicators[type] = pd.read_sql(query, conn)
+def _load_stocks(engine, stocks, folder_name, load_mode, timestamp, output_format, batch):
+    load_dataframe(engine, stocks, f"{folder_name}_stocks", load_mode, TABLE_KEYS['stocks'], TABLE_INDEXES['stocks'])
+    logging.info(f"Table {folder_name}_stocks successfully created/updated.")
+    # Save processed file
+    save_processed_data(stocks, folder_name, "stocks", timestamp, output_format, batch)
+
+
+def _load_stock_indicators(engine, stocks, folder_name, load_mode, timestamp, output_format, batch):
+    # Extend rolling stock indicators from the new bars and the saved window tails
+    stock_indicators = load_stock_indicators(engine, stocks, folder_name, load_mode, export=output_format != 'none')
+    if stock_indicators is not None and not stock_indicators.empty:
+        save_processed_data(stock_indicators, folder_name, "stock_indicators", timestamp, output_format, batch)
+
+
+def _load_indicators(engine, wide_statements, folder_name, load_mode, timestamp, output_format, batch, indicators):
+    if indicators is not None:
+        logging.info("Using statement indicators computed in-process.")
         # Convert indicators to long format
         logging.info("Converting indicators to long format...")
-        tidy_indicators = long_format(indicators)
-        # Save indicators to csv
-        tidy_indicators.to_csv(f"{DATA_DIR}\\processed\\{folder_name}\\indicators" + append_time, index=False)
-
-
-        # Replace wide format statements with long format in PostgreSQL
-        # Drop wide format tables
-        logging.info("Replacing wide format statements with long format")
-        logging.info(f"Uploading long tables...")
-        # Upload tidy indicators
-        tidy_indicators.to_sql(
-            f"{folder_name}_indicators", 
-            engine, 
-            if_exists=if_exists, 
-            index=False, 
-            method='multi', 
-            chunksize=10000
-        )
-        logging.info(f"Table {folder_name}_indicators successfully created.")
-
-        # Upload tidy statements
-        tidy_statements.to_sql(
-            f"{folder_name}_tidy", 
-            engine, 
-            if_exists=if_exists, 
-            index=False, 
-            method='multi', 
-            chunksize=10000
-        )
-        logging.info(f"Table {folder_name}_tidy successfully created.")
-        # Save statements to csv
-        tidy_statements.to_csv(f"{DATA_DIR}\\processed\\{folder_name}\\tidy" + append_time, index=False)
-    
-        # Drop the original tables
-        logging.info("Dropping wide tables...")
-        with engine.begin() as conn:
-            conn.execute(text(f"DROP TABLE IF EXISTS {folder_name}_profitability;"))
-            conn.execute(text(f"DROP TABLE IF EXISTS {folder_name}_leverage;"))
-            conn.execute(text(f"DROP TABLE IF EXISTS {folder_name}_liquidity;"))
+        tidy_indicators = long_format(indicators) if indicators else pd.DataFrame()
+        if not tidy_indicators.empty:
+            save_processed_data(tidy_indicators, folder_name, "indicators", timestamp, output_format, batch)
+            load_dataframe(engine, tidy_indicators, f"{folder_name}_indicators", load_mode, TABLE_KEYS['indicators'])
+            logging.info(f"Table {folder_name}_indicators successfully created.")
+        return
+
+    # Uploading statements, computing indicators and dropping the statements table
+    # depend on each other, so they run in one transaction. A failure rolls back all
+    # of it instead of leaving a half-loaded or undropped statements table behind.
+    export = output_format != 'none'
+    with engine.begin() as conn:
+        if load_mode == 'upsert':
+            # Merge into the persistent statements table so only changed rows are recomputed
+            upsert_dataframe(conn, wide_statements, f"{folder_name}_statements", ['symbol', 'date'])
+        else:
+            copy_dataframe(conn, wide_statements, f"{folder_name}_statements", if_exists=load_mode)
+        logging.info(f"Table {folder_name}_statements successfully created/updated.")
+
+        # Compute statement indicators in SQL, straight into the tidy indicators table
+        logging.info("Computing statement indicators in SQL...")
+        tidy_indicators = create_tidy_indicators(conn, folder_name, load_mode, export=export)
+
+        # Drop the wide statements table. Upsert mode keeps it for the next incremental refresh.
+        if load_mode != 'upsert':
+            logging.info("Dropping wide statements table...")
             conn.execute(text(f"DROP TABLE IF EXISTS {folder_name}_statements;"))
-    
-    logging.info(f"SQL transformations successfully completed. Closing connection to PostgreSQL.")
-    engine.dispose()
-    
\ No newline at end of file
+
+    if export and not tidy_indicators.empty:
+        save_processed_data(tidy_indicators, folder_name, "indicators", timestamp, output_format, batch)
+
+
+def _load_tidy(engine, tidy_statements, folder_name, load_mode, timestamp, output_format, batch):
+    # Upload tidy statements
+    load_dataframe(engine, tidy_statements, f"{folder_name}_tidy", load_mode, TABLE_KEYS['tidy'], TABLE_INDEXES['tidy'])
+    logging.info(f"Table {folder_name}_tidy successfully created.")
+    # Save statements processed file
+    save_processed_data(tidy_statements, folder_name, "tidy", timestamp, output_format, batch)
+
+
+def main(stocks, wide_statements, tidy_statements, folder_name, documents, timestamp = False, output_format = 'csv', load_mode = None, indicators = None, batch = None):
+    """
+    Load stocks and statements to PostgreSQL, compute indicators, and save processed files.
+
+    load_mode: 'replace', 'append', or 'upsert'. Defaults to 'append' for timestamped
+               runs and 'replace' otherwise. 'upsert' merges _stocks, _tidy and
+               _indicators on their primary keys and only writes changed rows.
+               It also keeps _statements between runs, so indicators are only
+               recomputed for new or changed statements.
+    indicators: optional {category: DataFrame} computed in-process (see indicators.py).
+                When given, statements are not uploaded to compute indicators in SQL.
+                Otherwise indicators are computed and unpivoted in a single SQL statement.
+    output_format: processed file format, or 'none' to only load PostgreSQL. With 'none'
+                   indicator rows are not read back from the database.
+    batch: batch number when symbols are loaded in batches. Processed files get a
+           _batch<N> suffix so batches don't overwrite each other.
+
+    Rolling stock indicators (see stock_indicators.py) are computed from the new
+    stock bars only and written to _stock_indicators.
+
+    The stocks, stock indicators, indicators and tidy tables don't depend on each
+    other, so they are loaded at the same time, each on its own connection from the
+    shared pool (see sql_utils.shared_engine). If any of them fails, the others
+    still finish and the first error is raised.
+    """
+
+    # Determine if the tables should be replaced, appended, or upserted
+    if load_mode is None:
+        load_mode = 'append' if timestamp else 'replace'
+
+    with stage('load', load_mode=load_mode):
+
+        # Pooled engine shared with earlier batches and runs in this process
+        engine = shared_engine()
+
+        # Upload dataframes to PostgreSQL
+        logging.info("Uploading dataframes to PostgreSQL...")
+        loads = []
+        if not stocks.empty:
+            loads.append((_load_stocks, engine, stocks, folder_name, load_mode, timestamp, output_format, batch))
+            loads.append((_load_stock_indicators, engine, stocks, folder_name, load_mode, timestamp, output_format, batch))
+        if not wide_statements.empty:
+            loads.append((_load_indicators, engine, wide_statements, folder_name, load_mode, timestamp, output_format, batch, indicators))
+            loads.append((_load_tidy, engine, tidy_statements, folder_name, load_mode, timestamp, output_format, batch))
+
+        with ThreadPoolExecutor(max_workers=max(len(loads), 1), thread_name_prefix="load") as executor:
+            futures = [executor.submit(*load) for load in loads]
+        errors = [future.exception() for future in futures if future.exception() is not None]
+        for error in errors[1:]:
+            logging.error(f"Load failed: {error}")
+        if errors:
+            raise errors[0]
+
+        logging.info(f"SQL transformations successfully completed.")
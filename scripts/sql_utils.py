@@ -1,96 +1,534 @@
-import pandas as pd
+import io
+import atexit
 import logging
+import threading
+import pandas as pd
+from contextlib import contextmanager
 from sqlalchemy import create_engine, text
-from sqlalchemy.engine import URL
-from config import fetch_postgresql_credentials
+from sqlalchemy.engine import URL, Connection
+from config import fetch_postgresql_credentials, LOAD_MODES
+from metrics import stage
 
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
+
+# Indicator formulas by category, computed from the wide statements table.
+# Add your own indicators here as (name, SQL expression).
+INDICATOR_FORMULAS = {
+    'profitability': [
+        ('naive_roe', '("netIncome" * 1.0)/"totalEquity"'),
+        ('naive_roa', '("netIncome" * 1.0)/"totalAssets"'),
+        ('simplified_roic', '(("netIncome" - "dividendsPaid") * 1.0) / ("totalDebt" + "totalEquity")'),
+        ('gross_profit_margin', '("grossProfit" * 1.0)/revenue'),
+        ('operating_margin', '("operatingIncome" * 1.0)/revenue'),
+        ('operating_income_ratio', '("operatingIncomeRatio" * 1.0)'),
+        ('net_profit_margin', '("netIncome" * 1.0)/revenue'),
+        ('ebitda_margin', '("ebitda" * 1.0)/revenue'),
+        ('earnings_per_share', '("eps" * 1.0)'),
+        ('diluted_earnings_per_share', '("epsdiluted" * 1.0)'),
+    ],
+    'leverage': [
+        ('naive_debt_to_equity', '("totalDebt" * 1.0)/"totalEquity"'),
+        ('naive_equity_ratio', '("totalEquity" * 1.0)/"totalAssets"'),
+        ('naive_debt_ratio', '("totalDebt" * 1.0)/"totalAssets"'),
+        ('naive_debt_to_capital', '("totalDebt" * 1.0)/NULLIF(("totalDebt" + "totalEquity"), 0)'),
+        ('interest_coverage', '("ebitda" * 1.0)/NULLIF("interestExpense", 0)'),
+        ('net_debt_to_ebitda', '("totalDebt" - "cashAndCashEquivalents") * 1.0 / NULLIF("ebitda", 0)'),
+    ],
+    'liquidity': [
+        ('current_ratio', '("totalCurrentAssets" * 1.0)/"totalCurrentLiabilities"'),
+        ('quick_ratio', '(("cashAndCashEquivalents" + "shortTermInvestments" + "accountsReceivables") * 1.0)/"totalCurrentLiabilities"'),
+        ('cash_ratio', '("cashAndCashEquivalents" * 1.0)/"totalCurrentLiabilities"'),
+        ('operating_cashflow_to_capex', '("operatingCashFlow" * 1.0)/NULLIF(ABS("capitalExpenditure"), 0)'),
+        ('operating_cash_flow_ratio', '("operatingCashFlow" * 1.0)/NULLIF("totalCurrentLiabilities", 0)'),
+    ],
+}
+
+
+# Primary keys used by the upsert load mode for each tidy table
+TABLE_KEYS = {
+    'stocks': ['symbol', 'date'],
+    'tidy': ['symbol', 'date', 'statement_type', 'metric'],
+    'indicators': ['symbol', 'date', 'statement_type', 'metric'],
+    'stock_indicators': ['symbol', 'date', 'metric'],
+}
+
+# Tables range-partitioned by year on date, with the B-tree indexes dashboard
+# queries filter on. Each also gets a BRIN index on date for date-range scans.
+TABLE_INDEXES = {
+    'stocks': [['symbol', 'date']],
+    'tidy': [['symbol', 'date'], ['symbol', 'metric', 'date']],
+    'stock_indicators': [['symbol', 'metric', 'date']],
+}
+
+# Connection pool settings. sql_transforms.main loads up to four tables at once,
+# each on its own connection.
+POOL_SIZE = 4
+MAX_OVERFLOW = 4
+POOL_RECYCLE_SECONDS = 1800
+
+# Engine shared by every load in this process, see shared_engine()
+_engine = None
+_engine_lock = threading.Lock()
+
+
 def connect_to_postgresql():
     """
     Connect to PostgreSQL database using SQLAlchemy engine.
     Returns a SQLAlchemy engine instance.
+
+    Connections are pooled and checked before reuse, so an engine can be kept
+    across runs without handing out connections the server has closed.
     """
     sql_credentials = fetch_postgresql_credentials()
     
     try:
         logging.info("Connecting to PostgreSQL database...")
         url = URL.create(**sql_credentials)
-        engine = create_engine(url)
+        engine = create_engine(url, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_pre_ping=True, pool_recycle=POOL_RECYCLE_SECONDS)
         
         with engine.connect() as conn:
-            logging.info("Connection successful")
+            db_info = conn.execute(text("SELECT current_database(), current_user;")).fetchone()
+            logging.info(f"Connected to database: {db_info[0]} as user: {db_info[1]}")
         return engine
     except Exception as e:
         logging.warning(f"Connection failed: {e}")
         raise
 
 
+def shared_engine():
+    """
+    Engine shared by every load in this process, created on first use.
+    Batches, pipeline chunks and scheduled runs reuse its connection pool
+    instead of connecting again. Don't dispose it; it is disposed at exit.
+    """
+
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = connect_to_postgresql()
+            atexit.register(_engine.dispose)
+        return _engine
+
+
+@contextmanager
+def _cursor(bind):
+    """
+    DBAPI cursor for bind. An Engine lends a pooled connection that is committed
+    on success and rolled back on error. A Connection is used inside the caller's
+    transaction, which commits or rolls back everything together.
+    """
+
+    if isinstance(bind, Connection):
+        cursor = bind.connection.cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+        return
+
+    conn = bind.raw_connection()
+    try:
+        with conn.cursor() as cursor:
+            yield cursor
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+@contextmanager
+def _begin(bind):
+    """
+    Transaction on bind: a new one for an Engine, a savepoint within the
+    caller's transaction for a Connection. Yields a Connection.
+    """
+
+    if isinstance(bind, Connection):
+        with bind.begin_nested():
+            yield bind
+    else:
+        with bind.begin() as conn:
+            yield conn
+
+
+def postgres_type(series: pd.Series) -> str:
+    """
+    PostgreSQL column type for a pandas column, matching what to_sql creates.
+    """
+
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        dtype = dtype.categories.dtype
+    if pd.api.types.is_bool_dtype(dtype):
+        return "BOOLEAN"
+    if pd.api.types.is_integer_dtype(dtype):
+        return "BIGINT"
+    if pd.api.types.is_float_dtype(dtype):
+        return "DOUBLE PRECISION"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "TIMESTAMP"
+    return "TEXT"
+
+
+def _years(df: pd.DataFrame) -> list:
+    """
+    Calendar years of the dates in df.
+    """
+
+    return sorted(int(year) for year in pd.to_datetime(df['date']).dt.year.dropna().unique())
+
+
+def _create_partitions(cursor, table: str, years: list) -> None:
+    """
+    Create the yearly partitions <table>_y<year> that don't exist yet.
+    """
+
+    for year in years:
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table}_y{year} PARTITION OF {table}
+            FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01');
+        """)
+
+
+def _ensure_partitioned_table(cursor, df: pd.DataFrame, table: str, definitions: str) -> None:
+    """
+    Create table range-partitioned by year on date, with a partition for every
+    year in df. Rows without a date go to <table>_default.
+
+    definitions: columns and constraints used if the table doesn't exist yet.
+    Plain tables created by earlier runs are converted in place, keeping their rows.
+    """
+
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s);", (table,))
+    existing = cursor.fetchone()
+
+    if existing is None:
+        cursor.execute(f'CREATE TABLE {table} ({definitions}) PARTITION BY RANGE ("date");')
+        cursor.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT;")
+    elif existing[0] != 'p':
+        logging.info(f"Converting {table} to a table partitioned by year...")
+        cursor.execute(f"ALTER TABLE {table} RENAME TO {table}_unpartitioned;")
+        cursor.execute(f'CREATE TABLE {table} (LIKE {table}_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE ("date");')
+        cursor.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT;")
+        cursor.execute(f'SELECT DISTINCT EXTRACT(YEAR FROM "date")::INT FROM {table}_unpartitioned WHERE "date" IS NOT NULL;')
+        _create_partitions(cursor, table, [year for (year,) in cursor.fetchall()])
+        cursor.execute(f"INSERT INTO {table} SELECT * FROM {table}_unpartitioned;")
+        cursor.execute(f"DROP TABLE {table}_unpartitioned;")
+
+    _create_partitions(cursor, table, _years(df))
+
+
+def _create_indexes(cursor, table: str, indexes: list) -> None:
+    """
+    B-tree indexes on each column list in indexes and a BRIN index on date.
+    Indexes on a partitioned table are created on every partition, including new ones.
+    """
+
+    for columns in indexes:
+        quoted = ", ".join(f'"{col}"' for col in columns)
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {table}_{"_".join(columns)}_idx ON {table} ({quoted});')
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS {table}_date_brin ON {table} USING brin ("date");')
+
+
+def _copy_rows(cursor, df: pd.DataFrame, table: str, chunksize: int = 100000) -> int:
+    """
+    Stream DataFrame rows into an existing table with COPY FROM STDIN.
+    NULLs are written as \\N so empty strings survive.
+    Returns the number of characters sent.
+    """
+
+    columns = ", ".join(f'"{col}"' for col in df.columns)
+    copy = f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+    sent = 0
+    for start in range(0, len(df), chunksize):
+        buffer = io.StringIO()
+        df.iloc[start:start + chunksize].to_csv(buffer, index=False, header=False, na_rep='\\N')
+        sent += buffer.tell()
+        buffer.seek(0)
+        cursor.copy_expert(copy, buffer)
+    return sent
+
+
+def copy_dataframe(engine, df: pd.DataFrame, table: str, if_exists: str = 'replace', chunksize: int = 100000, indexes: list = None) -> None:
+    """
+    Bulk load a DataFrame into PostgreSQL with COPY FROM STDIN.
+
+    The table is created with explicit column types from the DataFrame dtypes.
+    if_exists: 'replace' drops and recreates the table, 'append' adds rows to it.
+    indexes:   B-tree index column lists (see TABLE_INDEXES). When given, the table
+               is partitioned by year on date, with partitions created for new years,
+               and indexed after the rows are copied.
+    Rows are streamed in chunks of chunksize and committed in one transaction.
+    engine may also be a Connection, to load as part of the caller's transaction.
+    """
+
+    definitions = ", ".join(f'"{col}" {postgres_type(df[col])}' for col in df.columns)
+    partitioned = indexes is not None and 'date' in df.columns
+
+    with stage('copy', table=table) as counts:
+        with _cursor(engine) as cursor:
+            if if_exists == 'replace':
+                cursor.execute(f"DROP TABLE IF EXISTS {table};")
+            if partitioned:
+                _ensure_partitioned_table(cursor, df, table, definitions)
+            else:
+                cursor.execute(f"CREATE TABLE IF NOT EXISTS {table} ({definitions});")
+            if if_exists == 'append':
+                # Add columns that are new since the table was created
+                for col in df.columns:
+                    cursor.execute(f'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS "{col}" {postgres_type(df[col])};')
+            counts['bytes_out'] = _copy_rows(cursor, df, table, chunksize)
+            if partitioned:
+                # Built after a fresh table is filled, which is faster than maintaining them row by row
+                _create_indexes(cursor, table, indexes)
+        counts['rows_in'] = counts['rows_out'] = len(df)
+
+
+def _ensure_upsert_table(cursor, df: pd.DataFrame, table: str, keys: list, indexes: list = None) -> None:
+    """
+    Create table with a primary key on keys, a row_hash column and a date index.
+    Tables created by earlier replace/append runs are migrated: new columns are
+    added, duplicate keys are removed and the primary key is added.
+    With indexes, the table is partitioned by year on date and gets those
+    indexes instead of the date index (see copy_dataframe). keys must include date.
+    """
+
+    definitions = ", ".join(f'"{col}" {postgres_type(df[col])}' for col in df.columns)
+    key_columns = ", ".join(f'"{key}"' for key in keys)
+    partitioned = indexes is not None and 'date' in df.columns
+    if partitioned:
+        _ensure_partitioned_table(cursor, df, table, f"{definitions}, row_hash TEXT, PRIMARY KEY ({key_columns})")
+    else:
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {table} ({definitions}, row_hash TEXT, PRIMARY KEY ({key_columns}));")
+
+    # Add columns the API started returning since the table was created
+    for col in df.columns:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS "{col}" {postgres_type(df[col])};')
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS row_hash TEXT;")
+
+    cursor.execute("SELECT 1 FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'p';", (table,))
+    if cursor.fetchone() is None:
+        logging.info(f"Adding primary key ({key_columns}) to {table}. Removing duplicate rows first.")
+        matching = " AND ".join(f'a."{key}" = b."{key}"' for key in keys)
+        cursor.execute(f"DELETE FROM {table} a USING {table} b WHERE a.ctid < b.ctid AND {matching};")
+        cursor.execute(f"ALTER TABLE {table} ADD PRIMARY KEY ({key_columns});")
+
+    if partitioned:
+        _create_indexes(cursor, table, indexes)
+    elif 'date' in df.columns and keys[0] != 'date':
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {table}_date_idx ON {table} ("date");')
+
+
+def upsert_dataframe(engine, df: pd.DataFrame, table: str, keys: list, chunksize: int = 100000, indexes: list = None) -> int:
+    """
+    Merge a DataFrame into table on its primary key keys.
+
+    Rows are copied into a temporary staging table, then merged with
+    INSERT ... ON CONFLICT DO UPDATE. Each row stores an md5 hash of its content,
+    and existing rows are only rewritten when the hash changed.
+    Returns the number of rows inserted or updated. engine may also be a Connection.
+    indexes partitions and indexes the table as in copy_dataframe.
+    """
+
+    columns = ", ".join(f'"{col}"' for col in df.columns)
+    key_columns = ", ".join(f'"{key}"' for key in keys)
+    row = ", ".join(f'"{col}"' for col in df.columns)
+    updates = ", ".join(f'"{col}" = EXCLUDED."{col}"' for col in df.columns if col not in keys)
+    staging = f"{table}_stage"
+
+    with stage('upsert', table=table) as counts:
+        with _cursor(engine) as cursor:
+            _ensure_upsert_table(cursor, df, table, keys, indexes)
+
+            # Stage new rows. Dropped here rather than on commit, since a caller's
+            # transaction may stage the same table twice.
+            cursor.execute(f"CREATE TEMP TABLE {staging} (LIKE {table});")
+            counts['bytes_out'] = _copy_rows(cursor, df, staging, chunksize)
+
+            # Merge, skipping rows whose content is unchanged
+            cursor.execute(f"""
+                INSERT INTO {table} ({columns}, row_hash)
+                SELECT DISTINCT ON ({key_columns}) {columns}, md5(ROW({row})::text)
+                FROM {staging}
+                ORDER BY {key_columns}
+                ON CONFLICT ({key_columns}) DO UPDATE
+                SET {updates}, row_hash = EXCLUDED.row_hash
+                WHERE {table}.row_hash IS DISTINCT FROM EXCLUDED.row_hash;
+            """)
+            changed = cursor.rowcount
+            cursor.execute(f"DROP TABLE {staging};")
+        counts['rows_in'], counts['rows_out'] = len(df), changed
+
+    logging.info(f"Upserted {table}: {changed} of {len(df)} rows new or changed.")
+    return changed
+
+
+def load_dataframe(engine, df: pd.DataFrame, table: str, load_mode: str = 'replace', keys: list = None, indexes: list = None) -> None:
+    """
+    Load a DataFrame with the given load_mode: 'replace', 'append', or 'upsert' on keys.
+    With indexes, the table is partitioned by year and indexed (see copy_dataframe).
+    """
+
+    if load_mode == 'upsert':
+        upsert_dataframe(engine, df, table, keys, indexes=indexes)
+    else:
+        copy_dataframe(engine, df, table, if_exists=load_mode, indexes=indexes)
+
+
+def latest_stock_dates(engine, folder_name: str) -> dict:
+    """
+    Return {symbol: "yyyy-mm-dd"} with the latest date stored in <folder_name>_stocks.
+    Returns an empty dict if the table doesn't exist yet.
+    """
+
+    with engine.connect() as conn:
+        exists = conn.execute(text("SELECT to_regclass(:table)"), {"table": f"{folder_name}_stocks"}).scalar()
+        if not exists:
+            return {}
+        rows = conn.execute(text(f"SELECT symbol, MAX(date) FROM {folder_name}_stocks GROUP BY symbol;")).fetchall()
+
+    return {symbol: pd.Timestamp(date).strftime('%Y-%m-%d') for symbol, date in rows if date is not None}
+
+
+def _indicator_select(category: str) -> str:
+    """
+    SELECT list computing one indicator category from the wide statements columns.
+    """
+
+    formulas = ",\n            ".join(f"{formula} AS {name}" for name, formula in INDICATOR_FORMULAS[category])
+    return f"""date,
+            symbol,
+            {formulas}"""
+
+
 def create_indicators(engine, wide: pd.DataFrame, folder_name: str, timestamp = False):
     """
     Create or update indicator tables in PostgreSQL.
     If timestamp, append to existing tables. Otherwise, create new ones.
     """
-    
-    profitability = text(f"""
-    DROP TABLE IF EXISTS {folder_name}_profitability;
-    CREATE TABLE {folder_name}_profitability AS (
-        SELECT
-            date,
-            symbol,
-            ("netIncome" * 1.0)/"totalEquity" AS naive_roe,
-            ("netIncome" * 1.0)/"totalAssets" AS naive_roa,
-            (("netIncome" - "dividendsPaid") * 1.0) / ("totalDebt" + "totalEquity") AS simplified_roic,
-            ("grossProfit" * 1.0)/revenue AS gross_profit_margin,
-            ("operatingIncome" * 1.0)/revenue AS operating_margin,
-            ("operatingIncomeRatio" * 1.0) AS operating_income_ratio,
-            ("netIncome" * 1.0)/revenue AS net_profit_margin,
-            ("ebitda" * 1.0)/revenue AS ebitda_margin,
-            ("eps" * 1.0) AS earnings_per_share,
-            ("epsdiluted" * 1.0) AS diluted_earnings_per_share
-
-        FROM {folder_name}_statements
-    );
-    """)
-
-    leverage = text(f"""
-    DROP TABLE IF EXISTS {folder_name}_leverage;
-    CREATE TABLE {folder_name}_leverage AS (
-        SELECT
-            date,
-            symbol,
-            ("totalDebt" * 1.0)/"totalEquity" AS naive_debt_to_equity,
-            ("totalEquity" * 1.0)/"totalAssets" AS naive_equity_ratio,
-            ("totalDebt" * 1.0)/"totalAssets" AS naive_debt_ratio,
-            ("totalDebt" * 1.0)/NULLIF(("totalDebt" + "totalEquity"), 0) AS naive_debt_to_capital,
-            ("ebitda" * 1.0)/NULLIF("interestExpense", 0) AS interest_coverage,
-            ("totalDebt" - "cashAndCashEquivalents") * 1.0 / NULLIF("ebitda", 0) AS net_debt_to_ebitda
-        FROM {folder_name}_statements
-    );
-    """)
-
-    liquidity = text(f"""
-    DROP TABLE IF EXISTS {folder_name}_liquidity;
-    CREATE TABLE {folder_name}_liquidity AS (
-    SELECT
-        date,
-        symbol,
-        ("totalCurrentAssets" * 1.0)/"totalCurrentLiabilities" AS current_ratio,
-        (("cashAndCashEquivalents" + "shortTermInvestments" + "accountsReceivables") * 1.0)/"totalCurrentLiabilities" AS quick_ratio,
-        ("cashAndCashEquivalents" * 1.0)/"totalCurrentLiabilities" AS cash_ratio,
-        ("operatingCashFlow" * 1.0)/NULLIF(ABS("capitalExpenditure"), 0) AS operating_cashflow_to_capex,
-        ("operatingCashFlow" * 1.0)/NULLIF("totalCurrentLiabilities", 0) AS operating_cash_flow_ratio
-    FROM {folder_name}_statements
-    );
-    """)
-
-    for indicators, name in [(profitability, 'profitability'), (leverage, 'leverage'), (liquidity, 'liquidity')]:
+
+    for name in INDICATOR_FORMULAS:
+        indicators = text(f"""
+        DROP TABLE IF EXISTS {folder_name}_{name};
+        CREATE TABLE {folder_name}_{name} AS (
+            SELECT
+            {_indicator_select(name)}
+            FROM {folder_name}_statements
+        );
+        """)
         try:
             with engine.connect() as conn:
                 conn.execute(indicators)
                 conn.commit()
         except Exception as e:
-            logging.error(f"Failed to create {folder_name}_{name} table: {e}")
\ No newline at end of file
+            logging.error(f"Failed to create {folder_name}_{name} table: {e}")
+
+
+def _indicator_values(categories: list) -> str:
+    """
+    LATERAL VALUES list unpivoting indicator categories into (metric, value, statement_type) rows.
+    """
+
+    return ",\n                ".join(
+        f"('{metric}', ({formula})::DOUBLE PRECISION, '{category}')"
+        for category in categories
+        for metric, formula in INDICATOR_FORMULAS[category]
+    )
+
+
+def create_tidy_indicators(engine, folder_name: str, load_mode: str = 'replace', export: bool = True):
+    """
+    Compute every indicator category in one scan of <folder_name>_statements and
+    unpivot straight into <folder_name>_indicators (date, symbol, metric, value, statement_type).
+
+    load_mode: 'replace' recreates the table, 'append' adds rows, 'upsert' merges on
+               (symbol, date, statement_type, metric) and only computes statement rows
+               whose row_hash has no indicators yet, i.e. new or changed filings.
+    export:    return the inserted rows as a DataFrame. Otherwise indicator data stays
+               in the database and None is returned.
+
+    If a plain division by zero fails the combined statement, categories are
+    retried one at a time so the others are still loaded.
+    engine may also be a Connection. Each step then runs in a savepoint of the
+    caller's transaction.
+    """
+
+    table = f"{folder_name}_indicators"
+    upsert = load_mode == 'upsert'
+    columns = "date, symbol, metric, value, statement_type"
+
+    with _begin(engine) as conn:
+        if load_mode == 'replace':
+            conn.execute(text(f"DROP TABLE IF EXISTS {table};"))
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                date TIMESTAMP, symbol TEXT, metric TEXT, value DOUBLE PRECISION, statement_type TEXT
+            );
+        """))
+    if upsert:
+        schema = pd.DataFrame({
+            'date': pd.Series(dtype='datetime64[ns]'), 'symbol': pd.Series(dtype=object),
+            'metric': pd.Series(dtype=object), 'value': pd.Series(dtype=float), 'statement_type': pd.Series(dtype=object),
+        })
+        with _cursor(engine) as cursor:
+            _ensure_upsert_table(cursor, schema, table, TABLE_KEYS['indicators'])
+
+    # Upsert mode skips statement rows whose indicators were computed from the same content
+    hash_column = ", row_hash" if upsert else ""
+    hash_value = ", s.row_hash" if upsert else ""
+    changed_only = f"""
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {table} i
+                WHERE i.symbol = s.symbol AND i.date = s.date AND i.row_hash = s.row_hash
+            )
+            ON CONFLICT (symbol, date, statement_type, metric) DO UPDATE
+            SET value = EXCLUDED.value, row_hash = EXCLUDED.row_hash""" if upsert else ""
+    returning = f"RETURNING {columns}" if export else ""
+
+    def insert(categories):
+        return text(f"""
+            INSERT INTO {table} ({columns}{hash_column})
+            SELECT s.date, s.symbol, v.metric, v.value, v.statement_type{hash_value}
+            FROM {folder_name}_statements s
+            CROSS JOIN LATERAL (VALUES
+                {_indicator_values(categories)}
+            ) AS v(metric, value, statement_type){changed_only}
+            {returning};
+        """)
+
+    rows = []
+    with stage('sql_indicators', table=table) as counts:
+        try:
+            with _begin(engine) as conn:
+                result = conn.execute(insert(list(INDICATOR_FORMULAS)))
+                rows = result.fetchall() if export else []
+                inserted = result.rowcount
+        except Exception as e:
+            logging.warning(f"Single-scan indicator computation failed, retrying per category: {e}")
+            inserted = 0
+            for category in INDICATOR_FORMULAS:
+                try:
+                    with _begin(engine) as conn:
+                        result = conn.execute(insert([category]))
+                        rows += result.fetchall() if export else []
+                        inserted += result.rowcount
+                except Exception as e:
+                    logging.error(f"Failed to compute {category} indicators into {table}: {e}")
+        counts['rows_out'] = inserted
+
+    logging.info(f"Computed {inserted} indicator rows into {table}.")
+    if not export:
+        return None
+
+    # Order rows like long_format output: by category and metric, then statement row
+    metrics = [metric for category in INDICATOR_FORMULAS for metric, _ in INDICATOR_FORMULAS[category]]
+    order = {metric: i for i, metric in enumerate(metrics)}
+    tidy = pd.DataFrame(rows, columns=columns.split(", "))
+    tidy = tidy.iloc[tidy['metric'].map(order).argsort(kind='stable')].reset_index(drop=True)
+    return tidy
@@ -0,0 +1,156 @@
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from metrics import stage
+
+
+# logging configuration
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+# Rolling windows, in bars (trading days)
+SMA_WINDOWS = [20, 50, 200]
+VOLATILITY_WINDOW = 20
+
+# Indicators in <folder>_stock_indicators, in output order:
+#   return_1d      close over the previous close, minus 1
+#   sma_<n>        mean close over the last n bars
+#   volatility_<n> sample standard deviation of return_1d over the last n bars (daily, not annualized)
+#   drawdown       close over the highest close so far, minus 1
+STOCK_INDICATORS = ['return_1d'] + [f"sma_{window}" for window in SMA_WINDOWS] + [f"volatility_{VOLATILITY_WINDOW}", 'drawdown']
+
+# Bars kept per symbol between runs: enough to fill every window
+TAIL_BARS = max(SMA_WINDOWS + [VOLATILITY_WINDOW + 1])
+
+STATE_COLUMNS = ['symbol', 'date', 'close', 'peak']
+
+
+def compute_stock_indicators(stocks: pd.DataFrame, state: pd.DataFrame = None) -> tuple:
+    """
+    Compute STOCK_INDICATORS for the bars in stocks (date, symbol, close).
+
+    state holds the last TAIL_BARS bars of each symbol from an earlier run, with
+    the highest close up to each bar (STATE_COLUMNS). Only bars after a symbol's
+    last state date are computed, with the tail prepended so windows spanning both
+    runs match a full recompute. Older bars were computed before and are ignored.
+
+    Every symbol is rolled in one pass over the frame sorted by symbol and date.
+    Windows that reach into the previous symbol are masked out by the bar's
+    position within its symbol.
+
+    Returns (tidy, state): tidy indicators (date, symbol, metric, value) for the new
+    bars, without rows whose window isn't full yet, and the new tail state of every
+    symbol that had new bars.
+    """
+
+    bars = stocks[['date', 'symbol', 'close']].dropna().assign(date=lambda df: pd.to_datetime(df['date']))
+    bars = bars.drop_duplicates(['symbol', 'date'], keep='last')
+    bars['close'] = bars['close'].astype(float)
+
+    # Tail rows carry their running peak. New rows start from their own close,
+    # so the cumulative max below continues from the peak of earlier runs.
+    frames = []
+    if state is not None and not state.empty:
+        last_dates = state.groupby('symbol')['date'].max()
+        cutoff = bars['symbol'].map(last_dates)
+        bars = bars[cutoff.isna() | (bars['date'] > cutoff)]
+        frames.append(state[state['symbol'].isin(bars['symbol'].unique())].assign(new=False))
+    frames.append(bars.assign(peak=bars['close'], new=True))
+
+    combined = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    combined = combined.astype({'close': float, 'peak': float}).sort_values(['symbol', 'date'], kind='stable').reset_index(drop=True)
+
+    grouped = combined.groupby('symbol', sort=False)
+    position = grouped.cumcount().to_numpy()
+    close = combined['close']
+    returns = (close / close.shift() - 1).where(position >= 1)
+    peak = grouped['peak'].cummax()
+
+    values = {'return_1d': returns}
+    for window in SMA_WINDOWS:
+        values[f"sma_{window}"] = close.rolling(window).mean().where(position >= window - 1)
+    values[f"volatility_{VOLATILITY_WINDOW}"] = returns.rolling(VOLATILITY_WINDOW).std().where(position >= VOLATILITY_WINDOW)
+    values['drawdown'] = close / peak - 1
+
+    # Tidy rows for the new bars, grouped by metric like long_format output
+    new = combined['new'].to_numpy(dtype=bool)
+    dates, symbols = combined['date'].to_numpy()[new], combined['symbol'].to_numpy()[new]
+    tidy = pd.DataFrame({
+        'date': np.tile(dates, len(STOCK_INDICATORS)),
+        'symbol': np.tile(symbols, len(STOCK_INDICATORS)),
+        'metric': np.repeat(np.array(STOCK_INDICATORS, dtype=object), len(dates)),
+        'value': np.concatenate([values[metric].to_numpy()[new] for metric in STOCK_INDICATORS]) if len(dates) else np.array([], dtype=float),
+    })
+    tidy = tidy[tidy['value'].notna()].reset_index(drop=True)
+
+    tail = combined.assign(peak=peak).groupby('symbol', sort=False).tail(TAIL_BARS)[STATE_COLUMNS].reset_index(drop=True)
+    return tidy, tail
+
+
+def load_stock_indicators(engine, stocks: pd.DataFrame, folder_name: str, load_mode: str = 'replace', export: bool = True):
+    """
+    Extend <folder_name>_stock_indicators with the bars in stocks.
+
+    The tail of every symbol's windows is kept in <folder_name>_stock_indicator_state,
+    so an incremental run only computes its new bars and never reads back the
+    stocks table. load_mode: 'replace' drops both tables and computes from the bars
+    given, 'append' adds rows, 'upsert' merges on (symbol, date, metric).
+    Indicators and state are written in one transaction, so they can't drift apart.
+    Returns the new tidy rows, or None if not export.
+    """
+
+    from sqlalchemy import text
+    from sql_utils import load_dataframe, copy_dataframe, TABLE_KEYS, TABLE_INDEXES
+
+    table = f"{folder_name}_stock_indicators"
+    state_table = f"{folder_name}_stock_indicator_state"
+    symbols = list(stocks['symbol'].unique())
+
+    with stage('stock_indicators', table=table) as counts, engine.begin() as conn:
+        state = None
+        if load_mode == 'replace':
+            conn.execute(text(f"DROP TABLE IF EXISTS {state_table};"))
+        elif conn.execute(text("SELECT to_regclass(:table)"), {"table": state_table}).scalar():
+            state = pd.read_sql(text(f"SELECT {', '.join(STATE_COLUMNS)} FROM {state_table} WHERE symbol = ANY(:symbols);"),
+                                conn, params={'symbols': symbols})
+
+        tidy, tail = compute_stock_indicators(stocks, state)
+        load_dataframe(conn, tidy, table, load_mode, TABLE_KEYS['stock_indicators'], TABLE_INDEXES['stock_indicators'])
+
+        if state is not None:
+            conn.execute(text(f"DELETE FROM {state_table} WHERE symbol = ANY(:symbols);"), {'symbols': list(tail['symbol'].unique())})
+        copy_dataframe(conn, tail, state_table, if_exists='append')
+
+        counts['rows_in'] = len(stocks)
+        counts['rows_out'] = len(tidy)
+
+    logging.info(f"Computed {len(tidy)} stock indicator rows into {table}.")
+    return tidy if export else None
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Compute rolling stock indicators from raw stock prices.")
+    parser.add_argument('--symbols', nargs='+', required=True, help='Symbols with raw stock prices saved')
+    parser.add_argument('--folder', required=True, help='Raw data folder in data/raw')
+    parser.add_argument('--timestamp', default=False, help="Timestamp of the raw files, or 'latest'")
+    parser.add_argument('--load_mode', choices=['replace', 'append', 'upsert'], default='upsert', help='How <folder>_stock_indicators is loaded')
+    args = parser.parse_args()
+
+    ''' Example usage:
+    python stock_indicators.py --symbols AAPL MSFT --folder test --timestamp latest
+    python stock_indicators.py --symbols AAPL MSFT --folder test --load_mode replace
+    '''
+
+    from FA_io import load_raw_data
+    from utils import parse_to_dataframes
+    from sql_utils import shared_engine
+
+    stocks = parse_to_dataframes(load_raw_data(args.symbols, ['stock'], args.folder, args.timestamp)).get('stock')
+    if stocks is None:
+        raise SystemExit(f"No raw stock prices found for {args.symbols} in {args.folder}")
+    load_stock_indicators(shared_engine(), stocks, args.folder, args.load_mode, export=False)
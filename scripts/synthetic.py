@@ -0,0 +1,114 @@
+import os
+import glob
+import json
+import random
+from datetime import date, timedelta
+from config import PROJECT_ROOT
+
+
+# Example payloads used as templates for synthetic data
+TEMPLATE_DIR = os.path.join(PROJECT_ROOT, "test", "example_outputs", "raw", "test", "AAPL")
+STATEMENTS = ['income_statement', 'balance_sheet', 'cashflow']
+DOCUMENTS = ['stock'] + STATEMENTS
+
+
+def _load_template(document: str) -> dict:
+    """
+    Load the first record of an example payload to copy field names and magnitudes from.
+    """
+
+    path = sorted(glob.glob(os.path.join(TEMPLATE_DIR, f"AAPL_{document}*.json")))[0]
+    with open(path, 'r') as f:
+        data = json.load(f)
+    return data['historical'][0] if document == 'stock' else data[0]
+
+
+def synthetic_symbols(n_symbols: int) -> list:
+    return [f"S{i:05d}" for i in range(n_symbols)]
+
+
+def synthetic_stock(symbol: str, days: int, rng: random.Random, end: date = date(2025, 5, 5)) -> dict:
+    """
+    Daily OHLCV history shaped like the historical-price-full endpoint, newest bar first.
+    """
+
+    template = _load_template('stock')
+    close = rng.uniform(10, 500)
+    historical = []
+    day = end
+    while len(historical) < days:
+        if day.weekday() < 5:
+            change = close * rng.gauss(0, 0.02)
+            bar = dict(template)
+            bar.update({
+                'date': day.strftime('%Y-%m-%d'),
+                'open': round(close - change, 2),
+                'high': round(close + abs(change), 2),
+                'low': round(close - abs(change) * 1.5, 2),
+                'close': round(close, 2),
+                'adjClose': round(close, 2),
+                'volume': rng.randint(10 ** 5, 10 ** 8),
+                'unadjustedVolume': rng.randint(10 ** 5, 10 ** 8),
+                'change': round(change, 2),
+                'changePercent': round(100 * change / close, 4),
+                'vwap': round(close - change / 2, 3),
+                'label': day.strftime('%B %d, %y'),
+            })
+            historical.append(bar)
+            close = max(1.0, close - change)
+        day -= timedelta(days=1)
+    return {'symbol': symbol, 'historical': historical}
+
+
+def synthetic_statement(symbol: str, document: str, periods: int, rng: random.Random, end: date = date(2024, 9, 28)) -> list:
+    """
+    Annual statements shaped like the statement endpoints, newest period first.
+    """
+
+    template = _load_template(document)
+    scale = rng.uniform(0.001, 2)
+    records = []
+    for period in range(periods):
+        period_end = end.replace(year=end.year - period)
+        record = {}
+        for field, value in template.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                record[field] = value
+            elif isinstance(value, int):
+                record[field] = int(value * scale * rng.uniform(0.8, 1.2))
+            else:
+                record[field] = value * rng.uniform(0.8, 1.2)
+        record.update({
+            'date': period_end.strftime('%Y-%m-%d'),
+            'symbol': symbol,
+            'calendarYear': str(period_end.year),
+            'link': f"https://www.sec.gov/{symbol}/{period_end.year}-index.htm",
+            'finalLink': f"https://www.sec.gov/{symbol}/{period_end.year}.htm",
+        })
+        records.append(record)
+    return records
+
+
+def synthetic_payloads(symbols: list, documents: list = DOCUMENTS, days: int = 252, periods: int = 4, seed: int = 0) -> dict:
+    """
+    Synthetic API responses in the {document: {symbol: payload}} shape returned by fetch_data.
+    """
+
+    rng = random.Random(seed)
+    payloads = {document: {} for document in documents}
+    for symbol in symbols:
+        for document in documents:
+            if document == 'stock':
+                payloads[document][symbol] = synthetic_stock(symbol, days, rng)
+            else:
+                payloads[document][symbol] = synthetic_statement(symbol, document, periods, rng)
+    return payloads
+
+
+def synthetic_financial_data(n_symbols: int, documents: list = DOCUMENTS, days: int = 252, periods: int = 4, seed: int = 0) -> dict:
+    """
+    Synthetic raw data in the {document: [payload, ...]} shape returned by load_raw_data.
+    """
+
+    payloads = synthetic_payloads(synthetic_symbols(n_symbols), documents, days, periods, seed)
+    return {document: list(payloads[document].values()) for document in documents}
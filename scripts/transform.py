@@ -1,9 +1,6 @@
-import pandas as pd
 import logging
-from utils import parse_to_dataframes, wide_format, long_format
-from FA_io import load_raw_data
-from parser import get_parser_args, load_config, parse_inputs
-import sql_transforms
+from parser import get_parser_args, load_config, parse_inputs, parse_options
+from metrics import stage, write_report, profiling
 
 # logging configuration
 logging.basicConfig(
@@ -11,38 +8,57 @@ logging.basicConfig(
     format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
-def main(symbols: list, documents: list, load_from: str, timestamp = False):
+def main(symbols: list, documents: list, load_from: str, timestamp = False, storage: str = 'json', output_format: str = 'csv', load_mode: str = None,
+         indicator_engine: str = 'postgres', data: dict = None, batch: int = None, workers: int = 1, snapshot: str = None):
     """
     Main function for loading and transforming financial data.
     Args:
         symbols (list): List of stock symbols to fetch data for.
         documents (list): List of document types to fetch data for.
         load_from (str): Folder name to load data from.
+        storage (str): Raw data backend, 'json', 'parquet' or 'gzip'.
+        output_format (str): Processed file format, 'csv', 'parquet', 'arrow', or 'none'.
+        load_mode (str): 'replace', 'append', or 'upsert'. Defaults to append when timestamped, replace otherwise.
+        indicator_engine (str): 'postgres' computes indicators in SQL, 'local' computes them in-process with pandas.
+        data (dict): Optional payloads already fetched by extract.main, {document: {symbol: payload}}.
+                     Used instead of reading the raw files back.
+        batch (int): Batch number when symbols are processed in batches (see ETL.py).
+        workers (int): Processes used to parse and reshape raw files. Each reads and transforms a shard of symbols.
+        snapshot (str): Raw snapshot to load, a timestamp or 'latest' (see raw_manifest.py). Defaults to timestamp.
+                        Processed files and tables still use timestamp.
     """
 
-    # Load data
-    logging.info("Loading raw data...")
-    data = load_raw_data(symbols=symbols, documents=documents, folder=load_from, timestamp=timestamp)
-
-    # Parse data to DataFrames
-    logging.info("Parsing data to DataFrames...")
-    dfs = parse_to_dataframes(data)
-    if 'stock' in documents:
-        stocks = dfs.pop('stock')
-    else:
-        stocks = pd.DataFrame()
-    
-    if 'balance_sheet' in documents:
-        super_wide = wide_format(dfs)
-        tidy_statements = long_format(dfs)
-    else:
-        super_wide = pd.DataFrame()
-        tidy_statements = pd.DataFrame()
+    # pandas and the SQL stack are imported here, not at module level, so the CLI
+    # starts quickly and extract-only runs never load them
+    from parallel_transform import load_frames, build_frames, parallel_frames
+    import sql_transforms
+
+    raw_timestamp = timestamp if snapshot is None else snapshot
+
+    # Load, parse, merge and melt data. With several workers, each one transforms a shard of symbols.
+    with stage('transform', workers=workers) as counts:
+        if workers > 1 and data is None:
+            stocks, super_wide, tidy_statements = parallel_frames(symbols, documents, load_from, raw_timestamp, storage, workers)
+        else:
+            logging.info("Loading raw data...")
+            dfs = load_frames(symbols, documents, load_from, raw_timestamp, storage, data)
+            stocks, super_wide, tidy_statements = build_frames(dfs, documents)
+        counts['rows_in'] = len(symbols)
+        counts['rows_out'] = len(stocks) + len(super_wide) + len(tidy_statements)
+
+    # Compute statement indicators in-process instead of in PostgreSQL
+    indicators = None
+    if indicator_engine == 'local' and not super_wide.empty:
+        logging.info("Computing statement indicators locally...")
+        from indicators import compute_indicators
+        with stage('local_indicators') as counts:
+            indicators = compute_indicators(super_wide)
+            counts['rows_in'] = len(super_wide)
 
     # Load data to PostgreSQL
     # Compute statement indicators with SQL
     # Upload dataframes and long format indicators to PostgreSQL
-    sql_transforms.main(stocks=stocks, wide_statements=super_wide, tidy_statements=tidy_statements, folder_name=load_from, documents=documents, timestamp=timestamp)
+    sql_transforms.main(stocks=stocks, wide_statements=super_wide, tidy_statements=tidy_statements, folder_name=load_from, documents=documents, timestamp=timestamp, output_format=output_format, load_mode=load_mode, indicators=indicators, batch=batch)
 
 
 if __name__ == "__main__":
@@ -53,10 +69,12 @@ if __name__ == "__main__":
     # If arguments were passed through a yaml file
     if args.config:
         config = load_config(args.config)
+        options = parse_options(args, config)
         symbols, documents, queries, load_from, timestamp = parse_inputs(**config)
 
     # If arguments were passed through CLI
     if args.manual:
+        options = parse_options(args)
         symbols, documents, queries, load_from, timestamp = parse_inputs(args.symbols, args.requests, args.queries, args.save_to, args.timestamp)
 
     ''' Example usage: 
@@ -65,7 +83,12 @@ if __name__ == "__main__":
 
     Pass CLI arguments manually:
     python extract.py --manual --symbols AAPL MSFT GOOGL --requests all --queries "from=2022-05-01" "to=2023-05-01" "period=quarter" "limit=4" --save_to timestamp
+
+    Transform the latest raw snapshot of each symbol, whatever its timestamp:
+    python transform.py --manual --symbols AAPL MSFT --requests all --queries "period=annual" --save_to test --timestamp --snapshot latest
     '''
 
-    main(symbols=symbols, documents=documents, load_from=load_from, timestamp=timestamp)
+    with profiling(options['profile'], f"{load_from}_transform"):
+        main(symbols=symbols, documents=documents, load_from=load_from, timestamp=timestamp, storage=options['storage'], output_format=options['output_format'], load_mode=options['load_mode'], indicator_engine=options['engine'], workers=options['workers'], snapshot=options['snapshot'])
+    write_report(f"{load_from}_transform")
     print("Data transformed successfully.")
\ No newline at end of file
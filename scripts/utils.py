@@ -1,9 +1,8 @@
 import pandas as pd
-import json
+import numpy as np
 import logging
-from typing import Dict, List, Optional
-from config import DEFAULT_ENDPOINTS_PATH
-from FA_io import load_raw_data
+from pandas.api.types import union_categoricals
+from metrics import staged, stage_counts
 
 
 # logging configuration
@@ -13,111 +12,61 @@ logging.basicConfig(
 )
 
 
-def build_urls(api_key: str, requests: List[str], symbols: List[str] = None, **kwargs) -> Dict[str, Dict[str, str]]:
+@staged('parse')
+def parse_to_dataframes(financial_data):
     """
-    Build the complete URL for the API request.
-
-    inputs:
-    - api_key: API key for authentication
-    - requests: list of endpoint names to fetch from the API (e.g., 'stock', 'income-statement')
-    - symbols: list of stock symbols to fetch data for
-    - kwargs: query parameters for the API request. For stocks, from=yyyy-mm-dd and
-      to=yyyy-mm-dd. For statements, period=(quarter or annual) and limit=number
-      of records to fetch.
+    Build one DataFrame per document type from raw API payloads.
+
+    Records from every symbol are collected first and the frame is built once,
+    with a single date conversion, so the cost grows linearly with symbol count.
     """
-    
-    # Load default endpoints from JSON file
-    with open(DEFAULT_ENDPOINTS_PATH, 'r') as f:
-        default_endpoints = json.load(f)
-    if not default_endpoints:
-        raise FileNotFoundError(f"Failed to load default endpoints from {DEFAULT_ENDPOINTS_PATH}.")
-
-    # Prepare queries:
-    if not kwargs.get('from') or not kwargs.get('to'):
-        stock_query = ""
-    else:
-        stock_query = f"from={kwargs.get('from', '')}&to={kwargs.get('to', '')}&"
-    statement_query = f"period={kwargs.get('period', 'annual')}&limit={kwargs.get('limit', 1)}&"
-
-    # Format URLs for each endpoint 
-    urls = {}
-    for endpoint in requests:
-
-        # Choose template and query based on endpoint type
-        template = default_endpoints[endpoint]
-        query = stock_query if endpoint == "stock" else statement_query
-
-        urls[endpoint] = {}
-        for symbol in symbols:
-            try:
-                formatted_url = template.format(symbol=symbol, query=query) + f"{api_key}"
-                urls[endpoint][symbol] = formatted_url
-            except Exception as e:
-                logging.error(f"Failed to format URL for {endpoint} and symbol {symbol}: {e}")
-                continue
-
-    return urls
-               
 
-def parse_to_dataframes(financial_data):
-    
     dataframes = {}
-    documents = financial_data.keys()
+    counts = stage_counts()
 
     # For each document type
-    for document in documents:
+    for document, payloads in financial_data.items():
+        records = []
+        symbols = []
 
-        # Process stocks format
-        if document == 'stock':
-            # For each symbol
-            for symbol_data in financial_data[document]:
-                
-                # Ensure expected stock format
+        # For each symbol
+        for symbol_data in payloads:
+
+            # Stocks are {'symbol': ..., 'historical': [...]}
+            if document == 'stock':
                 if 'historical' not in symbol_data or not isinstance(symbol_data['historical'], list):
                     logging.warning(f"Malformed stock data for {symbol_data.get('symbol', 'UNKNOWN')}; skipping.")
                     continue
-                
-                # Create dataframe and add symbol column
-                df = pd.DataFrame(symbol_data['historical'])
-                df['symbol'] = symbol_data['symbol']
-                df.insert(1, 'symbol', df.pop('symbol'))
-
-                # Change date column to datetime
-                if 'date' in df.columns:
-                    df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d')
-
-                # Add data. Create document key if it doesn't exist
-                if document not in dataframes:
-                    dataframes[document] = df
-                else:
-                    dataframes[document] = pd.concat([dataframes[document], df])
-        
-        # Process other documents format
-        else:
-            # For each symbol
-            for symbol_data in financial_data[document]:
-                
-                # Check for expected format
+                records.extend(symbol_data['historical'])
+                symbols.extend([symbol_data['symbol']] * len(symbol_data['historical']))
+
+            # Statements are lists of records that already include the symbol
+            else:
                 if not isinstance(symbol_data, list):
                     logging.warning(f"Expected list of records for {document}, got {type(symbol_data)}; skipping.")
                     continue
-                
-                # Create dataframe
-                df = pd.DataFrame(symbol_data)
+                records.extend(symbol_data)
+
+        counts['rows_in'] += len(payloads)
+        if not records:
+            continue
 
-                # Change date column to datetime
-                if 'date' in df.columns:
-                    df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d')
+        # Build the frame once and add symbol column for stocks
+        df = pd.DataFrame.from_records(records)
+        if document == 'stock':
+            df.insert(1, 'symbol', symbols)
+
+        # Change date column to datetime
+        if 'date' in df.columns:
+            df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d')
 
-                # Add data. Create document key if it doesn't exist
-                if document not in dataframes:
-                    dataframes[document] = df
-                else:
-                    dataframes[document] = pd.concat([dataframes[document], df])
+        dataframes[document] = df
+        counts['rows_out'] += len(df)
 
     return dataframes
 
 
+@staged('wide_format')
 def wide_format(dfs: dict) -> pd.DataFrame:
     """
     Takes in a dictionary of statements dataframes and converts them to wide format.
@@ -125,6 +74,9 @@ def wide_format(dfs: dict) -> pd.DataFrame:
     dfs: dictionary with keys income_statement, balance_sheet, and cashflow
     """
 
+    counts = stage_counts()
+    counts['rows_in'] = sum(len(dfs[name]) for name in ['income_statement', 'balance_sheet', 'cashflow'])
+
     # Merge all statements into a single DataFrame
     merged = pd.merge(
         dfs['income_statement'],
@@ -147,25 +99,84 @@ def wide_format(dfs: dict) -> pd.DataFrame:
     # Remove duplicate columns
     drop_columns = [col for col in merged.columns if col.endswith('_bs')]
     merged = merged.drop(columns=drop_columns)
+    counts['rows_out'] = len(merged)
 
     return merged
 
 
+def _tile_categorical(values, repeats: int) -> pd.Categorical:
+    """
+    Dictionary-encode values and repeat them end to end, without materializing the repeated strings.
+    """
+
+    categorical = pd.Categorical(values)
+    return pd.Categorical.from_codes(np.tile(categorical.codes, repeats), categories=categorical.categories)
+
+
+def _is_value_column(series: pd.Series) -> bool:
+    return pd.api.types.is_numeric_dtype(series) or series.isna().all()
+
+
+@staged('long_format')
 def long_format(dfs: dict) -> pd.DataFrame:
     """
     Takes in a dictionary of statement DataFrames and melts statements into long format.
+
+    The result is compact: symbol, metric, statement_type and any text fields
+    (e.g. finalLink) are categorical identifier columns, date is datetime64 and
+    value is float64. Rows are in the same order as DataFrame.melt.
     """
 
+    counts = stage_counts()
+    counts['rows_in'] = sum(len(df) for name, df in dfs.items() if name != 'stock')
+
     # Identify columns to keep as identifiers and columns to drop
     id_vars = ['date', 'symbol']
     drop_columns = ['link', 'reportedCurrency', 'cik', 'fillingDate', 'acceptedDate', 'calendarYear', 'period']
-    
-    # Melt each statement DataFrame
-    melted_frames = [
-    df.drop(columns=[c for c in drop_columns if c in df.columns])
-      .melt(id_vars=id_vars, var_name='metric', value_name='value')
-      .assign(statement_type=name)
-    for name, df in dfs.items() if name != 'stock'
-]
-
-    return pd.concat(melted_frames, ignore_index=True)
\ No newline at end of file
+
+    # Melt each statement DataFrame column by column from its numpy values
+    melted_frames = []
+    text_columns = []
+    for name, df in dfs.items():
+        if name == 'stock':
+            continue
+        df = df.drop(columns=[c for c in drop_columns if c in df.columns])
+        value_columns = [c for c in df.columns if c not in id_vars and _is_value_column(df[c])]
+        text_ids = [c for c in df.columns if c not in id_vars and c not in value_columns]
+        text_columns += [c for c in text_ids if c not in text_columns]
+
+        rows, repeats = len(df), len(value_columns)
+        melted = {
+            'date': np.tile(pd.to_datetime(df['date']).to_numpy(), repeats),
+            'symbol': _tile_categorical(df['symbol'], repeats),
+            'metric': pd.Categorical.from_codes(np.repeat(np.arange(repeats), rows), categories=value_columns),
+            'value': df[value_columns].to_numpy(dtype=float).ravel(order='F'),
+            'statement_type': pd.Categorical.from_codes(np.zeros(rows * repeats, dtype=np.int8), categories=[name]),
+        }
+        melted.update({col: _tile_categorical(df[col], repeats) for col in text_ids})
+        melted_frames.append(melted)
+
+    columns = id_vars + text_columns + ['metric', 'value', 'statement_type']
+    if not melted_frames:
+        return pd.DataFrame(columns=columns)
+
+    # Concatenate column by column, merging category dictionaries instead of falling
+    # back to object columns. Pieces are released as soon as their column is built.
+    # Symbol and text categories are sorted so they don't depend on statement order.
+    tidy = {}
+    for col in columns:
+        parts = []
+        for melted in melted_frames:
+            if col in melted:
+                parts.append(melted.pop(col))
+            else:
+                missing = np.full(len(melted['metric']), -1, dtype=np.int8)
+                parts.append(pd.Categorical.from_codes(missing, categories=pd.Index([], dtype=object)))
+        if col in ('date', 'value'):
+            tidy[col] = np.concatenate(parts)
+        else:
+            tidy[col] = union_categoricals(parts, sort_categories=col not in ('metric', 'statement_type'))
+    tidy = pd.DataFrame(tidy, columns=columns, copy=False)
+    counts['rows_out'] = len(tidy)
+    counts['bytes_out'] = int(tidy.memory_usage(index=False).sum())
+    return tidy
@@ -0,0 +1,7 @@
+import os
+import sys
+
+
+# The scripts import each other as flat modules, so tests do the same
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+sys.path.insert(0, SCRIPTS_DIR)
@@ -0,0 +1,96 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import pytest
+
+import fmp_client
+from fmp_client import batch_urls, url_symbols, split_batch, iter_fetch
+
+
+def stock_payload(symbol):
+    return {'symbol': symbol, 'historical': [{'date': '2024-01-02', 'close': 1.0}]}
+
+
+def test_split_batch_multi_symbol_response():
+    data = {'historicalStockList': [stock_payload('AAPL'), stock_payload('MSFT'), stock_payload('OTHER')]}
+    found = split_batch('stock', ['AAPL', 'MSFT', 'NVDA'], data)
+    # NVDA is missing from the response and OTHER wasn't asked for
+    assert list(found) == ['AAPL', 'MSFT']
+    assert found['AAPL'] == stock_payload('AAPL')
+
+
+def test_split_batch_single_symbol_layout():
+    assert split_batch('stock', ['AAPL', 'MSFT'], stock_payload('AAPL')) == {'AAPL': stock_payload('AAPL')}
+
+
+@pytest.mark.parametrize('data', [None, {}, [], {'historicalStockList': []}])
+def test_split_batch_empty(data):
+    assert split_batch('stock', ['AAPL'], data) == {}
+
+
+def test_batch_urls_groups_by_query():
+    base = "https://example.com/api/v3/historical-price-full/{}?from={}&apikey=x"
+    urls = {
+        'stock': {'AAPL': base.format('AAPL', '2024-01-01'), 'MSFT': base.format('MSFT', '2024-01-01'),
+                  'NVDA': base.format('NVDA', '2024-01-01'), 'IBM': base.format('IBM', '2023-01-01')},
+        'income_statement': {'AAPL': "https://example.com/api/v3/income-statement/AAPL?apikey=x"},
+    }
+    batched = batch_urls(urls, symbols_per_request=2)
+
+    assert list(batched['stock']) == ['AAPL,MSFT', 'NVDA', 'IBM']
+    assert batched['stock']['AAPL,MSFT'] == base.format('AAPL,MSFT', '2024-01-01')
+    assert batched['stock']['NVDA'] == urls['stock']['NVDA']
+    assert batched['income_statement'] == urls['income_statement']
+    assert url_symbols(batched['stock']) == ['AAPL', 'MSFT', 'NVDA', 'IBM']
+    assert batch_urls(urls, symbols_per_request=1) is urls
+
+
+@pytest.fixture
+def failing_batch_server():
+    """
+    Serves single-symbol stock responses and answers every multi-symbol request with a 503.
+    """
+
+    requested = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            symbols = urlsplit(self.path).path.rsplit('/', 1)[-1]
+            requested.append(symbols)
+            if ',' in symbols:
+                self.send_response(503)
+                self.end_headers()
+                return
+            body = json.dumps(stock_payload(symbols)).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}", requested
+    server.shutdown()
+    server.server_close()
+
+
+def test_exhausted_batch_is_requested_symbol_by_symbol(failing_batch_server, monkeypatch):
+    host, requested = failing_batch_server
+    monkeypatch.setattr(fmp_client, 'backoff_delay', lambda attempt, retry_after=None: 0.01)
+    symbols = ['AAPL', 'MSFT', 'NVDA']
+    urls = batch_urls({'stock': {symbol: f"{host}/api/v3/historical-price-full/{symbol}?apikey=x" for symbol in symbols}},
+                      symbols_per_request=3)
+
+    results = {symbol: data for _, symbol, data in iter_fetch(urls, concurrency=2, max_retries=2)}
+
+    assert results == {symbol: stock_payload(symbol) for symbol in symbols}
+    # The first try and two retries of the batch, then one request per symbol
+    assert requested.count('AAPL,MSFT,NVDA') == 3
+    assert sorted(symbol for symbol in requested if ',' not in symbol) == sorted(symbols)
@@ -0,0 +1,77 @@
+import pytest
+
+import metrics
+from metrics import stage, staged, stage_counts
+
+
+@pytest.fixture(autouse=True)
+def fresh_run():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def stages():
+    return {(entry['stage'], tuple(sorted(entry['labels'].items()))): entry for entry in metrics.report()['stages']}
+
+
+@staged('load', labels=['storage'], source='test')
+def load(rows, storage='json'):
+    counts = stage_counts()
+    counts['rows_in'] += rows
+    return rows
+
+
+def test_staged_labels_and_counters():
+    assert load(3) == 3
+    load(2, storage='gzip')
+    load(rows=4, storage='gzip')
+
+    recorded = stages()
+    assert recorded[('load', (('source', 'test'), ('storage', 'json')))]['rows_in'] == 3
+    gzip = recorded[('load', (('source', 'test'), ('storage', 'gzip')))]
+    assert (gzip['calls'], gzip['rows_in']) == (2, 6)
+
+
+def test_stage_counts_belong_to_the_innermost_stage():
+    with stage('outer') as outer:
+        load(5)
+        stage_counts()['rows_out'] += 1
+    assert outer['rows_out'] == 1 and outer['rows_in'] == 0
+
+    # Outside any stage, counters go nowhere
+    stage_counts()['rows_in'] += 1
+    assert set(stages()) == {('outer', ()), ('load', (('source', 'test'), ('storage', 'json')))}
+
+
+def test_staged_records_failed_calls():
+    @staged('fail')
+    def fail():
+        stage_counts()['rows_in'] = 1
+        raise ValueError
+
+    with pytest.raises(ValueError):
+        fail()
+    assert stages()[('fail', ())]['rows_in'] == 1
+
+
+MB = 2 ** 20
+
+
+def test_peak_rss_is_per_stage():
+    with stage('outer'):
+        with stage('allocate'):
+            block = b'x' * (200 * MB)
+            del block
+        with stage('small'):
+            block = b'x' * MB
+            del block
+
+    recorded = stages()
+    baseline = recorded[('small', ())]['peak_rss_bytes']
+    if baseline is None:
+        pytest.skip("per-stage peak RSS needs Linux with a writable /proc/self/clear_refs")
+    # The small stage doesn't inherit the earlier peak, but the stage around both sees it
+    assert recorded[('allocate', ())]['peak_rss_bytes'] >= baseline + 150 * MB
+    assert recorded[('outer', ())]['peak_rss_bytes'] >= recorded[('allocate', ())]['peak_rss_bytes']
+    assert metrics.report()['peak_rss_bytes'] >= recorded[('allocate', ())]['peak_rss_bytes']
@@ -0,0 +1,170 @@
+import gzip
+import os
+import sqlite3
+
+import pytest
+
+import FA_io
+import raw_manifest
+from FA_io import _write_object, save_raw_data, load_raw_data
+from raw_manifest import LATEST
+from synthetic import synthetic_payloads
+
+
+CONTENT = b'{"symbol": "AAPL", "historical": []}'
+
+
+def test_write_object_compresses(tmp_path):
+    filename = str(tmp_path / "objects" / "ab" / "abc.json.gz")
+    written = _write_object(filename, CONTENT)
+
+    assert written == os.path.getsize(filename) > 0
+    with gzip.open(filename, 'rb') as f:
+        assert f.read() == CONTENT
+
+
+def test_write_object_is_deterministic(tmp_path):
+    first, second = str(tmp_path / "first.json.gz"), str(tmp_path / "second.json.gz")
+    _write_object(first, CONTENT)
+    _write_object(second, CONTENT)
+
+    with open(first, 'rb') as f, open(second, 'rb') as g:
+        assert f.read() == g.read()
+
+
+def test_write_object_skips_stored_object(tmp_path):
+    filename = str(tmp_path / "abc.json.gz")
+    _write_object(filename, CONTENT)
+    stored = os.stat(filename)
+
+    assert _write_object(filename, CONTENT) == 0
+    assert os.stat(filename).st_mtime_ns == stored.st_mtime_ns
+
+
+def test_write_object_failure_leaves_no_file(tmp_path, monkeypatch):
+    filename = str(tmp_path / "abc.json.gz")
+
+    def fail(src, dst):
+        raise OSError("disk full")
+    monkeypatch.setattr(FA_io.os, 'replace', fail)
+
+    with pytest.raises(OSError):
+        _write_object(filename, CONTENT)
+    # Neither a partial object nor its temporary file is left behind
+    assert os.listdir(tmp_path) == []
+
+
+FOLDER = 'test'
+
+
+@pytest.fixture
+def raw_dir(tmp_path, monkeypatch):
+    """
+    data/raw/<FOLDER> under tmp_path, with the raw manifest in tmp_path too.
+    """
+
+    data_dir = str(tmp_path / "data")
+    monkeypatch.setattr(FA_io, 'DATA_DIR', data_dir)
+    monkeypatch.setattr(raw_manifest, 'DATA_DIR', data_dir)
+    connect = raw_manifest.connect
+    manifest = str(tmp_path / "manifest.sqlite")
+    monkeypatch.setattr(raw_manifest, 'connect', lambda path=None: connect(manifest))
+    return os.path.join(data_dir, "raw", FOLDER)
+
+
+def payloads(symbols, seed=0):
+    return synthetic_payloads(symbols, ['stock'], days=30, periods=4, seed=seed)
+
+
+def objects(raw_dir):
+    return sorted(os.path.relpath(os.path.join(root, filename), raw_dir)
+                  for root, _, filenames in os.walk(os.path.join(raw_dir, "objects")) for filename in filenames)
+
+
+def refs(raw_dir):
+    return sorted(filename for _, _, filenames in os.walk(os.path.join(raw_dir, "refs")) for filename in filenames)
+
+
+def manifest_paths():
+    return sorted(row['path'] for symbol in raw_manifest.latest_snapshots(FOLDER).values() for row in symbol.values())
+
+
+def test_gzip_round_trip(raw_dir):
+    symbols = ['AAPL', 'MSFT']
+    data = payloads(symbols)
+    save_raw_data(data, symbols, ['stock'], FOLDER, storage='gzip')
+
+    expected = {'stock': [data['stock'][symbol] for symbol in symbols]}
+    assert load_raw_data(symbols, ['stock'], FOLDER, storage='gzip') == expected
+    assert load_raw_data(symbols, ['stock'], FOLDER, timestamp=LATEST, storage='gzip') == expected
+    assert len(objects(raw_dir)) == 2
+
+
+def test_unchanged_payload_is_stored_once(raw_dir):
+    data = payloads(['AAPL'])
+    save_raw_data(data, ['AAPL'], ['stock'], FOLDER, timestamp='20250101_000000', storage='gzip')
+    save_raw_data(data, ['AAPL'], ['stock'], FOLDER, timestamp='20250102_000000', storage='gzip')
+
+    assert len(objects(raw_dir)) == 1
+    assert refs(raw_dir) == ['AAPL_stock_20250101_000000.ref.json', 'AAPL_stock_20250102_000000.ref.json']
+    assert load_raw_data(['AAPL'], ['stock'], FOLDER, timestamp='20250101_000000', storage='gzip') == {'stock': [data['stock']['AAPL']]}
+
+
+def test_overwrite_deletes_replaced_object(raw_dir):
+    symbols = ['AAPL', 'MSFT']
+    save_raw_data(payloads(symbols), symbols, ['stock'], FOLDER, storage='gzip')
+    before = objects(raw_dir)
+
+    # Only AAPL changes, so only its old object is left unreferenced
+    changed = payloads(['AAPL'], seed=1)
+    save_raw_data(changed, ['AAPL'], ['stock'], FOLDER, storage='gzip')
+    after = objects(raw_dir)
+
+    assert len(after) == 2
+    assert len(set(before) - set(after)) == 1
+    assert after == manifest_paths()
+    assert load_raw_data(['AAPL'], ['stock'], FOLDER, storage='gzip') == {'stock': [changed['stock']['AAPL']]}
+
+
+@pytest.mark.parametrize('kept_by', ['ref', 'manifest'])
+def test_overwrite_keeps_object_still_referenced(raw_dir, kept_by):
+    original = payloads(['AAPL'])
+    save_raw_data(original, ['AAPL'], ['stock'], FOLDER, timestamp='20250101_000000', storage='gzip')
+    save_raw_data(original, ['AAPL'], ['stock'], FOLDER, storage='gzip')
+    shared = objects(raw_dir)
+
+    # Leave only one of the timestamped snapshot's ref file and manifest row
+    if kept_by == 'ref':
+        raw_manifest.forget(FOLDER)
+    else:
+        os.remove(os.path.join(raw_dir, "refs", "AAPL", "AAPL_stock_20250101_000000.ref.json"))
+    save_raw_data(payloads(['AAPL'], seed=1), ['AAPL'], ['stock'], FOLDER, storage='gzip')
+
+    assert set(shared) < set(objects(raw_dir))
+    assert len(objects(raw_dir)) == 2
+
+
+def test_manifest_failure_keeps_objects(raw_dir, monkeypatch):
+    save_raw_data(payloads(['AAPL']), ['AAPL'], ['stock'], FOLDER, storage='gzip')
+    before = objects(raw_dir)
+
+    def fail(*args, **kwargs):
+        raise sqlite3.OperationalError("database is locked")
+    monkeypatch.setattr(FA_io, 'record_snapshots', fail)
+    changed = payloads(['AAPL'], seed=1)
+    save_raw_data(changed, ['AAPL'], ['stock'], FOLDER, storage='gzip')
+
+    # The stale manifest row still names the old object, so it must survive
+    assert set(before) < set(objects(raw_dir))
+    raw_manifest.rebuild(FOLDER)
+    assert load_raw_data(['AAPL'], ['stock'], FOLDER, timestamp=LATEST, storage='gzip') == {'stock': [changed['stock']['AAPL']]}
+
+
+def test_prune_deletes_unreferenced_objects(raw_dir):
+    save_raw_data(payloads(['AAPL']), ['AAPL'], ['stock'], FOLDER, storage='gzip')
+    kept = objects(raw_dir)
+    orphan = os.path.join(raw_dir, "objects", "00", "00.json.gz")
+    FA_io._write_object(orphan, CONTENT)
+
+    assert raw_manifest.prune(FOLDER) == (1, len(gzip.compress(CONTENT, mtime=0)))
+    assert objects(raw_dir) == kept
@@ -0,0 +1,23 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from conftest import SCRIPTS_DIR
+from benchmark import ENTRY_POINTS, HEAVY_MODULES, IMPORT_BUDGET, time_import
+
+
+@pytest.mark.parametrize('module', ENTRY_POINTS)
+def test_entry_point_defers_heavy_imports(module):
+    # A fresh interpreter, so modules imported by this test process don't count
+    code = f"import json, sys, {module}; print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=SCRIPTS_DIR, capture_output=True, text=True, check=True)
+    assert json.loads(result.stdout.splitlines()[-1]) == []
+
+
+@pytest.mark.parametrize('module', ENTRY_POINTS)
+def test_entry_point_import_budget(module):
+    # Best of several runs, so one slow start on a busy machine doesn't fail the suite
+    seconds, _ = time_import(module, repeat=5)
+    assert seconds <= IMPORT_BUDGET, f"import {module} took {seconds:.3f}s, over the {IMPORT_BUDGET:.3f}s budget"
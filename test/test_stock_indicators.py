@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from synthetic import synthetic_financial_data
+from utils import parse_to_dataframes
+from stock_indicators import compute_stock_indicators, STOCK_INDICATORS, SMA_WINDOWS, VOLATILITY_WINDOW
+
+
+@pytest.fixture(scope='module')
+def stocks():
+    raw = synthetic_financial_data(4, documents=['stock'], days=300)
+    stocks = parse_to_dataframes(raw)['stock'][['date', 'symbol', 'close']]
+    return stocks.assign(date=pd.to_datetime(stocks['date'])).sort_values(['symbol', 'date']).reset_index(drop=True)
+
+
+def indexed(tidy):
+    return tidy.set_index(['symbol', 'date', 'metric'])['value'].sort_index()
+
+
+def assert_same(actual, expected):
+    assert actual.index.equals(expected.index)
+    assert np.allclose(actual.to_numpy(), expected.to_numpy())
+
+
+@pytest.mark.parametrize('split', [1, 19, 21, 150, 299])
+def test_incremental_matches_full_recompute(stocks, split):
+    full, full_state = compute_stock_indicators(stocks)
+
+    dates = np.sort(stocks['date'].unique())
+    first, state = compute_stock_indicators(stocks[stocks['date'] < dates[split]])
+    # The second run sees the whole history again, as a re-read of the raw files would
+    second, state = compute_stock_indicators(stocks, state)
+
+    assert_same(indexed(pd.concat([first, second])), indexed(full))
+    pd.testing.assert_frame_equal(state, full_state)
+
+
+def test_no_new_bars(stocks):
+    _, state = compute_stock_indicators(stocks)
+    tidy, tail = compute_stock_indicators(stocks, state)
+
+    assert tidy.empty
+    assert tail.empty
+
+
+def test_new_symbol_is_computed_from_scratch(stocks):
+    symbols = list(stocks['symbol'].unique())
+    _, state = compute_stock_indicators(stocks[stocks['symbol'] != symbols[-1]])
+    tidy, _ = compute_stock_indicators(stocks, state)
+
+    assert set(tidy['symbol']) == {symbols[-1]}
+    assert_same(indexed(tidy), indexed(compute_stock_indicators(stocks[stocks['symbol'] == symbols[-1]])[0]))
+
+
+def test_matches_rolling_per_symbol(stocks):
+    tidy, _ = compute_stock_indicators(stocks)
+    wide = tidy.pivot_table(index=['symbol', 'date'], columns='metric', values='value')
+    assert set(wide.columns) == set(STOCK_INDICATORS)
+
+    for symbol, bars in stocks.groupby('symbol'):
+        close = bars.set_index('date')['close'].astype(float)
+        returns = close.pct_change()
+        expected = {f"sma_{window}": close.rolling(window).mean() for window in SMA_WINDOWS}
+        expected[f"volatility_{VOLATILITY_WINDOW}"] = returns.rolling(VOLATILITY_WINDOW).std()
+        expected['drawdown'] = close / close.cummax() - 1
+        expected['return_1d'] = returns
+
+        for metric, values in expected.items():
+            assert_same(wide.loc[symbol, metric].dropna(), values.dropna())